@@ -0,0 +1,797 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Local stand-in of Nutanix Prism API used by the installer.
+
+Simulator keeps vms, tasks, images, networks and storage containers in memory.
+Tasks finish after configured time, powered on vms get ip after configured
+delay, and requests can be delayed or rejected (429/503) to measure how the
+installer behaves. Large responses are gzip compressed when client accepts it.
+Every request is counted per endpoint together with bytes of request and
+response bodies as sent over the wire.
+
+Run standalone: python benchmarks/prism_simulator.py --port 9440
+and use `scheme: http` in Nutanix cluster configuration.
+
+"""
+import argparse
+import BaseHTTPServer
+import hashlib
+import json
+import random
+import re
+import SocketServer
+import threading
+import time
+import urlparse
+import uuid
+import zlib
+
+DEFAULT_SETTINGS = {
+    # Seconds added to every API response.
+    'latency': 0.005,
+    # Seconds of vm creation, power state change and image import tasks.
+    'task_duration': 0.5,
+    'image_duration': 1.0,
+    # Seconds added to clone task duration for every cloned vm.
+    'clone_duration_per_vm': 0.01,
+    # Seconds from powering vm on to assigning its ip.
+    'ip_delay': 1.0,
+    # Seconds after which vm booted with cloud-init power_state powers itself off.
+    'poweroff_delay': 2.0,
+    # Fractions of API calls rejected with 503 / 429 and of failed tasks.
+    'error_rate': 0.0,
+    'throttle_rate': 0.0,
+    'task_failure_rate': 0.0,
+    # Prism versions before tasks/poll endpoint answer it with 404.
+    'long_poll': True,
+    # Clone tasks report per vm subtasks, finishing one after another.
+    'subtasks': True,
+    # Responses of at least this many bytes are compressed if client accepts gzip.
+    'gzip_min_size': 1024,
+    # GET responses carry ETag and matching If-None-Match is answered with 304.
+    'etags': True,
+    'username': 'admin',
+    'password': 'admin',
+    'networks': ['external(vlan.0)'],
+    'storage_containers': ['images']
+}
+
+API_PREFIX = '/PrismGateway/services/rest/'
+LOGIN_PATH = '/PrismGateway/j_spring_security_check'
+IMAGE_FILES_PREFIX = '/images/'
+IMAGE_CONTENT = 'simulated os image\n' * 1024
+SESSION_COOKIE = 'JSESSIONID'
+
+
+def _usecs(timestamp):
+    """Convert time to Prism microseconds.
+
+    :param float timestamp: Time in seconds.
+    :return: Time in microseconds.
+    :rtype: int
+
+    """
+    return int(timestamp * 10 ** 6)
+
+
+def filter_entities(entities, query, fields=None):
+    """Apply filter of listing query. Only 'field==value' expressions are
+    supported, value is matched as regular expression like Prism does,
+    other expressions are ignored.
+
+    :param list entities: Listed entities.
+    :param dict query: Query of the request.
+    :param dict fields: Names of entity keys by filter field names if they differ.
+    :return: Entities matching the filter.
+    :rtype: list
+
+    """
+    field, operator, value = query.get('filter', '').partition('==')
+    if not operator:
+        return entities
+    key = (fields or {}).get(field, field)
+    pattern = re.compile('(?:{})$'.format(value))
+    return [entity for entity in entities if pattern.match(entity.get(key) or '')]
+
+
+class PrismState(object):
+    """In-memory state of simulated Nutanix cluster."""
+
+    def __init__(self, settings):
+        """Prepare cluster with configured networks and storage containers.
+
+        :param dict settings: Simulator settings, see DEFAULT_SETTINGS.
+
+        """
+        self.settings = settings
+        self.lock = threading.RLock()
+        self.sessions = set()
+        self.vms = {}
+        self.tasks = {}
+        self.images = {}
+        self.networks = [
+            {'uuid': str(uuid.uuid4()), 'name': name, 'vlan_id': number}
+            for number, name in enumerate(settings['networks'])
+        ]
+        self.storage_containers = [
+            {'storage_container_uuid': str(uuid.uuid4()), 'name': name}
+            for name in settings['storage_containers']
+        ]
+        self.ip_counter = 0
+        self.stats = {'requests': {}, 'bytes_in': 0, 'bytes_out': 0, 'rejected': 0}
+
+    def count(self, route, bytes_in, bytes_out):
+        """Record served request.
+
+        :param str route: Method and endpoint template e.g. 'GET v2.0/vms'.
+        :param int bytes_in: Size of request body.
+        :param int bytes_out: Size of response body.
+        :return: None
+
+        """
+        with self.lock:
+            self.stats['requests'][route] = self.stats['requests'].get(route, 0) + 1
+            self.stats['bytes_in'] += bytes_in
+            self.stats['bytes_out'] += bytes_out
+
+    def add_task(self, operation_type, duration, effect, entity_uuid=None, subtask_uuids=()):
+        """Start task applying effect to the state when it finishes.
+
+        :param str operation_type: Prism operation type e.g. 'kVmClone'.
+        :param float duration: Seconds after which task finishes.
+        :param callable effect: Function applied to the state on success.
+        :param str entity_uuid: Uuid of entity task works on.
+        :param list subtask_uuids: Uuids of subtasks, reported in 'subtask_uuid_list'.
+        :return: Uuid of the task.
+        :rtype: str
+
+        """
+        now = time.time()
+        task = {
+            'uuid': str(uuid.uuid4()),
+            'operation_type': operation_type,
+            'progress_status': 'Running',
+            'percentage_complete': 0,
+            'create_time_usecs': _usecs(now),
+            'start_time_usecs': _usecs(now),
+            'entity_list': [{'entity_id': entity_uuid, 'entity_type': 'VM'}] if entity_uuid else [],
+            'subtask_uuid_list': list(subtask_uuids),
+            '_complete_at': now + duration,
+            '_effect': effect
+        }
+        with self.lock:
+            self.tasks[task['uuid']] = task
+        return task['uuid']
+
+    def task_info(self, task_uuid):
+        """Get task details, finishing the task if its time passed.
+
+        :param str task_uuid: Uuid of the task.
+        :return: Task details or None if task does not exist.
+        :rtype: dict
+
+        """
+        with self.lock:
+            task = self.tasks.get(task_uuid)
+            if task is None:
+                return None
+            now = time.time()
+            if task['progress_status'] == 'Running':
+                if now >= task['_complete_at']:
+                    if random.random() < self.settings['task_failure_rate']:
+                        task['progress_status'] = 'Failed'
+                        task['message'] = 'Simulated failure'
+                    else:
+                        task['_effect']()
+                        task['progress_status'] = 'Succeeded'
+                        task['percentage_complete'] = 100
+                    task['complete_time_usecs'] = _usecs(task['_complete_at'])
+                else:
+                    started = task['start_time_usecs'] / 10.0 ** 6
+                    task['percentage_complete'] = int(
+                        99 * (now - started) / max(task['_complete_at'] - started, 0.001)
+                    )
+            return {key: value for key, value in task.items() if not key.startswith('_')}
+
+    def add_vm(self, name, memory_mb, num_vcpus, network_uuids, userdata=None, vm_uuid=None):
+        """Create powered off vm.
+
+        :param str name: Name of vm.
+        :param int memory_mb: Size of RAM.
+        :param int num_vcpus: Number of vCPUs.
+        :param list network_uuids: Uuids of networks of vm nics.
+        :param str userdata: Cloud config of vm.
+        :param str vm_uuid: Uuid of vm, random if not given.
+        :return: Uuid of the vm.
+        :rtype: str
+
+        """
+        vm = {
+            'uuid': vm_uuid or str(uuid.uuid4()),
+            'name': name,
+            'memory_mb': memory_mb,
+            'num_vcpus': num_vcpus,
+            'description': '',
+            'power_state': 'off',
+            'network_uuids': list(network_uuids),
+            'ips': [],
+            'powered_on_at': None,
+            # Cloud-init power_state module powers vm off after the first boot.
+            'powers_off': bool(userdata and 'power_state:' in userdata)
+        }
+        with self.lock:
+            self.vms[vm['uuid']] = vm
+        return vm['uuid']
+
+    def set_power(self, vm_uuid, state):
+        """Change power state of vm.
+
+        :param str vm_uuid: Uuid of vm.
+        :param str state: 'on' or 'off'.
+        :return: None
+
+        """
+        with self.lock:
+            vm = self.vms[vm_uuid]
+            vm['power_state'] = state
+            vm['powered_on_at'] = time.time() if state == 'on' else None
+            vm['ips'] = []
+
+    def vm(self, vm_uuid):
+        """Get vm, updating its time dependent state (ip, power).
+
+        :param str vm_uuid: Uuid of vm.
+        :return: Internal vm record or None if vm does not exist.
+        :rtype: dict
+
+        """
+        with self.lock:
+            vm = self.vms.get(vm_uuid)
+            if vm is None or vm['power_state'] != 'on':
+                return vm
+            uptime = time.time() - vm['powered_on_at']
+            if vm['powers_off'] and uptime >= self.settings['poweroff_delay']:
+                vm['powers_off'] = False
+                self.set_power(vm_uuid, 'off')
+            elif not vm['ips'] and uptime >= self.settings['ip_delay']:
+                self.ip_counter += 1
+                vm['ips'] = ['10.{}.{}.{}'.format(
+                    self.ip_counter // 65536 % 256, self.ip_counter // 256 % 256,
+                    self.ip_counter % 256
+                )]
+            return vm
+
+    def all_vms(self):
+        """Get all vms sorted by name.
+
+        :return: List of internal vm records.
+        :rtype: list
+
+        """
+        with self.lock:
+            return sorted(
+                (self.vm(vm_uuid) for vm_uuid in list(self.vms)), key=lambda vm: vm['name']
+            )
+
+    @staticmethod
+    def vm_v1(vm):
+        """Represent vm as Prism v1 API does.
+
+        :param dict vm: Internal vm record.
+        :return: Vm details.
+        :rtype: dict
+
+        """
+        return {
+            'uuid': vm['uuid'],
+            'vmName': vm['name'],
+            'powerState': vm['power_state'],
+            'ipAddresses': list(vm['ips']),
+            'memoryCapacityInBytes': vm['memory_mb'] * 1024 ** 2,
+            'numVCpus': vm['num_vcpus']
+        }
+
+    @staticmethod
+    def vm_v2(vm, include_nics=True):
+        """Represent vm as Prism v2 API does.
+
+        :param dict vm: Internal vm record.
+        :param bool include_nics: Include nic config.
+        :return: Vm details.
+        :rtype: dict
+
+        """
+        details = {
+            'uuid': vm['uuid'],
+            'name': vm['name'],
+            'description': vm['description'],
+            'memory_mb': vm['memory_mb'],
+            'num_vcpus': vm['num_vcpus'],
+            'num_cores_per_vcpu': 1,
+            'power_state': vm['power_state']
+        }
+        if not include_nics:
+            return details
+
+        nics = []
+        for number, network_uuid in enumerate(vm['network_uuids']):
+            nic = {
+                'network_uuid': network_uuid,
+                'mac_address': '50:6b:8d:{}:{}:{:02x}'.format(
+                    vm['uuid'][:2], vm['uuid'][2:4], number
+                ),
+                'is_connected': True
+            }
+            if vm['ips']:
+                nic['ip_address'] = vm['ips'][0]
+            nics.append(nic)
+        details['vm_nics'] = nics
+        return details
+
+
+class PrismHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Handler of simulated Prism endpoints."""
+    protocol_version = 'HTTP/1.1'
+    # (method, path pattern relative to API prefix, handler method name, endpoint template)
+    ROUTES = (
+        ('GET', r'v1/cluster$', 'get_cluster', 'v1/cluster'),
+        ('GET', r'v1/vms/?$', 'get_vms_v1', 'v1/vms'),
+        ('GET', r'v1/vms/(?P<entity_uuid>[^/]+)$', 'get_vm_v1', 'v1/vms/{uuid}'),
+        ('GET', r'v2\.0/vms/?$', 'get_vms_v2', 'v2.0/vms'),
+        ('POST', r'v2\.0/vms/?$', 'create_vm', 'v2.0/vms'),
+        ('POST', r'v2\.0/vms/(?P<entity_uuid>[^/]+)/clone$', 'clone_vm', 'v2.0/vms/{uuid}/clone'),
+        ('POST', r'v2\.0/vms/(?P<entity_uuid>[^/]+)/set_power_state$', 'set_power_state',
+         'v2.0/vms/{uuid}/set_power_state'),
+        ('POST', r'v2\.0/tasks/poll$', 'poll_tasks', 'v2.0/tasks/poll'),
+        ('GET', r'v2\.0/tasks/(?P<entity_uuid>[^/]+)$', 'get_task', 'v2.0/tasks/{uuid}'),
+        ('GET', r'v2\.0/networks/?$', 'get_networks', 'v2.0/networks'),
+        ('GET', r'v2\.0/images/?$', 'get_images', 'v2.0/images'),
+        ('POST', r'v2\.0/images/?$', 'create_image', 'v2.0/images'),
+        ('GET', r'v2\.0/storage_containers/?$', 'get_storage_containers',
+         'v2.0/storage_containers'),
+    )
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Silence default logging of every request."""
+        pass
+
+    @property
+    def state(self):
+        """State of simulated cluster shared by all handlers.
+
+        :rtype: PrismState
+
+        """
+        return self.server.state
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handle GET request."""
+        self.__handle('GET')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Handle POST request."""
+        self.__handle('POST')
+
+    def do_HEAD(self):  # pylint: disable=invalid-name
+        """Handle HEAD request (only image files support it)."""
+        self.__handle('HEAD')
+
+    def __handle(self, method):
+        """Route request to its handler and send the response.
+
+        :param str method: HTTP method.
+        :return: None
+
+        """
+        url = urlparse.urlparse(self.path)
+        query = dict((key, values[0]) for key, values in urlparse.parse_qs(url.query).items())
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        if url.path.startswith(IMAGE_FILES_PREFIX):
+            self.__serve_image_file(method, url.path[len(IMAGE_FILES_PREFIX):])
+            return
+
+        if method == 'POST' and url.path == LOGIN_PATH:
+            self.__login(body)
+            return
+
+        if not url.path.startswith(API_PREFIX):
+            self.__send(404, {'message': 'Not found'}, 'unknown', body)
+            return
+
+        path = url.path[len(API_PREFIX):]
+        for route_method, pattern, handler_name, template in self.ROUTES:
+            match = re.match(pattern, path)
+            if route_method != method or not match:
+                continue
+            route = '{} {}'.format(method, template)
+            time.sleep(self.state.settings['latency'])
+            if not self.__authorized():
+                self.__send(401, {'message': 'Unauthorized'}, route, body)
+                return
+            rejected = self.__rejection()
+            if rejected:
+                self.__send(rejected, {'message': 'Try again later'}, route, body,
+                            headers={'Retry-After': '0'})
+                return
+            data = json.loads(body) if body else None
+            status, response = getattr(self, handler_name)(query, data, **match.groupdict())
+            self.__send(status, response, route, body)
+            return
+
+        self.__send(404, {'message': 'Not found'}, 'unknown', body)
+
+    def __authorized(self):
+        """Check whether request carries valid session cookie.
+
+        :return: True if session is valid.
+        :rtype: bool
+
+        """
+        for cookie in (self.headers.get('Cookie') or '').split(';'):
+            name, _, value = cookie.strip().partition('=')
+            if name == SESSION_COOKIE and value in self.state.sessions:
+                return True
+        return False
+
+    def __rejection(self):
+        """Decide whether to reject request to simulate overloaded Prism.
+
+        :return: HTTP status of rejection or None.
+        :rtype: int
+
+        """
+        chance = random.random()
+        if chance < self.state.settings['error_rate']:
+            self.state.stats['rejected'] += 1
+            return 503
+        if chance < self.state.settings['error_rate'] + self.state.settings['throttle_rate']:
+            self.state.stats['rejected'] += 1
+            return 429
+        return None
+
+    def __login(self, body):
+        """Check credentials from login form and start session.
+
+        :param str body: Urlencoded login form.
+        :return: None
+
+        """
+        form = dict((key, values[0]) for key, values in urlparse.parse_qs(body).items())
+        if form.get('j_username') != self.state.settings['username'] or \
+                form.get('j_password') != self.state.settings['password']:
+            self.__send(401, {'message': 'Invalid credentials'}, 'POST login', body)
+            return
+        session = uuid.uuid4().hex
+        self.state.sessions.add(session)
+        self.__send(200, {}, 'POST login', body, headers={
+            'Set-Cookie': '{}={}; Path=/'.format(SESSION_COOKIE, session)
+        })
+
+    def __serve_image_file(self, method, name):
+        """Serve OS image and its checksum file for image digests.
+
+        :param str method: HTTP method.
+        :param str name: Name of requested file.
+        :return: None
+
+        """
+        if name == 'sha256sum.txt':
+            content = '{}  centos.qcow2\n'.format(hashlib.sha256(IMAGE_CONTENT).hexdigest())
+        elif name == 'centos.qcow2':
+            content = IMAGE_CONTENT
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('ETag', '"{}"'.format(hashlib.md5(content).hexdigest()))
+        self.end_headers()
+        if method != 'HEAD':
+            self.wfile.write(content)
+
+    def __send(self, status, data, route, request_body, headers=None):
+        """Send JSON response and count the request.
+
+        :param int status: HTTP status.
+        :param dict data: Response data.
+        :param str route: Endpoint template used in statistics.
+        :param str request_body: Body of the request.
+        :param dict headers: Additional response headers.
+        :return: None
+
+        """
+        body = json.dumps(data, sort_keys=True)
+        headers = dict(headers or {})
+        if self.command == 'GET' and status == 200 and self.state.settings['etags']:
+            headers['ETag'] = '"{}"'.format(hashlib.md5(body).hexdigest())
+            if self.headers.get('If-None-Match') == headers['ETag']:
+                self.state.count(route, len(request_body), 0)
+                self.send_response(304)
+                self.send_header('ETag', headers['ETag'])
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        compressed = len(body) >= self.state.settings['gzip_min_size'] and \
+            'gzip' in (self.headers.get('Accept-Encoding') or '')
+        if compressed:
+            # wbits 31 produces gzip container instead of raw zlib stream.
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+            body = compressor.compress(body) + compressor.flush()
+        self.state.count(route, len(request_body), len(body))
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if compressed:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def get_cluster(self, query, data):  # pylint: disable=unused-argument
+        """GET v1/cluster"""
+        return 200, {'name': 'simulator', 'version': '5.1', 'numNodes': 4}
+
+    def get_vms_v1(self, query, data):  # pylint: disable=unused-argument
+        """GET v1/vms?searchString="""
+        search = query.get('searchString', '').lower()
+        entities = [
+            self.state.vm_v1(vm) for vm in self.state.all_vms() if search in vm['name'].lower()
+        ]
+        return 200, {'metadata': {'count': len(entities)}, 'entities': entities}
+
+    def get_vm_v1(self, query, data, entity_uuid):  # pylint: disable=unused-argument
+        """GET v1/vms/{uuid}"""
+        vm = self.state.vm(entity_uuid)
+        if vm is None:
+            return 404, {'message': 'Vm {} does not exist'.format(entity_uuid)}
+        return 200, self.state.vm_v1(vm)
+
+    def get_vms_v2(self, query, data):  # pylint: disable=unused-argument
+        """GET v2.0/vms?offset=&length=&filter=vm_name==&include_vm_nic_config="""
+        all_vms = self.state.all_vms()
+        vms = filter_entities(all_vms, query, {'vm_name': 'name'})
+        offset = int(query.get('offset', 0))
+        length = int(query.get('length', len(vms)))
+        include_nics = query.get('include_vm_nic_config') == 'true'
+        return 200, {
+            'metadata': {'grand_total_entities': len(all_vms), 'total_entities': len(vms),
+                         'count': len(vms[offset:offset + length])},
+            'entities': [
+                self.state.vm_v2(vm, include_nics) for vm in vms[offset:offset + length]
+            ]
+        }
+
+    def create_vm(self, query, data):  # pylint: disable=unused-argument
+        """POST v2.0/vms"""
+        def effect():
+            self.state.add_vm(
+                data['name'], data['memory_mb'], data['num_vcpus'],
+                [nic['network_uuid'] for nic in data.get('vm_nics', [])],
+                (data.get('vm_customization_config') or {}).get('userdata')
+            )
+        return 201, {'task_uuid': self.state.add_task(
+            'kVmCreate', self.state.settings['task_duration'], effect
+        )}
+
+    def clone_vm(self, query, data, entity_uuid):  # pylint: disable=unused-argument
+        """POST v2.0/vms/{uuid}/clone"""
+        source = self.state.vm(entity_uuid)
+        if source is None:
+            return 404, {'message': 'Vm {} does not exist'.format(entity_uuid)}
+
+        def create(spec, vm_uuid=None):
+            return lambda: self.state.add_vm(
+                spec['name'], spec.get('memory_mb', source['memory_mb']),
+                spec.get('num_vcpus', source['num_vcpus']), source['network_uuids'],
+                vm_uuid=vm_uuid
+            )
+
+        settings = self.state.settings
+        duration = settings['task_duration'] + \
+            settings['clone_duration_per_vm'] * len(data['spec_list'])
+        if not settings['subtasks']:
+            def effect():
+                for spec in data['spec_list']:
+                    create(spec)()
+            return 201, {'task_uuid': self.state.add_task('kVmClone', duration, effect, entity_uuid)}
+
+        # Every vm is created by own subtask, parent finishes with the last one.
+        subtask_uuids = []
+        for number, spec in enumerate(data['spec_list'], 1):
+            vm_uuid = str(uuid.uuid4())
+            subtask_uuids.append(self.state.add_task(
+                'kVmCreate',
+                settings['task_duration'] + settings['clone_duration_per_vm'] * number,
+                create(spec, vm_uuid), vm_uuid
+            ))
+
+        def finish_subtasks():
+            for subtask_uuid in subtask_uuids:
+                self.state.task_info(subtask_uuid)
+        return 201, {'task_uuid': self.state.add_task(
+            'kVmClone', duration, finish_subtasks, entity_uuid, subtask_uuids
+        )}
+
+    def set_power_state(self, query, data, entity_uuid):  # pylint: disable=unused-argument
+        """POST v2.0/vms/{uuid}/set_power_state"""
+        if self.state.vm(entity_uuid) is None:
+            return 404, {'message': 'Vm {} does not exist'.format(entity_uuid)}
+        return 201, {'task_uuid': self.state.add_task(
+            'kVmSetPowerState', self.state.settings['task_duration'],
+            lambda: self.state.set_power(entity_uuid, data['transition'].lower()), entity_uuid
+        )}
+
+    def poll_tasks(self, query, data):  # pylint: disable=unused-argument
+        """POST v2.0/tasks/poll, held until any of tasks finishes or timeout."""
+        if not self.state.settings['long_poll']:
+            return 404, {'message': 'Not found'}
+        deadline = time.time() + data.get('timeout_interval', 30)
+        while True:
+            finished = [
+                task for task in (
+                    self.state.task_info(task_uuid) for task_uuid in data['completed_tasks']
+                ) if task and task['progress_status'] != 'Running'
+            ]
+            if finished or time.time() >= deadline:
+                return 201, {'completed_tasks_info': finished, 'is_timeout': not finished}
+            time.sleep(0.02)
+
+    def get_task(self, query, data, entity_uuid):  # pylint: disable=unused-argument
+        """GET v2.0/tasks/{uuid}"""
+        task = self.state.task_info(entity_uuid)
+        if task is None:
+            return 404, {'message': 'Task {} does not exist'.format(entity_uuid)}
+        return 200, task
+
+    def get_networks(self, query, data):  # pylint: disable=unused-argument
+        """GET v2.0/networks?filter=name=="""
+        return 200, {'entities': filter_entities(self.state.networks, query)}
+
+    def get_images(self, query, data):  # pylint: disable=unused-argument
+        """GET v2.0/images?filter=name=="""
+        with self.state.lock:
+            images = sorted(self.state.images.values(), key=lambda image: image['name'])
+        return 200, {'entities': filter_entities(images, query)}
+
+    def create_image(self, query, data):  # pylint: disable=unused-argument
+        """POST v2.0/images"""
+        def effect():
+            image = {
+                'uuid': str(uuid.uuid4()),
+                'name': data['name'],
+                'annotation': data.get('annotation', ''),
+                'image_type': data.get('image_type'),
+                'vm_disk_id': str(uuid.uuid4()),
+                'image_state': 'ACTIVE'
+            }
+            self.state.images[image['uuid']] = image
+        return 201, {'task_uuid': self.state.add_task(
+            'kImageCreate', self.state.settings['image_duration'], effect
+        )}
+
+    def get_storage_containers(self, query, data):  # pylint: disable=unused-argument
+        """GET v2.0/storage_containers?search_string="""
+        search = query.get('search_string', '')
+        return 200, {'entities': [
+            container for container in self.state.storage_containers
+            if search in container['name']
+        ]}
+
+
+class _ThreadingServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """HTTP server handling every connection in its own thread."""
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class PrismSimulator(object):
+    """Simulated Prism served from background thread."""
+
+    def __init__(self, port=0, **settings):
+        """Prepare simulator.
+
+        :param int port: Port to listen on, any free port if 0.
+        :param settings: Overrides of DEFAULT_SETTINGS.
+
+        """
+        unknown = set(settings) - set(DEFAULT_SETTINGS)
+        if unknown:
+            raise ValueError('Unknown simulator settings {}'.format(sorted(unknown)))
+        merged = dict(DEFAULT_SETTINGS)
+        merged.update(settings)
+        self.state = PrismState(merged)
+        self.server = _ThreadingServer(('127.0.0.1', port), PrismHandler)
+        self.server.state = self.state
+        self.thread = None
+
+    @property
+    def port(self):
+        """Port simulator listens on.
+
+        :rtype: int
+
+        """
+        return self.server.server_address[1]
+
+    @property
+    def image_url(self):
+        """Url of simulated OS image.
+
+        :rtype: str
+
+        """
+        return 'http://127.0.0.1:{}{}centos.qcow2'.format(self.port, IMAGE_FILES_PREFIX)
+
+    def start(self):
+        """Start serving in background thread.
+
+        :return: Self, for use as context manager.
+        :rtype: PrismSimulator
+
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving.
+
+        :return: None
+
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    """Serve simulated Prism until interrupted.
+
+    :return: None
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=9440)
+    for name, value in sorted(DEFAULT_SETTINGS.items()):
+        if isinstance(value, float):
+            parser.add_argument('--{}'.format(name.replace('_', '-')), type=float, default=value)
+    args = parser.parse_args()
+
+    settings = dict(
+        (name, getattr(args, name)) for name, value in DEFAULT_SETTINGS.items()
+        if isinstance(value, float)
+    )
+    simulator = PrismSimulator(args.port, **settings)
+    print('Simulated Prism listening on http://127.0.0.1:{} (credentials {}/{})'.format(
+        simulator.port, DEFAULT_SETTINGS['username'], DEFAULT_SETTINGS['password']
+    ))
+    try:
+        simulator.server.serve_forever()
+    except KeyboardInterrupt:
+        simulator.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
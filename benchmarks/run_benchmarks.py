@@ -0,0 +1,303 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Run end-to-end provisioning benchmarks against simulated Prism.
+
+Every benchmark runs prepare_env for cluster of given size in temporary
+directory against fresh simulator and reports wall time, number of API
+requests (per endpoint) and bytes of request and response bodies.
+Results can be saved and compared with results of another revision or
+client settings (JSON backend, compression).
+With --listing, only listings of given number of vms (and tenth of that
+images) are measured instead.
+
+Usage: PYTHONPATH=. python benchmarks/run_benchmarks.py [--sizes 3 50 500]
+       [--output results.json] [--baseline previous.json]
+       [--json-backend auto] [--no-compression] [--listing 5000]
+
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+import yaml
+
+from benchmarks.prism_simulator import PrismSimulator, DEFAULT_SETTINGS
+from nutanix_scripts import logger as installer_logger
+from nutanix_scripts import prepare_kubernetes_env
+
+DEFAULT_SIZES = (3, 50, 500)
+LISTING_REPEATS = 5
+CLUSTER_NAME = 'simulator'
+SSH_USER = 'bench'
+SSH_KEY = 'ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQC0 bench@simulator'
+
+
+@contextlib.contextmanager
+def environment(workdir, variables):
+    """Run in given working directory with environment variables set.
+
+    :param str workdir: Working directory.
+    :param dict variables: Environment variables.
+    :return: Context manager.
+
+    """
+    previous_cwd = os.getcwd()
+    previous_environ = dict(os.environ)
+    os.chdir(workdir)
+    os.environ.update(variables)
+    try:
+        yield
+    finally:
+        os.chdir(previous_cwd)
+        os.environ.clear()
+        os.environ.update(previous_environ)
+
+
+def prepare_workdir(workdir, simulator, number_of_nodes, client_settings=None):
+    """Write installer configuration pointing to the simulator.
+
+    :param str workdir: Working directory of the benchmark.
+    :param PrismSimulator simulator: Running simulator.
+    :param int number_of_nodes: Number of Kubernetes cluster nodes.
+    :param dict client_settings: Additional Nutanix cluster configuration
+        e.g. 'json_backend' or 'compression'.
+    :return: None
+
+    """
+    os.makedirs(os.path.join(workdir, 'configs'))
+    os.makedirs(os.path.join(workdir, 'ssh_keys'))
+    with open(os.path.join(workdir, 'ssh_keys', '{}.pub'.format(SSH_USER)), 'w') as key_file:
+        key_file.write(SSH_KEY)
+
+    cluster_config = {
+        'address': '127.0.0.1',
+        'port': simulator.port,
+        'scheme': 'http'
+    }
+    cluster_config.update(client_settings or {})
+    with open(os.path.join(workdir, prepare_kubernetes_env.NUTANIX_CONFIG), 'w') as config:
+        yaml.safe_dump(
+            {'clusters': {CLUSTER_NAME: cluster_config}}, config, default_flow_style=False
+        )
+
+    masters = 1 if number_of_nodes < 10 else 3
+    with open(os.path.join(workdir, prepare_kubernetes_env.K8S_CONFIG), 'w') as config:
+        yaml.safe_dump({
+            'common': {
+                # Names with regular expression characters check escaping of filters.
+                'os_image_name': 'centos7_cloud(1702.qcow2c)',
+                'os_image_url': simulator.image_url,
+                'network_name': DEFAULT_SETTINGS['networks'][0],
+                'storage_container_name': DEFAULT_SETTINGS['storage_containers'][0],
+                'vm_disk_size': 10,
+                'clone_chunk_size': 10
+            },
+            'master': {'number_of_nodes': masters},
+            'worker': {'number_of_nodes': number_of_nodes - masters}
+        }, config, default_flow_style=False)
+
+
+def run_benchmark(number_of_nodes, settings, client_settings=None):
+    """Provision cluster of given size against fresh simulator.
+
+    :param int number_of_nodes: Number of Kubernetes cluster nodes.
+    :param dict settings: Simulator settings.
+    :param dict client_settings: Additional Nutanix cluster configuration.
+    :return: Benchmark result.
+    :rtype: dict
+
+    """
+    workdir = tempfile.mkdtemp(prefix='k8s_bench_')
+    try:
+        with PrismSimulator(**settings) as simulator:
+            prepare_workdir(workdir, simulator, number_of_nodes, client_settings)
+            with environment(workdir, {
+                prepare_kubernetes_env.NUTANIX_CLUSTER_ENV: CLUSTER_NAME,
+                prepare_kubernetes_env.K8S_CLUSTER_ENV: 'bench{}.local'.format(number_of_nodes),
+                prepare_kubernetes_env.BASE_VM_ENV: 'bench-base[v1.0]-{}'.format(number_of_nodes),
+                prepare_kubernetes_env.SSH_DIR_ENV: 'ssh_keys',
+                'NUTANIX_USERNAME': DEFAULT_SETTINGS['username'],
+                'NUTANIX_PASSWORD': DEFAULT_SETTINGS['password'],
+                # Stored Prism sessions go to the benchmark directory.
+                'HOME': workdir
+            }):
+                start = time.time()
+                cpu_start = time.clock()
+                prepare_kubernetes_env.prepare_env()
+                cpu_time = time.clock() - cpu_start
+                wall_time = time.time() - start
+
+            stats = simulator.state.stats
+            return {
+                'nodes': number_of_nodes,
+                'seconds': round(wall_time, 2),
+                'cpu_seconds': round(cpu_time, 2),
+                'requests': sum(stats['requests'].values()),
+                'bytes_in': stats['bytes_in'],
+                'bytes_out': stats['bytes_out'],
+                'rejected': stats['rejected'],
+                'endpoints': dict(stats['requests'])
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_listing_benchmark(number_of_vms, settings, client_settings=None):
+    """List vms and images of simulated cluster with many entities.
+
+    :param int number_of_vms: Number of vms in the cluster.
+    :param dict settings: Simulator settings.
+    :param dict client_settings: Additional Nutanix cluster configuration.
+    :return: Benchmark result.
+    :rtype: dict
+
+    """
+    workdir = tempfile.mkdtemp(prefix='k8s_bench_')
+    try:
+        with PrismSimulator(**settings) as simulator:
+            prepare_workdir(workdir, simulator, 1, client_settings)
+            state = simulator.state
+            network_uuid = state.networks[0]['uuid']
+            for number in range(number_of_vms):
+                state.add_vm('listed-{}'.format(number), 4096, 2, [network_uuid])
+            for number in range(number_of_vms // 10):
+                image_uuid = str(uuid.uuid4())
+                state.images[image_uuid] = {
+                    'uuid': image_uuid,
+                    'name': 'image-{}'.format(number),
+                    'annotation': '',
+                    'image_type': 'DISK_IMAGE',
+                    'vm_disk_id': str(uuid.uuid4()),
+                    'image_state': 'ACTIVE'
+                }
+
+            with environment(workdir, {
+                'NUTANIX_USERNAME': DEFAULT_SETTINGS['username'],
+                'NUTANIX_PASSWORD': DEFAULT_SETTINGS['password'],
+                'HOME': workdir
+            }):
+                nutanix = prepare_kubernetes_env.create_nutanix(CLUSTER_NAME)
+                state.stats.update(requests={}, bytes_in=0, bytes_out=0)
+                start = time.time()
+                cpu_start = time.clock()
+                for _ in range(LISTING_REPEATS):
+                    listed = sum(1 for _ in nutanix.iter_vms())
+                    nutanix.api.images()
+                cpu_time = time.clock() - cpu_start
+                wall_time = time.time() - start
+
+            return {
+                'vms': listed,
+                'seconds': round(wall_time, 2),
+                'cpu_seconds': round(cpu_time, 2),
+                'requests': sum(state.stats['requests'].values()),
+                'bytes_out': state.stats['bytes_out']
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def report(results, baseline=None):
+    """Print results table, with relative change to baseline if given.
+
+    :param list results: Benchmark results.
+    :param list baseline: Results of previous run.
+    :return: None
+
+    """
+    previous = dict((result['nodes'], result) for result in baseline or [])
+    columns = ('seconds', 'cpu_seconds', 'requests', 'bytes_in', 'bytes_out')
+    print('{:>6} '.format('NODES') + ' '.join('{:>20}'.format(column.upper()) for column in columns))
+    for result in results:
+        cells = []
+        for column in columns:
+            cell = str(result[column])
+            if result['nodes'] in previous and previous[result['nodes']][column]:
+                change = 100.0 * (result[column] - previous[result['nodes']][column]) / \
+                    previous[result['nodes']][column]
+                cell = '{} ({:+.0f}%)'.format(cell, change)
+            cells.append('{:>20}'.format(cell))
+        print('{:>6} '.format(result['nodes']) + ' '.join(cells))
+
+    for result in results:
+        print('\nRequests of {} nodes cluster:'.format(result['nodes']))
+        for endpoint, count in sorted(result['endpoints'].items()):
+            print('  {:<45} {:>8}'.format(endpoint, count))
+
+
+def main():
+    """Run benchmarks for requested cluster sizes.
+
+    :return: None
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Numbers of cluster nodes')
+    parser.add_argument('--output', help='Save results to JSON file')
+    parser.add_argument('--baseline', help='Compare with results saved by previous run')
+    parser.add_argument('--verbose', action='store_true', help='Show installer logs')
+    parser.add_argument('--json-backend', default='auto', help='JSON backend of the client')
+    parser.add_argument('--no-compression', action='store_true',
+                        help='Do not ask simulator for compressed responses')
+    parser.add_argument('--listing', type=int, metavar='VMS',
+                        help='Measure only {} listings of vms and images'.format(LISTING_REPEATS))
+    for name, value in sorted(DEFAULT_SETTINGS.items()):
+        if isinstance(value, float):
+            parser.add_argument('--{}'.format(name.replace('_', '-')), type=float, default=value,
+                                help='Simulator setting, default {}'.format(value))
+    args = parser.parse_args()
+
+    if not args.verbose:
+        installer_logger.console.setLevel(logging.WARNING)
+
+    settings = dict(
+        (name, getattr(args, name)) for name, value in DEFAULT_SETTINGS.items()
+        if isinstance(value, float)
+    )
+    client_settings = {
+        'json_backend': args.json_backend,
+        'compression': not args.no_compression
+    }
+    if args.listing:
+        result = run_listing_benchmark(args.listing, settings, client_settings)
+        print(json.dumps(dict(result, **client_settings), sort_keys=True))
+        return
+
+    results = []
+    for size in args.sizes:
+        sys.stderr.write('Provisioning {} nodes against simulated Prism\n'.format(size))
+        results.append(run_benchmark(size, settings, client_settings))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    report(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
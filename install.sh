@@ -21,11 +21,14 @@ PYTON_SCRIPTS="nutanix_scripts"
 VIRTUALENV_PATH=".env"
 REQUIREMENTS="requirements.txt"
 KUBESPRAY_DIR=".kubespray"
+JOURNALS_DIR=".cache/journals"
 
 #Inform about this script usage
 function usage
 {
-    echo "usage: install.sh --nutanix-cluster nutanix_cluster_name --kubernetes-cluster kubernetes_cluster_name --user remote_user --base-vm-name k8s_base_vm --ssh-dir ssh_keys/"
+    echo "usage: install.sh --nutanix-cluster nutanix_cluster_name --kubernetes-cluster kubernetes_cluster_name --user remote_user --base-vm-name k8s_base_vm --ssh-dir ssh_keys/ [--profile trace.json] [--metrics file.prom]"
+    echo "       install.sh --fleet configs/fleet.yml --user remote_user [--metrics file.prom]"
+    echo "       install.sh --scale-out number_of_workers --nutanix-cluster nutanix_cluster_name --kubernetes-cluster kubernetes_cluster_name --user remote_user --base-vm-name k8s_base_vm [--inventory inventory]"
     echo "ssh-dir by default points to ssh_keys directory in this folder"
 }
 
@@ -58,12 +61,31 @@ function get_and_set_kubespray
     cd $BASE_DIR
 }
 
+#Run Kubespray playbook on cluster described by given inventory (arguments: playbook, inventory, cluster name, extra ansible arguments)
+function run_kubespray
+{
+    playbook=$1
+    inventory_path=$2
+    cluster_name=$3
+    shift 3
+    #Use Ansible profile tuned for cluster size, generated next to the inventory
+    if [ -f $(dirname $inventory_path)/ansible.cfg ]; then
+        export ANSIBLE_CONFIG=$(cd $(dirname $inventory_path) && pwd)/ansible.cfg
+    fi
+    ansible-playbook -i $inventory_path $KUBESPRAY_DIR/$playbook -u $user -e cluster_name="$cluster_name" -e kube_network_plugin="flannel" -e bootstrap_os="centos" -e kube_basic_auth="true" -e dashboard_enabled="true" -e kubeconfig_localhost="true" -e kubectl_localhost="true" "$@"
+}
+
 #Set variable names for clusters, using called arguments
+fleet_config=
+scale_out=
+inventory=inventory
 nutanix_cluster=
 k8s_cluster=
 user=
 base_vm_name=
 ssh_keys_dir=ssh_keys/
+profile=
+metrics=
 
 if [ ! -f "install.sh" ]; then
     echo "You need run install.sh from folder which contains it"
@@ -87,6 +109,21 @@ while [ "$1" != "" ]; do
         --ssh-dir )  		shift
                                 ssh_keys_dir=$1
                                 ;;
+        --fleet )  		shift
+                                fleet_config=$1
+                                ;;
+        --scale-out )  		shift
+                                scale_out=$1
+                                ;;
+        --inventory )  		shift
+                                inventory=$1
+                                ;;
+        --profile )  		shift
+                                profile=$1
+                                ;;
+        --metrics )  		shift
+                                metrics=$1
+                                ;;
         -h | --help )           usage
                                 exit
                                 ;;
@@ -96,6 +133,50 @@ while [ "$1" != "" ]; do
     shift
 done
 
+if [ -n "$fleet_config" ]; then
+    if [ -z "$user" ]; then
+        usage
+        exit 1
+    fi
+
+    run_or_create_virtualenv
+    get_and_set_kubespray
+
+    #Prepare VMs of all clusters in fleet, every cluster gets inventories/<cluster>/inventory
+    #Failed clusters are reported in inventories/fleet_summary.json and skipped below
+    #Kubespray runs concurrently, its output is stored in inventories/<cluster>/kubespray.log
+    python $PYTON_SCRIPTS/fleet.py $fleet_config ${metrics:+--metrics $metrics} || true
+
+    pids=()
+    succeeded=$(python -c "import json; print(' '.join(r['name'] for r in json.load(open('inventories/fleet_summary.json')) if r['status'] == 'succeeded'))")
+    for cluster in $succeeded; do
+        (run_kubespray cluster.yml inventories/$cluster/inventory $cluster --flush-cache -e artifacts_dir="$BASE_DIR/inventories/$cluster/artifacts" && rm -f $JOURNALS_DIR/$cluster.json) > inventories/$cluster/kubespray.log 2>&1 &
+        pids+=($!)
+    done
+    status=0
+    for pid in "${pids[@]}"; do
+        wait $pid || status=1
+    done
+    exit $status
+fi
+
+if [ -n "$scale_out" ]; then
+    if [ -z "$nutanix_cluster" ] || [ -z "$k8s_cluster" ] || [ -z "$user" ] || [ -z "$base_vm_name" ]; then
+        usage
+        exit 1
+    fi
+
+    run_or_create_virtualenv
+    get_and_set_kubespray
+
+    #Clone and turn on new workers, append them to the inventory and list them in scale_out_hosts next to it
+    python $PYTON_SCRIPTS/scale_out.py $scale_out --nutanix-cluster $nutanix_cluster --kubernetes-cluster $k8s_cluster --base-vm-name $base_vm_name --inventory $inventory
+
+    #Run Kubespray only against new hosts
+    run_kubespray scale.yml $inventory $k8s_cluster --limit @$(dirname $inventory)/scale_out_hosts
+    exit 0
+fi
+
 if [ -f $nutanix_cluster ] || [ -f $k8s_cluster ] || [ -f $user ] || [ -f $base_vm_name ]; then
     usage
     exit 1
@@ -110,7 +191,12 @@ run_or_create_virtualenv
 get_and_set_kubespray
 
 #Run VMs preparation script (Create/Fetch VMs, Images, Networks and configure them)
-python $PYTON_SCRIPTS/prepare_kubernetes_env.py
+#With --profile, timeline of the preparation is written in Chrome trace format
+#With --metrics, API latency and task durations are written for node-exporter textfile collector
+python $PYTON_SCRIPTS/prepare_kubernetes_env.py ${profile:+--profile $profile} ${metrics:+--metrics $metrics}
 
 #Install Kubernetes on prepared clusters' inventory
-ansible-playbook -i inventory $KUBESPRAY_DIR/cluster.yml --flush-cache -u $user -e cluster_name="$k8s_cluster" -e kube_network_plugin="flannel" -e bootstrap_os="centos" -e kube_basic_auth="true" -e dashboard_enabled="true" -e kubeconfig_localhost="true" -e kubectl_localhost="true"
+run_kubespray cluster.yml inventory $k8s_cluster --flush-cache
+
+#Installation succeeded, next run for this cluster starts from scratch
+rm -f $JOURNALS_DIR/$k8s_cluster.json
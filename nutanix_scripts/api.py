@@ -14,18 +14,59 @@
 """Module containing wrapper classes for Nutanix API"""
 import getpass
 import httplib
-import json
+import os
 import pprint
+import re
+import threading
 import time
+import urllib
 
+from concurrent.futures import as_completed
 import requests
-from requests.exceptions import ConnectionError
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, HTTPError
 import yaml
 
+from nutanix_scripts import cache
+from nutanix_scripts.changes import ChangeDetector, ConditionalResponses
+from nutanix_scripts.entities import Image, Network, StorageContainer, Task, Vm
+from nutanix_scripts.async_api import AsyncNutanix, AsyncNutanixApi, DEFAULT_MAX_IN_FLIGHT
+from nutanix_scripts.codec import JsonCodec, AUTO
 from nutanix_scripts.exceptions import (
     InvalidNumberOfItems, ItemDoesNotExist, ConfigurationError, TaskFailed
 )
+from nutanix_scripts.images import annotated_digest, image_annotation
 from nutanix_scripts.logger import logger
+from nutanix_scripts.metrics import (
+    API_LATENCY, API_RETRIES, POLLS, TASK_DURATION, UNCHANGED_RESPONSES
+)
+from nutanix_scripts.profiling import tracer, url_template
+from nutanix_scripts.streaming import JsonStreamReader
+from nutanix_scripts.throttling import Throttle
+
+# Environment variables with credentials used instead of asking for them.
+USERNAME_ENV = 'NUTANIX_USERNAME'
+PASSWORD_ENV = 'NUTANIX_PASSWORD'
+
+# Characters with special meaning in regular expressions of Prism filters.
+FILTER_SPECIAL_CHARACTERS = re.compile(r'([\\.^$|?*+()\[\]{}])')
+
+
+def filter_expression(field, value, suffix=False):
+    """Build Prism filter expression matching field literally.
+    Prism matches filter values as regular expressions, so special
+    characters of the value are escaped.
+
+    :param str field: Filtered field e.g. 'vm_name'.
+    :param str value: Exact value of the field.
+    :param bool suffix: Match fields ending with value instead of equal to it.
+    :return: Filter expression.
+    :rtype: str
+
+    """
+    return '{}=={}{}'.format(
+        field, '.*' if suffix else '', FILTER_SPECIAL_CHARACTERS.sub(r'\\\1', value)
+    )
 
 
 class NutanixApi(object):
@@ -35,41 +76,76 @@ class NutanixApi(object):
     EXPECTED_STATUS_FOR_METHOD = {
         'get': httplib.OK,
         'post': httplib.CREATED,
+        'put': httplib.CREATED,
         'delete': httplib.CREATED
     }
 
-    def __init__(self, api_address, credentials):
+    def __init__(self, api_address, credentials, pool_size=DEFAULT_MAX_IN_FLIGHT,
+                 session_store=None, throttle=None, codec=None):
         """Create session and connection to Nutanix API
 
         :param str api_address: Address of Nutanix Prism.
-        :param dict credentials: Credential for connecting to Nutanix Prism.
+        :param credentials: Credential for connecting to Nutanix Prism
+            or function returning them, called only when logging in is needed.
+        :type credentials: dict or callable
+        :param int pool_size: Number of keep-alive connections kept open,
+            should be not smaller than number of concurrent calls.
+        :param SessionStore session_store: Store used to reuse Prism session
+            between runs.
+        :param Throttle throttle: Rate and concurrency control of API calls,
+            by default concurrency is adapted up to pool_size.
+        :param JsonCodec codec: Encoding of request and response bodies,
+            by default the fastest installed JSON backend with compression.
         :raises ConfigurationError: If credentials were invalid.
         :raises NotImplementedError: If response from API was incorrect
 
         """
         requests.packages.urllib3.disable_warnings()
 
+        self.api_address = api_address
         self.api_url = '{}/PrismGateway/services/rest'.format(api_address)
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.codec = codec or JsonCodec()
+        # Last responses of urls fetched with conditional requests.
+        self.conditional_responses = ConditionalResponses()
+        self.session.headers.update(self.codec.headers)
         # Required by requests - whether the SSL cert will be verified
         self.verify = False
 
-        self.__connect(credentials, api_address)
+        self.__credentials = credentials
+        self.session_store = session_store
+        self.throttle = throttle or Throttle(max_concurrency=pool_size)
+        # Incremented on every login, so concurrent calls rejected with 401
+        # cause only single reconnection.
+        self.session_generation = 0
+        self.__session_lock = threading.Lock()
+
+        cookies = session_store.load(api_address) if session_store else None
+        if cookies:
+            logger.info('Reusing stored Nutanix API session')
+            self.session.cookies.update(cookies)
+        else:
+            self.__connect()
 
-    def __connect(self, credentials, api_address):
+    def __connect(self):
         """Connect to Nutanix cluster.
 
-        :param dict credentials: Credentials for connecting to Nutanix Prism.
-        :param str api_address: Address of NUtanix Prism.
         :return: None
         :raises ConfigurationError: If credentials were invalid.
         :raises NotImplementedError: If response from API was incorrect
 
         """
+        if callable(self.__credentials):
+            self.__credentials = self.__credentials()
+
+        self.session.cookies.clear()
         try:
             response = self.session.post(
-                '{}/PrismGateway/j_spring_security_check'.format(api_address),
-                data=credentials,
+                '{}/PrismGateway/j_spring_security_check'.format(self.api_address),
+                data=self.__credentials,
                 verify=self.verify
             )
         except ConnectionError as error:
@@ -78,8 +154,15 @@ class NutanixApi(object):
 
         if response.status_code == 200:
             logger.info('Connected to Nutanix API')
+            self.session_generation += 1
+            if self.session_store:
+                self.session_store.save(
+                    self.api_address, requests.utils.dict_from_cookiejar(self.session.cookies)
+                )
             return
         elif response.status_code == 401:
+            if self.session_store:
+                self.session_store.clear(self.api_address)
             raise ConfigurationError(ConfigurationError.INVALID_CREDENTIALS)
         else:
             logger.error(
@@ -87,14 +170,35 @@ class NutanixApi(object):
             )
             raise NotImplementedError('Invalid reposnse from Nutanix API')
 
-    def __api_call(self, method, api_version, url, data=None):
+    def __reconnect(self, generation):
+        """Log in again unless other call already did it after generation.
+
+        :param int generation: Session generation used by rejected call.
+        :return: None
+        :raises ConfigurationError: If credentials were invalid.
+        :raises NotImplementedError: If response from API was incorrect
+
+        """
+        with self.__session_lock:
+            if generation == self.session_generation:
+                logger.info('Nutanix API session expired. Reconnecting')
+                self.__connect()
+
+    def __api_call(self, method, api_version, url, data=None, stream=False, conditional=None,
+                   long_poll=False):
         """Call HTTP request on Nutanix Api.
 
         :param str method: HTTP request type.
         :param str api_version: version of api we call.
         :param str url: Nutanix API call url.
         :param dict data: arguments of called command.
-        :return: Nutanix API response in json format.
+        :param bool stream: Return response with body not yet downloaded.
+        :param ConditionalResponse conditional: Last response of the url, request
+            is conditional on it and unchanged response is not decoded again.
+        :param bool long_poll: Request is held by Prism until timeout, see
+            :meth:`Throttle.call`.
+        :return: Nutanix API response in json format or response object
+            if stream was requested.
         :rtype: dict
         :raises HTTPError: If API call was not successful.
 
@@ -106,50 +210,127 @@ class NutanixApi(object):
         )
         kwargs = {
             'url': api_call_url,
-            'verify': self.verify
+            'verify': self.verify,
+            'stream': stream
         }
 
         if data is not None:
-            kwargs['data'] = json.dumps(data)
+            kwargs['data'] = self.codec.encode(data)
+        if conditional is not None:
+            kwargs['headers'] = conditional.request_headers()
+
+        def send():
+            return getattr(self.session, method)(**kwargs)
+
+        span_name = '{} {}'.format(method.upper(), url_template(url)) if tracer.enabled else None
+        with tracer.span(span_name, 'api', request_bytes=len(kwargs.get('data', ''))) as span:
+            start = time.time()
+            generation = self.session_generation
+            response = self.throttle.call(send, long_poll)
+            if response.status_code == httplib.UNAUTHORIZED:
+                response.close()
+                API_RETRIES.inc(reason='unauthorized')
+                self.__reconnect(generation)
+                response = self.throttle.call(send, long_poll)
+
+            API_LATENCY.observe(
+                time.time() - start,
+                method=method.upper(),
+                endpoint=url_template(url),
+                status=response.status_code
+            )
 
-        response = getattr(self.session, method)(**kwargs)
+            span['status'] = response.status_code
+            span['response_bytes'] = int(response.headers.get('Content-Length', 0)) \
+                if stream else len(response.content)
+
+        if conditional is not None and response.status_code == httplib.NOT_MODIFIED:
+            UNCHANGED_RESPONSES.inc(endpoint=url_template(url), validation='not_modified')
+            logger.debug('%s method on %s returned not modified response', method, api_call_url)
+            return conditional.result
 
         if response.status_code != self.EXPECTED_STATUS_FOR_METHOD[method]:
             response.raise_for_status()
 
+        if stream:
+            logger.debug('%s method on %s returned streamed response', method, api_call_url)
+            return response
+
+        if conditional is not None:
+            result, changed = conditional.update(response, self.codec.decode)
+            if not changed:
+                UNCHANGED_RESPONSES.inc(endpoint=url_template(url), validation='same_body')
+                logger.debug('%s method on %s returned unchanged body', method, api_call_url)
+                return result
+        else:
+            result = self.codec.decode(response)
         logger.debug(
             '%s method on %s with %s data returned %s',
             method,
             api_call_url,
             pprint.pformat(data),
-            pprint.pformat(response.json())
+            pprint.pformat(result)
         )
-        return response.json()
+        return result
 
-    def _get(self, api_version, url):
+    def _get(self, api_version, url, conditional=False):
         """Get-method with following parameters.
 
         :param str api_version: Version of api we call.
         :param str url: Nutanix API call url.
+        :param bool conditional: Make request conditional on the last response
+            of the url. Unchanged response is the same object as the last one,
+            so it must not be modified by caller.
         :return: Nutanix API response in json format.
         :rtype: dict
         :raises HTTPError: If API call was not successful.
 
         """
-        return self.__api_call('get', api_version, url)
+        return self.__api_call(
+            'get', api_version, url,
+            conditional=self.conditional_responses.entry(
+                '/'.join([api_version, url])
+            ) if conditional else None
+        )
+
+    def _get_stream(self, api_version, url):
+        """Get-method returning response which body is read on demand.
+
+        :param str api_version: Version of api we call.
+        :param str url: Nutanix API call url.
+        :return: Response with not consumed body. Needs to be closed by caller.
+        :rtype: requests.Response
+        :raises HTTPError: If API call was not successful.
+
+        """
+        return self.__api_call('get', api_version, url, stream=True)
 
-    def _post(self, api_version, url, data):
+    def _post(self, api_version, url, data, long_poll=False):
         """Post-method with following parameters and data.
 
         :param str api_version: Version of api we call.
         :param str url: Nutanix API call url.
         :param dict data: Data passed on post call.
+        :param bool long_poll: Request is held by Prism until timeout.
+        :return: Nutanix API response in json format.
+        :rtype: dict
+        :raises HTTPError: If API call was not successful.
+
+        """
+        return self.__api_call('post', api_version, url, data, long_poll=long_poll)
+
+    def _put(self, api_version, url, data):
+        """Put-method with following parameters and data.
+
+        :param str api_version: Version of api we call.
+        :param str url: Nutanix API call url.
+        :param dict data: Data passed on put call.
         :return: Nutanix API response in json format.
         :rtype: dict
         :raises HTTPError: If API call was not successful.
 
         """
-        return self.__api_call('post', api_version, url, data)
+        return self.__api_call('put', api_version, url, data)
 
     def _delete(self, api_version, url):
         """Delete-method with following parameters.
@@ -184,6 +365,52 @@ class NutanixApi(object):
         """
         return self._get(self.API_V1, 'vms?searchString={}'.format(query))
 
+    def vms_page(self, offset, length, filter_criteria=None, include_nic_config=True):
+        """Get page of Virtual Machines, optionally with their network configuration.
+        Body of the response is not downloaded until it is read.
+
+        :param int offset: Number of vms to skip.
+        :param int length: Maximal number of vms in page.
+        :param str filter_criteria: Prism filter expression e.g. 'vm_name==base'.
+        :param bool include_nic_config: Include nics (with ips) of vms.
+        :return: Response with 'metadata' and 'entities' to be read on demand.
+        :rtype: requests.Response
+        :raises HTTPError: If API call was not successful.
+
+        """
+        url = 'vms?offset={}&length={}'.format(offset, length)
+        if include_nic_config:
+            url += '&include_vm_nic_config=true'
+        return self._get_stream(self.API_V2, self.__with_filter(url, filter_criteria))
+
+    @staticmethod
+    def __with_filter(url, filter_criteria):
+        """Add filter expression to query of listing url.
+
+        :param str url: Url of listing.
+        :param str filter_criteria: Prism filter expression or None.
+        :return: Url with filter.
+        :rtype: str
+
+        """
+        if filter_criteria is None:
+            return url
+        return '{}{}filter={}'.format(
+            url, '&' if '?' in url else '?', urllib.quote(filter_criteria, safe='')
+        )
+
+    def vm(self, vm_uuid, conditional=False):
+        """Get single Virtual Machine details.
+
+        :param str vm_uuid: Uuid of Virtual Machine.
+        :param bool conditional: Reuse last response if vm did not change, see :meth:`_get`.
+        :return: Detailed information about the vm.
+        :rtype: dict
+        :raises HTTPError: If API call was not successful.
+
+        """
+        return self._get(self.API_V1, 'vms/{}'.format(vm_uuid), conditional)
+
     def vms_create(self, data):
         """Create a Virtual Machine with specified configuration.
         This is an asynchronous operation.
@@ -210,6 +437,33 @@ class NutanixApi(object):
         """
         return self._post(self.API_V2, 'vms/{}/clone'.format(vm_uuid), data)
 
+    def vms_update(self, vm_uuid, data):
+        """Update configuration of a Virtual Machine.
+        This is an asynchronous operation.
+        The UUID of task object is returned as the response of this operation.
+
+        :param str vm_uuid: Uuid of Virtual Machine.
+        :param dict data: Dictionary with changed fields e.g. 'description'.
+        :return: Dictionary with 'task_uuid'
+        :rtype: dict
+        :raises HTTPError: If API call was not successful.
+
+        """
+        return self._put(self.API_V2, 'vms/{}'.format(vm_uuid), data)
+
+    def vms_delete(self, vm_uuid):
+        """Delete a Virtual Machine.
+        This is an asynchronous operation.
+        The UUID of task object is returned as the response of this operation.
+
+        :param str vm_uuid: Uuid of Virtual Machine.
+        :return: Dictionary with 'task_uuid'
+        :rtype: dict
+        :raises HTTPError: If API call was not successful.
+
+        """
+        return self._delete(self.API_V2, 'vms/{}'.format(vm_uuid))
+
     def vms_set_power_state(self, vm_uuid, data):
         """Set power state of a Virtual Machine.
         This is an asynchronous operation.
@@ -226,36 +480,62 @@ class NutanixApi(object):
             self.API_V2, 'vms/{}/set_power_state'.format(vm_uuid), data
         )
 
-    def tasks(self, task_uuid):
+    def tasks(self, task_uuid, conditional=False):
         """Get details of the specified task.
 
         :param str task_uuid: Uuid of the task.
+        :param bool conditional: Reuse last response if task did not change, see :meth:`_get`.
         :return: Detailed information about the task.
         :rtype: dict
         :raises HTTPError: If API call was not successful.
 
         """
-        return self._get(self.API_V2, 'tasks/{}'.format(task_uuid))
+        return self._get(self.API_V2, 'tasks/{}'.format(task_uuid), conditional)
+
+    def tasks_poll(self, task_uuids, timeout_interval):
+        """Block until any of specified tasks is completed or timeout passes.
+
+        :param list task_uuids: Uuids of the tasks to wait for.
+        :param int timeout_interval: Number of seconds Prism holds the request.
+        :return: Dictionary with 'completed_tasks_info' and 'is_timeout'.
+        :rtype: dict
+        :raises HTTPError: If API call was not successful.
 
-    def networks(self):
+        """
+        return self._post(
+            self.API_V2,
+            'tasks/poll',
+            {
+                'completed_tasks': list(task_uuids),
+                'timeout_interval': timeout_interval
+            },
+            long_poll=True
+        )
+
+    def networks(self, filter_criteria=None):
         """Get list of networks configured in the cluster.
 
+        :param str filter_criteria: Prism filter expression e.g. 'name==vlan0'.
         :return: Detailed information about networks.
         :rtype: dict
         :raises HTTPError: If API call was not successful.
 
         """
-        return self._get(self.API_V2, 'networks')
+        return self._get(self.API_V2, self.__with_filter('networks', filter_criteria))
 
-    def images(self):
+    def images(self, filter_criteria=None):
         """Get the list of Images
 
+        :param str filter_criteria: Prism filter expression e.g. 'name==centos'.
         :return: Detailed information about images.
         :rtype: dict
         :raises HTTPError: If API call was not successful.
 
         """
-        return self._get(self.API_V2, 'images/?include_vm_disk_sizes=false')
+        return self._get(
+            self.API_V2,
+            self.__with_filter('images/?include_vm_disk_sizes=false', filter_criteria)
+        )
 
     def images_create(self, data):
         """Create a Image with specified configuration.
@@ -270,16 +550,20 @@ class NutanixApi(object):
         """
         return self._post(self.API_V2, 'images', data)
 
-    def storage_containers(self, storage_container_name):
+    def storage_containers(self, storage_container_name=None):
         """Get the list of Storage Containers configured in the cluster which
         contains given phrase.
 
         :param str storage_container_name: Name of storage container looked for.
+            All containers are returned if it is not given.
         :return: Detailed information about searched containers.
         :rtype: dict
         :raises HTTPError: If API call was not successful.
 
         """
+        if storage_container_name is None:
+            return self._get(self.API_V2, 'storage_containers')
+
         return self._get(
             self.API_V2,
             'storage_containers/?search_string={}'.format(storage_container_name)
@@ -289,15 +573,45 @@ class NutanixApi(object):
 class Nutanix(object):
     """User oriented wrapper on Nutanix API. Implements hig level concepts."""
     SLEEP_TIME = 5
+    # task waiting settings
+    MIN_SLEEP_TIME = 0.5
+    SLEEP_BACKOFF = 1.5
+    POLL_TIMEOUT = 30
+    TASK_SUCCEEDED = 'Succeeded'
+    TASK_FAILED_STATUSES = ('Failed', 'Aborted')
+    # statuses returned by Prism versions without tasks/poll endpoint
+    POLL_UNSUPPORTED_STATUSES = (
+        httplib.NOT_FOUND, httplib.METHOD_NOT_ALLOWED, httplib.NOT_IMPLEMENTED
+    )
+    # statuses returned by Prism versions rejecting filter of listings
+    FILTER_UNSUPPORTED_STATUSES = (httplib.BAD_REQUEST, httplib.NOT_IMPLEMENTED)
     # config file fields
     ADDRESS = 'address'
     PORT = 'port'
-
-    def __init__(self, config_path, nutanix_cluster_name):
+    SCHEME = 'scheme'
+    MAX_IN_FLIGHT = 'max_in_flight'
+    CACHE_TTL = 'cache_ttl'
+    THROTTLING = 'throttling'
+    JSON_BACKEND = 'json_backend'
+    COMPRESSION = 'compression'
+    # vms listing settings
+    VMS_PAGE_SIZE = 500
+    STREAM_CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, config_path, nutanix_cluster_name, cache_dir=None,
+                 session_store=None, api_budget=None, credentials=None):
         """Validate configuration from file and connect to the API
 
         :param str config_path: Path to Nutanix cluster config.
         :param str nutanix_cluster_name: Name of Nutanix cluster.
+        :param str cache_dir: Directory where metadata cache of the cluster
+            is persisted. Cache is kept only in memory if it is not given.
+        :param SessionStore session_store: Store used to reuse Prism session
+            between runs. Credentials are asked only when logging in is needed.
+        :param threading.Semaphore api_budget: Limit of API calls in flight
+            shared with other clients.
+        :param callable credentials: Function returning credentials when logging
+            in is needed, user is asked for them by default.
         :raises NotImplementedError: If response from API was incorrect.
         :raises IOError: when file doesn't exist, or path is incorrect.
         :raises ParseError: when file is not valid yml file.
@@ -325,20 +639,94 @@ class Nutanix(object):
 
         try:
             kwargs = {
-                'api_address': 'https://{}:{}'.format(
-                    config[self.ADDRESS], config[self.PORT]
+                'api_address': '{}://{}:{}'.format(
+                    config.get(self.SCHEME, 'https'), config[self.ADDRESS], config[self.PORT]
                 ),
-                'credentials': {
-                    'j_username': raw_input('Nutanix API User: '),
-                    'j_password': getpass.getpass()
-                }
+                'credentials': credentials or self.ask_credentials,
+                'pool_size': int(config.get(self.MAX_IN_FLIGHT, DEFAULT_MAX_IN_FLIGHT)),
+                'session_store': session_store
             }
+            throttling_config = dict(config.get(self.THROTTLING) or {})
+            throttling_config.setdefault('max_concurrency', kwargs['pool_size'])
+            throttling_config['budget'] = api_budget
+            kwargs['throttle'] = Throttle(**throttling_config)
         except KeyError as error:
             raise ConfigurationError(
                 ConfigurationError.MISSING_FIELD.format(error)
             )
+        except (TypeError, ValueError) as error:
+            raise ConfigurationError(ConfigurationError.INVALID_TYPE.format(error))
+        kwargs['codec'] = JsonCodec(
+            config.get(self.JSON_BACKEND, AUTO), bool(config.get(self.COMPRESSION, True))
+        )
 
         self.api = NutanixApi(**kwargs)
+        # Shares keep-alive connections of self.api for overlapping calls.
+        self.async_api = AsyncNutanixApi(self.api, kwargs['pool_size'])
+        # Overlapping high level operations, e.g. power transitions of many vms.
+        self.async_nutanix = AsyncNutanix(self, kwargs['pool_size'])
+
+        cache_path = None
+        if cache_dir is not None:
+            cache_path = os.path.join(cache_dir, 'metadata_{}_{}.json'.format(
+                config[self.ADDRESS], config[self.PORT]
+            ))
+        self.cache = cache.MetadataCache(config.get(self.CACHE_TTL), cache_path)
+        # Serialize get-or-create of the same entity by concurrent callers.
+        self.__creation_locks = {}
+        self.__creation_locks_lock = threading.Lock()
+        self.long_poll_supported = True
+        self.filter_supported = True
+
+    @staticmethod
+    def ask_credentials():
+        """Ask user for Nutanix API credentials.
+        Credentials are taken from USERNAME_ENV and PASSWORD_ENV environment
+        variables if both are set, e.g. for unattended runs.
+
+        :return: Dictionary with credentials for Nutanix Prism login form.
+        :rtype: dict
+
+        """
+        if os.environ.get(USERNAME_ENV) and os.environ.get(PASSWORD_ENV):
+            return Nutanix.env_credentials()
+        return {
+            'j_username': raw_input('Nutanix API User: '),
+            'j_password': getpass.getpass()
+        }
+
+    @staticmethod
+    def env_credentials():
+        """Get Nutanix API credentials from USERNAME_ENV and PASSWORD_ENV
+        environment variables, never asking user for them.
+
+        :return: Dictionary with credentials for Nutanix Prism login form.
+        :rtype: dict
+        :raises ConfigurationError: If any of the variables is not set.
+
+        """
+        if not (os.environ.get(USERNAME_ENV) and os.environ.get(PASSWORD_ENV)):
+            raise ConfigurationError(
+                ConfigurationError.MISSING_CREDENTIALS.format(USERNAME_ENV, PASSWORD_ENV)
+            )
+        return {
+            'j_username': os.environ[USERNAME_ENV],
+            'j_password': os.environ[PASSWORD_ENV]
+        }
+
+    def creation_lock(self, entity_type, name):
+        """Get lock guarding creation of entity with given name.
+
+        :param str entity_type: Type of entity e.g. 'vm'.
+        :param str name: Name of entity.
+        :return: Lock shared by all callers creating the entity.
+        :rtype: threading.Lock
+
+        """
+        with self.__creation_locks_lock:
+            return self.__creation_locks.setdefault(
+                (entity_type, name), threading.Lock()
+            )
 
     @property
     def cluster(self):
@@ -351,47 +739,144 @@ class Nutanix(object):
         """
         return self.api.cluster()
 
-    def get_vms(self, query, expected_count=None):
-        """Get dictionary of Virtual Machine's detailed information.
+    def iter_vms(self, query=None, page_size=VMS_PAGE_SIZE, keep_raw=False, name=None,
+                 vm_domain=None, include_ips=True):
+        """Iterate over Virtual Machines matching all given criteria.
+        Vms are fetched page by page and every page is parsed incrementally,
+        so memory usage does not depend on number of vms in the cluster.
+        Exact name or domain is filtered by Prism (if it supports filters),
+        other criteria and Prism ignoring the filter are handled on client side.
+
+        :param str query: Search string which vm names have to contain.
+        :param int page_size: Number of vms fetched in single API call.
+        :param bool keep_raw: Keep full Prism response in `raw` of every vm.
+        :param str name: Exact name of vm.
+        :param str vm_domain: Domain of vms named by :meth:`vm_name`, e.g. name
+            of Kubernetes cluster. Vms which only contain it in name are skipped.
+        :param bool include_ips: Fetch nic configs with ips, without them
+            listing is much smaller.
+        :return: Generator of Virtual Machines.
+        :rtype: generator
+        :raises HTTPError: If API call was not successful.
+
+        """
+        query = query.lower() if query else None
+        suffix = '-{}'.format(vm_domain) if vm_domain else None
+        filter_criteria = None
+        if name:
+            filter_criteria = filter_expression('vm_name', name)
+        elif suffix:
+            filter_criteria = filter_expression('vm_name', suffix, suffix=True)
+        offset = 0
+        while True:
+            page_count = 0
+            response = self.__filtered(
+                lambda criteria: self.api.vms_page(offset, page_size, criteria, include_ips),
+                filter_criteria
+            )
+            try:
+                reader = JsonStreamReader(response.iter_content(self.STREAM_CHUNK_SIZE))
+                for vm in reader.iter_array('entities'):
+                    page_count += 1
+                    if query is not None and query not in vm['name'].lower():
+                        continue
+                    if name is not None and vm['name'] != name:
+                        continue
+                    if suffix is not None and not vm['name'].endswith(suffix):
+                        continue
+                    yield Vm.from_api(vm, keep_raw)
+            finally:
+                response.close()
+
+            if page_count < page_size:
+                return
+            offset += page_count
+
+    def __filtered(self, call, filter_criteria):
+        """Call listing with Prism filter expression, or without it if Prism
+        rejects filters. Results have to be filtered on client side anyway,
+        as some Prism versions ignore filters.
+
+        :param callable call: Function calling listing with filter expression or None.
+        :param str filter_criteria: Filter expression.
+        :return: Result of the call.
+        :raises HTTPError: If API call was not successful.
+
+        """
+        if filter_criteria is None or not self.filter_supported:
+            return call(None)
+        try:
+            return call(filter_criteria)
+        except HTTPError as error:
+            if error.response is None or \
+                    error.response.status_code not in self.FILTER_UNSUPPORTED_STATUSES:
+                raise
+            logger.info('Filtering of listings is not supported. Falling back to client side')
+            self.filter_supported = False
+            return call(None)
+
+    def get_vms(self, query=None, expected_count=None, keep_raw=False, **criteria):
+        """Get list of Virtual Machines.
 
         :param str query: Search string used to find specific Virtual Machine.
         :param int expected_count: Number of Virtual Machines expected to be returned.
-        :return: Dictionary with Virtual Machines' details.
-        :rtype: dict
+        :param bool keep_raw: Keep full Prism response in `raw` of every vm.
+        :param criteria: Other criteria of :meth:`iter_vms` e.g. name, vm_domain.
+        :return: List of Virtual Machines.
+        :rtype: list
         :raises HTTPError: If API call was not successful.
         :raises ItemDoesNotExist: When Vritual Machine specified in search query is not found.
         :raises InvalidNumberOfItems: When number of VMs returned is not equal to expected.
 
         """
-        data = self.api.vms(query)
-
-        if expected_count is None:
-            return data['entities']
+        vms = list(self.iter_vms(query, keep_raw=keep_raw, **criteria))
 
-        if data['metadata']['count'] == expected_count:
-            return data['entities']
+        if expected_count is None or len(vms) == expected_count:
+            return vms
 
-        if not data['metadata']['count']:
+        description = criteria.get('name') or criteria.get('vm_domain') or query
+        if not vms:
             raise ItemDoesNotExist(
-                ItemDoesNotExist.MESSAGE.format('Vm', query)
+                ItemDoesNotExist.MESSAGE.format('Vm', description)
             )
 
         raise InvalidNumberOfItems(InvalidNumberOfItems.INVALID_COUNT.format(
-            data['metadata']['count'], 'vms', query, expected_count
+            len(vms), 'vms', description, expected_count
         ))
 
-    def get_vms_property(self, query, vm_property):
+    def get_vms_property(self, query, vm_property, **criteria):
         """Get Virtual Machines properties.
+        Nic configs are fetched only for properties which need them.
 
         :param str query: Search string used to find specific Virtual Machine.
-        :param str vm_property: Property name of Virtual Machine we want to include in dictionary.
+        :param str vm_property: Prism field name of Virtual Machine we want to include
+            in dictionary, fields not kept by :class:`Vm` are read from full response.
+        :param criteria: Other criteria of :meth:`iter_vms` e.g. vm_domain.
         :return: Dictionary with vm name as key and property as value.
         :rtype: dict
         :raises HTTPError: If API call was not successful.
 
         """
-        vms = self.get_vms(query)
-        return {vm['vmName']: vm[vm_property] for vm in vms}
+        attribute = Vm.attribute_of(vm_property)
+        keep_raw = attribute is None
+        criteria.setdefault('include_ips', keep_raw or attribute == 'ip_addresses')
+        return {
+            vm.name: vm[vm_property]
+            for vm in self.iter_vms(query, keep_raw=keep_raw, **criteria)
+        }
+
+    def get_vm(self, vm_uuid, conditional=False):
+        """Get single Virtual Machine.
+
+        :param str vm_uuid: Uuid of Virtual Machine.
+        :param bool conditional: Reuse last response if vm did not change,
+            see :meth:`NutanixApi._get`.
+        :return: Virtual Machine.
+        :rtype: Vm
+        :raises HTTPError: If API call was not successful.
+
+        """
+        return Vm.from_api(self.api.vm(vm_uuid, conditional))
 
     @staticmethod
     def vm_name(number, role, vm_domain):
@@ -406,7 +891,8 @@ class Nutanix(object):
         """
         return "%s-%s-%s" % (role, number, vm_domain)
 
-    def create_vm(self, vcpu, ram, disk, name, network_uuid, os_image_uuid, cloud_config):
+    def create_vm(self, vcpu, ram, disk, name, network_uuid, os_image_uuid, cloud_config,
+                  description=''):
         """Create Virtual Machine with specified configuration.
         This method call asynchronous operation and wait for it to report success
         or failure.
@@ -418,6 +904,7 @@ class Nutanix(object):
         :param str network_uuid: Uuid of Nutanix network used for Virtual Machine.
         :param str os_image_uuid: Uuid of OS Image used for Virtual Machine.
         :param str cloud_config: Cloud config for customization of Virtual Machine.
+        :param str description: Description of Virtual Machine.
         :return: None
         :raises HTTPError: If API call was not successful.
         :raises TaskFailed: If creation task failed
@@ -427,7 +914,7 @@ class Nutanix(object):
             "name": name,
             "memory_mb": ram * 1024,
             "num_vcpus": vcpu,
-            "description": "",
+            "description": description,
             "num_cores_per_vcpu": 1,
             "vm_disks": [
                 {
@@ -467,10 +954,15 @@ class Nutanix(object):
             self.api.vms_create(data)
         )
 
-    def get_or_create_vm(self, vcpu, ram, disk, name, network_uuid, os_image_uuid, cloud_config):
+    def get_or_create_vm(self, vcpu, ram, disk, name, network_uuid, os_image_uuid, cloud_config,
+                         description='', on_create=None, reusable=None):
         """Check for vm using its name or create Virtual Machine with specified configuration.
         In case of creation this method call asynchronous operation
         and wait for it to report success or failure.
+        Optional on_create callback is called with created vm before the
+        creation lock is released, so other users get vm once it is ready.
+        Vm is read again after the callback, so its changes are returned.
+        Existing vm rejected by optional reusable check is deleted and created again.
 
         :param int vcpu: Number of vCPUs for Virtual Machine.
         :param int ram: Size of RAM (GB) for Virtual Machine.
@@ -479,23 +971,36 @@ class Nutanix(object):
         :param str network_uuid: Uuid of Nutanix network used for Virtual Machine.
         :param str os_image_uuid: Uuid of OS Image used for Virtual Machine.
         :param str cloud_config: Cloud config for customization of Virtual Machine.
-        :return: Detailed info about requested vm.
-        :rtype: dict
+        :param str description: Description of created Virtual Machine.
+        :param callable on_create: Function called with created vm.
+        :param callable reusable: Function checking whether existing vm can be used.
+        :return: Requested vm.
+        :rtype: Vm
         :raises HTTPError: If API call was not successful.
-        :raises TaskFailed: If creation task failed.
+        :raises TaskFailed: If creation or deletion task failed.
 
         """
         vms = None
 
-        try:
-            vms = self.get_vms(name, expected_count=1)
-        except ItemDoesNotExist:
-            self.create_vm(
-                vcpu, ram, disk, name, network_uuid, os_image_uuid, cloud_config
-            )
+        with self.creation_lock('vm', name):
+            try:
+                vms = self.get_vms(name=name, expected_count=1, include_ips=False)
+            except ItemDoesNotExist:
+                pass
 
-        if not vms:
-            vms = self.get_vms(name, expected_count=1)
+            if vms and reusable is not None and not reusable(vms[0]):
+                logger.warning('Vm %s can not be reused. Creating it again', name)
+                self.delete_vm(vms[0]['uuid'])
+                vms = None
+
+            if not vms:
+                self.create_vm(
+                    vcpu, ram, disk, name, network_uuid, os_image_uuid, cloud_config, description
+                )
+                vms = self.get_vms(name=name, expected_count=1, include_ips=False)
+                if on_create is not None:
+                    on_create(vms[0])
+                    vms = self.get_vms(name=name, expected_count=1, include_ips=False)
 
         return vms[0]
 
@@ -517,7 +1022,7 @@ class Nutanix(object):
             "override_network_config": False,
         }
 
-    def clone_vm(self, vm_uuid, configs, vm_domain):
+    def clone_vm(self, vm_uuid, configs, vm_domain, chunk_size=None, first_number=0):
         """Create clone of VM with specified configuration.
         This method call asynchronous operation and wait for it to report success
         or failure.
@@ -526,16 +1031,45 @@ class Nutanix(object):
         :param tupple configs: List of dicts consisting nodes configurations.
         :param str vm_domain: Name of domain for created Virtual Machine.
             Used to generate Virtual Machine name.
+        :param int chunk_size: Number of vms cloned by single task.
+        :param int first_number: Number of the first vm of every role.
         :return: None
         :raises HTTPError: If API call was not successful.
         :raises TaskFailed: If creation task failed.
 
         """
-        data = {
-            'spec_list': []
-        }
+        for _ in self.iter_clone_vm(
+                vm_uuid, configs, vm_domain, chunk_size, first_number=first_number
+        ):
+            pass
+
+    def iter_clone_vm(self, vm_uuid, configs, vm_domain, chunk_size=None, existing_names=(),
+                      first_number=0):
+        """Clone VM in chunks submitted concurrently.
+        Every vm is yielded as soon as subtask creating it completes (vms of
+        subtasks finished at once together), so following steps can start
+        while other clones are still created. With Prism not reporting
+        subtasks, vms of every chunk are yielded when its task completes.
+
+        :param str vm_uuid: Uuid of Virtual Machine used as base for cloning process.
+        :param tupple configs: List of dicts consisting nodes configurations.
+        :param str vm_domain: Name of domain for created Virtual Machine.
+            Used to generate Virtual Machine name.
+        :param int chunk_size: Number of vms cloned by single task,
+            all vms are cloned by one task if not given.
+        :param iterable existing_names: Names of vms which already exist
+            (e.g. cloned by interrupted run) and are not cloned again.
+        :param int first_number: Number of the first vm of every role,
+            e.g. to continue numbering of existing vms.
+        :return: Generator of dictionaries with vm name as key and vm uuid as value.
+        :rtype: generator
+        :raises HTTPError: If API call was not successful.
+        :raises TaskFailed: If creation task failed.
+
+        """
+        spec_list = []
         for node_type_config in configs:
-            for number in range(node_type_config['number_of_nodes']):
+            for number in range(first_number, first_number + node_type_config['number_of_nodes']):
                 vm_spec = self.__prepare_clone(
                     vm_name=self.vm_name(
                         number, node_type_config['role'], vm_domain
@@ -543,103 +1077,432 @@ class Nutanix(object):
                     ram=node_type_config['ram_size'],
                     vcpu=node_type_config['number_of_vcpu']
                 )
-                data['spec_list'].append(vm_spec)
+                spec_list.append(vm_spec)
 
-        self.wait_for_task(
-            self.api.vms_clone(vm_uuid, data)
-        )
+        existing_names = set(existing_names)
+        spec_list = [spec for spec in spec_list if spec['name'] not in existing_names]
+        if not spec_list:
+            return
+
+        chunk_size = chunk_size or len(spec_list)
+        chunks = [
+            spec_list[index:index + chunk_size]
+            for index in range(0, len(spec_list), chunk_size)
+        ]
+        requests_chunks = [
+            (self.async_api.vms_clone(vm_uuid, {'spec_list': chunk}), chunk)
+            for chunk in chunks
+        ]
+        tasks_chunks = {
+            future.result()['task_uuid']: [spec['name'] for spec in chunk]
+            for future, chunk in requests_chunks
+        }
+        logger.info('Cloning %s vms in %s chunk(s)', len(spec_list), len(chunks))
+
+        for finished in self.iter_subtasks(tasks_chunks):
+            cloned_uuids = []
+            chunks_names = set()
+            for task_uuid, task_info in finished:
+                if task_info.uuid == task_uuid:
+                    chunks_names.update(tasks_chunks[task_uuid])
+                else:
+                    cloned_uuids.extend(
+                        cloned_uuid for cloned_uuid in task_info.entity_uuids('VM')
+                        if cloned_uuid != vm_uuid
+                    )
+
+            cloned = {}
+            if chunks_names:
+                cloned.update(
+                    (name, cloned_uuid) for name, cloned_uuid in self.get_vms_property(
+                        None, 'uuid', vm_domain=vm_domain
+                    ).items() if name in chunks_names
+                )
+            # Conditional, so the first check of cloned vms reuses these responses.
+            queries = {
+                self.async_nutanix.get_vm(cloned_uuid, conditional=True): cloned_uuid
+                for cloned_uuid in cloned_uuids
+            }
+            for future in as_completed(queries):
+                cloned[future.result().name] = queries[future]
+            if cloned:
+                yield cloned
+
+    def __get_cached_entity(self, entity_type, name, fetch, fetch_named):
+        """Get single entity of given type and name using metadata cache.
+
+        :param str entity_type: Type of entity e.g. 'networks'.
+        :param str name: Name of the entity.
+        :param callable fetch: Function returning list of all entities of the type.
+        :param callable fetch_named: Function returning list of entities which
+            include all entities with given name.
+        :return: Entity with given name.
+        :rtype: Entity
+        :raises ItemDoesNotExist: If entity with specified name is not found.
+        :raises InvalidNumberOfItems: If more than one entity is found.
+        :raises HTTPError: If API call was not successful.
+
+        """
+        entities = self.cache.get(entity_type, name, fetch, fetch_named)
+
+        if len(entities) == 1:
+            return entities[0]
+
+        if not entities:
+            raise ItemDoesNotExist(
+                ItemDoesNotExist.MESSAGE.format(entity_type, name)
+            )
+
+        raise InvalidNumberOfItems(InvalidNumberOfItems.INVALID_COUNT.format(
+            len(entities), entity_type, name, 1
+        ))
+
+    def invalidate_cache(self):
+        """Drop cached networks, images and storage containers, e.g. after
+        Prism rejected uuid of cached entity.
+
+        :return: None
+
+        """
+        for entity_type in (cache.NETWORKS, cache.IMAGES, cache.STORAGE_CONTAINERS):
+            self.cache.invalidate(entity_type)
 
     def get_network(self, network_name):
         """Get detailed information about network with specified name.
 
         :param str network_name: Name of the Network.
-        :return: Dictionary with detailed information of network with given name.
-        :rtype: dict
+        :return: Network with given name.
+        :rtype: Network
         :raises ItemDoesNotExist: If Network with specified name is not found.
         :raises InvalidNumberOfItems: If more than one Network is found.
         :raises HTTPError: If API call was not successful.
 
         """
-        networks = [
-            network for network in self.api.networks()['entities'] if network['name'] == network_name
+        return self.__get_cached_entity(
+            cache.NETWORKS, network_name, self.__fetch_networks, self.__fetch_networks
+        )
+
+    def get_storage_container(self, storage_container_name):
+        """Get detailed information about storage container with specified name.
+
+        :param str storage_container_name: Name of the Storage Container.
+        :return: Storage container with given name.
+        :rtype: StorageContainer
+        :raises ItemDoesNotExist: If Storage Container is not found.
+        :raises InvalidNumberOfItems: If more than one Storage Container is found.
+        :raises HTTPError: If API call was not successful.
+
+        """
+        return self.__get_cached_entity(
+            cache.STORAGE_CONTAINERS,
+            storage_container_name,
+            self.__fetch_storage_containers,
+            self.__fetch_storage_containers
+        )
+
+    def __fetch_networks(self, name=None):
+        """Get networks of the cluster.
+
+        :param str name: Name of networks, filtered by Prism if it supports filters.
+        :return: List of all networks or of networks with given name.
+        :rtype: list
+        :raises HTTPError: If API call was not successful.
+
+        """
+        return [Network.from_api(network) for network in self.__filtered(
+            self.api.networks, filter_expression('name', name) if name else None
+        )['entities']]
+
+    def __fetch_storage_containers(self, name=None):
+        """Get storage containers of the cluster.
+
+        :param str name: Name of containers, Prism returns containers containing it.
+        :return: List of all containers or of containers containing name.
+        :rtype: list
+        :raises HTTPError: If API call was not successful.
+
+        """
+        return [
+            StorageContainer.from_api(container)
+            for container in self.api.storage_containers(name)['entities']
         ]
 
-        if len(networks) == 1:
-            return networks[0]
+    def __fetch_images(self, name=None):
+        """Get images of the cluster.
 
-        if not networks:
-            raise ItemDoesNotExist(
-                ItemDoesNotExist.MESSAGE.format('network', network_name)
-            )
+        :param str name: Name of images, filtered by Prism if it supports filters.
+        :return: List of all images or of images with given name.
+        :rtype: list
+        :raises HTTPError: If API call was not successful.
 
-        raise InvalidNumberOfItems(InvalidNumberOfItems.INVALID_COUNT.format(
-            len(networks), 'networks', network_name, 1
-        ))
+        """
+        return [Image.from_api(image) for image in self.__filtered(
+            self.api.images, filter_expression('name', name) if name else None
+        )['entities']]
 
     def wait_for_task(self, task_data):
         """Wait for task completion.
 
         :param dict task_data: Dictionary with 'task_uuid'.
-        :return: None.
+        :return: Finished task.
+        :rtype: Task
         :raises TaskFailed: If Task has status 'Failed'.
         :raises HTTPError: If API call was not successful.
 
         """
-        while True:
-            task_info = self.api.tasks(task_data['task_uuid'])
-            if task_info['progress_status'] == 'Failed':
+        task_info, = self.wait_for_tasks([task_data['task_uuid']])
+        return task_info
+
+    def wait_for_tasks(self, task_uuids, raise_on_failure=True):
+        """Wait for completion of many tasks at once.
+        Every task is yielded as soon as it finishes. Prism tasks/poll long-poll
+        endpoint is used when available, otherwise tasks are polled one by one
+        with growing intervals (from MIN_SLEEP_TIME up to SLEEP_TIME), using
+        conditional requests so unchanged tasks are not decoded nor checked again.
+
+        :param iterable task_uuids: Uuids of tasks to wait for.
+        :param bool raise_on_failure: Raise exception on failed task instead of
+            yielding its details.
+        :return: Generator of finished tasks.
+        :rtype: generator
+        :raises TaskFailed: If Task has status 'Failed' and raise_on_failure is set.
+        :raises HTTPError: If API call was not successful.
+
+        """
+        for finished in self.__iter_finished_tasks(task_uuids, raise_on_failure):
+            for task_info in finished:
+                yield task_info
+
+    def iter_subtasks(self, task_uuids, raise_on_failure=True):
+        """Wait for tasks, yielding every subtask as soon as it finishes,
+        e.g. creation of single vm of clone task with many specs.
+        Tasks which report no subtasks (older Prism versions) are yielded
+        themselves once finished. Subtasks are yielded in lists of subtasks
+        finished at once, so callers can handle them in batches.
+
+        :param iterable task_uuids: Uuids of parent tasks.
+        :param bool raise_on_failure: Raise exception on failed task or subtask
+            instead of yielding its details.
+        :return: Generator of lists of (parent task uuid, finished task) tuples.
+        :rtype: generator
+        :raises TaskFailed: If task or subtask failed and raise_on_failure is set.
+        :raises HTTPError: If API call was not successful.
+
+        """
+        parents = {}
+        # Parents (and late subtasks below) are fetched concurrently, bounded by max_in_flight.
+        futures = [(task_uuid, self.async_api.tasks(task_uuid)) for task_uuid in task_uuids]
+        for task_uuid, future in futures:
+            parents[task_uuid] = task_uuid
+            task_info = Task.from_api(future.result())
+            parents.update(
+                (subtask_uuid, task_uuid) for subtask_uuid in task_info.subtask_uuids or ()
+            )
+
+        for finished in self.__iter_finished_tasks(parents, raise_on_failure):
+            batch = []
+            late_subtasks = []
+            for task_info in finished:
+                parent_uuid = parents[task_info.uuid]
+                if task_info.uuid != parent_uuid:
+                    batch.append((parent_uuid, task_info))
+                    continue
+                if not task_info.subtask_uuids:
+                    batch.append((parent_uuid, task_info))
+                    continue
+                # Subtasks not reported yet when waiting started are finished with parent.
+                for subtask_uuid in task_info.subtask_uuids:
+                    if subtask_uuid in parents:
+                        continue
+                    parents[subtask_uuid] = parent_uuid
+                    late_subtasks.append((parent_uuid, self.async_api.tasks(subtask_uuid)))
+            for parent_uuid, future in late_subtasks:
+                subtask_info = Task.from_api(future.result())
+                self.__check_finished_task(subtask_info, raise_on_failure)
+                batch.append((parent_uuid, subtask_info))
+            if batch:
+                yield batch
+
+    def __iter_finished_tasks(self, task_uuids, raise_on_failure):
+        """Wait for completion of tasks, yielding lists of tasks found
+        finished by single poll.
+
+        :param iterable task_uuids: Uuids of tasks to wait for.
+        :param bool raise_on_failure: Raise exception on failed task.
+        :return: Generator of lists of finished tasks.
+        :rtype: generator
+        :raises TaskFailed: If Task has status 'Failed' and raise_on_failure is set.
+        :raises HTTPError: If API call was not successful.
+
+        """
+        pending = set(task_uuids)
+        sleep_time = self.MIN_SLEEP_TIME
+        progress = ChangeDetector()
+        progress.subscribe(self.__log_task_progress)
+
+        while pending:
+            finished = None
+            if self.long_poll_supported:
+                POLLS.inc(target='tasks_long_poll')
+                finished = self.__long_poll_tasks(pending)
+
+            if finished is None:
+                POLLS.inc(len(pending), target='tasks')
+                finished = []
+                for task_uuid in pending:
+                    task_data = self.api.tasks(task_uuid, conditional=True)
+                    if not progress.update(task_uuid, task_data):
+                        continue
+                    task_info = Task.from_api(task_data)
+                    if self.__is_task_finished(task_info):
+                        finished.append(task_info)
+                if not finished:
+                    logger.info(
+                        '%s task(s) still running. Waiting %s seconds before another check',
+                        len(pending), sleep_time
+                    )
+                    tracer.sleep(sleep_time, 'tasks')
+                    sleep_time = min(sleep_time * self.SLEEP_BACKOFF, self.SLEEP_TIME)
+                    continue
+                sleep_time = self.MIN_SLEEP_TIME
+
+            batch = []
+            for task_info in finished:
+                if task_info.uuid not in pending:
+                    continue
+                pending.discard(task_info.uuid)
+                self.__check_finished_task(task_info, raise_on_failure)
+                batch.append(task_info)
+            if batch:
+                yield batch
+
+    def __check_finished_task(self, task_info, raise_on_failure):
+        """Record and log finished task.
+
+        :param Task task_info: Finished task.
+        :param bool raise_on_failure: Raise exception if task failed.
+        :return: None
+        :raises TaskFailed: If Task has status 'Failed' and raise_on_failure is set.
+
+        """
+        self.__record_task(task_info)
+        if task_info.progress_status in self.TASK_FAILED_STATUSES:
+            if raise_on_failure:
                 raise TaskFailed(TaskFailed.MESSAGE.format(task_info))
-            elif all([
-                    task_info['percentage_complete'] == 100,
-                    task_info['progress_status'] == 'Succeeded'
-            ]):
-                logger.info(
-                    'Task %s (%s) finished in %s seconds',
-                    task_info['operation_type'],
-                    task_info['uuid'],
-                    (task_info['complete_time_usecs'] - task_info['create_time_usecs'])/10.0**6
-                )
-                break
+            logger.error(
+                'Task %s (%s) failed', task_info.operation_type, task_info.uuid
+            )
+        else:
+            logger.info(
+                'Task %s (%s) finished in %s seconds',
+                task_info.operation_type,
+                task_info.uuid,
+                (task_info.complete_time_usecs - task_info.create_time_usecs)/10.0**6
+            )
+
+    @staticmethod
+    def __log_task_progress(task_uuid, previous, current):  # pylint: disable=unused-argument
+        """Log progress of polled task which changed.
+
+        :param str task_uuid: Uuid of the task.
+        :param dict previous: Previous task details or None.
+        :param dict current: Current task details.
+        :return: None
+
+        """
+        logger.debug(
+            'Task %s (%s) is %s, %s%% complete',
+            current.get('operation_type'), task_uuid,
+            current.get('progress_status'), current.get('percentage_complete')
+        )
+
+    @staticmethod
+    def __record_task(task_info):
+        """Record Prism side duration of finished task in metrics and
+        profiling timeline.
+
+        :param Task task_info: Finished task.
+        :return: None
+
+        """
+        if not task_info.complete_time_usecs:
+            return
+        duration = (task_info.complete_time_usecs - task_info.create_time_usecs) / 10.0 ** 6
+        TASK_DURATION.observe(
+            duration,
+            operation_type=task_info.operation_type,
+            status=task_info.progress_status
+        )
+        tracer.add_async(
+            task_info.operation_type, 'task',
+            task_info.create_time_usecs / 10.0 ** 6,
+            duration,
+            task_info.uuid,
+            status=task_info.progress_status
+        )
+
+    def __long_poll_tasks(self, task_uuids):
+        """Wait on Prism side for any of tasks to finish.
 
+        :param set task_uuids: Uuids of tasks to wait for.
+        :return: List of finished tasks details (empty on timeout) or None
+            if Prism does not support tasks/poll endpoint.
+        :rtype: list
+        :raises HTTPError: If API call was not successful.
+
+        """
+        try:
+            response = self.api.tasks_poll(task_uuids, self.POLL_TIMEOUT)
+        except HTTPError as error:
+            if error.response is None or \
+                    error.response.status_code not in self.POLL_UNSUPPORTED_STATUSES:
+                raise
+            logger.info('Tasks long polling is not supported. Falling back to polling')
+            self.long_poll_supported = False
+            return None
+
+        if response.get('is_timeout'):
             logger.info(
-                'Task %s (%s) is currently %s complete. Waiting %s seconds before another check',
-                task_info['operation_type'],
-                task_info['uuid'],
-                task_info['percentage_complete'],
-                self.SLEEP_TIME
+                '%s task(s) still running after %s seconds of polling',
+                len(task_uuids), self.POLL_TIMEOUT
             )
-            time.sleep(self.SLEEP_TIME)
+        return [
+            task_info for task_info in (
+                Task.from_api(task_data) for task_data in response.get('completed_tasks_info') or []
+            ) if self.__is_task_finished(task_info)
+        ]
+
+    def __is_task_finished(self, task_info):
+        """Check whether task reached its final state.
+
+        :param Task task_info: The task.
+        :return: True if task succeeded or failed.
+        :rtype: bool
+
+        """
+        if task_info.progress_status in self.TASK_FAILED_STATUSES:
+            return True
+        return all([
+            task_info.percentage_complete == 100,
+            task_info.progress_status == self.TASK_SUCCEEDED
+        ])
 
     def get_image(self, image_name):
         """Get OS image with specified name.
 
         :param str image_name: Name of Image to be found.
-        :return: Dictionary with detailed information about image with specified name.
-        :rtype: dict
+        :return: Image with specified name.
+        :rtype: Image
         :raises ItemDoesNotExist: If Image with specified name is not found.
         :raises InvalidNumberOfItems: If more than one Image with specified name was found.
         :raises HTTPError: If API call was not successful.
 
         """
-        images = [
-            image for image in self.api.images()['entities'] if image['name'] == image_name
-        ]
-
-        if len(images) == 1:
-            return images[0]
-
-        if not images:
-            raise ItemDoesNotExist(
-                ItemDoesNotExist.MESSAGE.format('image', image_name)
-            )
-
-        raise InvalidNumberOfItems(
-            InvalidNumberOfItems.INVALID_COUNT.format(
-                len(images), 'images', image_name, 1
-            )
+        return self.__get_cached_entity(
+            cache.IMAGES, image_name, self.__fetch_images, self.__fetch_images
         )
 
-    def create_image(self, image_name, storage_container_name, os_image_url):
+    def create_image(self, image_name, storage_container_name, os_image_url, digest=None):
         """Create Operating System's Image.
         This method call asynchronous operation and wait for it to report success
         or failure.
@@ -647,11 +1510,14 @@ class Nutanix(object):
         :param str image_name: Name of the Image.
         :param str storage_container_name: Name of Storage Container for OS Image.
         :param str os_image_url: Url of the OS Image to be downloaded.
+        :param str digest: Sha256 digest of image content recorded in image annotation.
         :return: None
+        :raises ItemDoesNotExist: If Storage Container is not found.
         :raises TaskFailed: If Task has status 'Failed'.
         :raises HTTPError: If API call was not successful.
 
         """
+        self.get_storage_container(storage_container_name)
         data = {
             "name": image_name,
             "image_type": "DISK_IMAGE",
@@ -660,46 +1526,197 @@ class Nutanix(object):
                 "url": os_image_url
             }
         }
+        if digest:
+            data['annotation'] = image_annotation(digest)
 
-        self.wait_for_task(
-            self.api.images_create(data)
-        )
+        try:
+            self.wait_for_task(
+                self.api.images_create(data)
+            )
+        finally:
+            self.cache.invalidate(cache.IMAGES)
+
+    def get_image_by_digest(self, digest):
+        """Get OS image with content of given digest, regardless of its name.
+
+        :param str digest: Sha256 digest of image content.
+        :return: Image or None if no image is annotated with the digest.
+        :rtype: Image
+        :raises HTTPError: If API call was not successful.
+
+        """
+        images = [
+            image for image in self.cache.list(cache.IMAGES, self.__fetch_images)
+            if annotated_digest(image) == digest and image.vm_disk_id
+        ]
+        return sorted(images, key=lambda image: image.name)[0] if images else None
+
+    def find_os_image(self, image_name, digest=None):
+        """Find OS image without importing it: image with content of given
+        digest, or image with requested name unless it is annotated with
+        different digest.
+
+        :param str image_name: Name of OS image.
+        :param str digest: Sha256 digest of expected content.
+        :return: Image or None if there is no matching image.
+        :rtype: Image
+        :raises InvalidNumberOfItems: If more than one Image with specified name was found.
+        :raises HTTPError: If API call was not successful.
+
+        """
+        if digest:
+            image = self.get_image_by_digest(digest)
+            if image:
+                return image
+
+        try:
+            image = self.get_image(image_name)
+        except ItemDoesNotExist:
+            return None
+        if digest and annotated_digest(image) not in (None, digest):
+            return None
+        return image
 
-    def get_or_create_os_image(self, image_name, storage_container_name, os_image_url):
+    def get_or_create_os_image(self, image_name, storage_container_name, os_image_url,
+                               digest=None):
         """Get or create OS image with specified name.
         In case of image creation this method call asynchronous operation
         and wait for it to report success or failure.
 
+        If content digest is given, image with identical content is reused under
+        any name. Image with requested name but different content is treated
+        as stale and new image, named with digest suffix, is imported instead.
+
         :param str image_name: Name of OS image to be found/created.
         :param str storage_container_name: Name of Storage Container for OS Images.
         :param str os_image_url: Url used to download OS Image.
-        :return: Dictionary with detailed information about requested image.
-        :rtype: dict
+        :param str digest: Sha256 digest of content available under os_image_url.
+        :return: Requested image.
+        :rtype: Image
         :raises TaskFailed: If Task has status 'Failed'.
         :raises HTTPError: If API call was not successful.
 
         """
         image = None
 
-        try:
-            image = self.get_image(image_name)
-        except ItemDoesNotExist:
-            self.create_image(image_name, storage_container_name, os_image_url)
-
-        if not image:
-            image = self.get_image(image_name)
+        if digest:
+            with self.creation_lock('image_digest', digest):
+                image = self.get_image_by_digest(digest)
+                if image:
+                    logger.info(
+                        'Reusing image %s with the same content as %s', image.name, os_image_url
+                    )
+                    return image
+
+                try:
+                    image = self.get_image(image_name)
+                except ItemDoesNotExist:
+                    pass
+                else:
+                    if annotated_digest(image) is None:
+                        logger.warning(
+                            'Image %s has no content digest, assuming it matches %s',
+                            image_name, os_image_url
+                        )
+                        return image
+                    logger.warning(
+                        'Image %s is stale (content %s differs from %s)',
+                        image_name, annotated_digest(image), digest
+                    )
+                    image_name = '{}-{}'.format(image_name, digest[:12])
+                    image = None
+
+        with self.creation_lock('image', image_name):
+            try:
+                image = self.get_image(image_name)
+            except ItemDoesNotExist:
+                self.create_image(image_name, storage_container_name, os_image_url, digest)
+
+            if not image:
+                image = self.get_image(image_name)
 
         return image
 
+    def delete_vm(self, vm_uuid):
+        """Delete Virtual Machine.
+        This method call asynchronous operation and wait for it to report success
+        or failure.
+
+        :param str vm_uuid: ID number of Virtual Machine.
+        :return: None
+        :raises TaskFailed: If deletion task failed.
+        :raises HTTPError: If API call was not successful.
+
+        """
+        self.wait_for_task(self.api.vms_delete(vm_uuid))
+
+    def set_vm_description(self, vm_uuid, description):
+        """Change description of Virtual Machine.
+        This method call asynchronous operation and wait for it to report success
+        or failure.
+
+        :param str vm_uuid: ID number of Virtual Machine.
+        :param str description: New description.
+        :return: None
+        :raises TaskFailed: If update task failed.
+        :raises HTTPError: If API call was not successful.
+
+        """
+        self.wait_for_task(self.api.vms_update(vm_uuid, {'description': description}))
+
     def set_vm_power(self, vm_uuid, state):
         """Set Virtual Machine to specified state.
         This method call asynchronous operation.
 
         :param str vm_uuid: ID number of Virtual Machine.
         :param str state: State for Virtual Machine to be set to.
-        :return: None.
+        :return: Dictionary with 'task_uuid'.
+        :rtype: dict
         :raises HTTPError: If API call was not successful.
 
         """
         data = {'transition': state}
-        self.api.vms_set_power_state(vm_uuid, data)
+        return self.api.vms_set_power_state(vm_uuid, data)
+
+    def set_vms_power(self, vm_uuids, state):
+        """Set many Virtual Machines to specified state.
+        Transitions are requested concurrently (at most max_in_flight at once)
+        and all resulting tasks are waited for together.
+
+        :param iterable vm_uuids: ID numbers of Virtual Machines.
+        :param str state: State for Virtual Machines to be set to.
+        :return: Dictionary with vm uuid as key and finished task as value.
+        :rtype: dict
+        :raises HTTPError: If API call was not successful.
+
+        """
+        requests_vms = {
+            self.async_nutanix.set_vm_power(vm_uuid, state): vm_uuid
+            for vm_uuid in vm_uuids
+        }
+        tasks_vms = {}
+        for future in as_completed(requests_vms):
+            tasks_vms[future.result()['task_uuid']] = requests_vms[future]
+
+        results = {
+            tasks_vms[task_info.uuid]: task_info
+            for task_info in self.wait_for_tasks(tasks_vms, raise_on_failure=False)
+        }
+        logger.info(
+            'Power state %s set for %s of %s vms',
+            state,
+            len([task for task in results.values() if self.is_task_succeeded(task)]),
+            len(results)
+        )
+        return results
+
+    @classmethod
+    def is_task_succeeded(cls, task_info):
+        """Check whether finished task succeeded.
+
+        :param Task task_info: Finished task.
+        :return: True if task succeeded.
+        :rtype: bool
+
+        """
+        return task_info.progress_status == cls.TASK_SUCCEEDED
@@ -0,0 +1,133 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Module containing concurrent counterparts of Nutanix API wrapper classes.
+
+Every method returns :class:`concurrent.futures.Future` instead of the result,
+so independent calls (e.g. power-on of many vms) can overlap.
+Calls are executed by a bounded pool of threads sharing keep-alive connections
+of the wrapped synchronous client.
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from nutanix_scripts.profiling import cprofiler
+
+DEFAULT_MAX_IN_FLIGHT = 16
+
+
+def _async_call(name):
+    """Create method which submits synchronous method with given name to executor.
+
+    :param str name: Name of wrapped synchronous method.
+    :return: Method returning Future of wrapped method result.
+    :rtype: function
+
+    """
+    def method(self, *args, **kwargs):
+        return self.submit(getattr(self.wrapped, name), *args, **kwargs)
+
+    method.__name__ = name
+    method.__doc__ = 'Asynchronous version of {}. Returns Future.'.format(name)
+    return method
+
+
+class _AsyncWrapper(object):
+    """Base for wrappers executing calls of synchronous object in thread pool."""
+
+    def __init__(self, wrapped, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """Create thread pool for wrapped object calls.
+
+        :param object wrapped: Synchronous object which calls are wrapped.
+        :param int max_in_flight: Maximal number of calls executed at once.
+
+        """
+        self.wrapped = wrapped
+        self.max_in_flight = max_in_flight
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+
+    def submit(self, function, *args, **kwargs):
+        """Schedule function call in thread pool.
+
+        :param callable function: Function to be called.
+        :return: Future of function result.
+        :rtype: Future
+
+        """
+        return self.executor.submit(cprofiler.call, function, *args, **kwargs)
+
+    def map(self, function, *iterables):
+        """Call function concurrently for every set of arguments.
+
+        :param callable function: Function to be called.
+        :return: Generator of results in order of arguments.
+        :rtype: generator
+
+        """
+        return self.executor.map(function, *iterables)
+
+    def shutdown(self, wait=True):
+        """Stop accepting new calls and release threads.
+
+        :param bool wait: Whether to wait for pending calls.
+        :return: None
+
+        """
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+
+class AsyncNutanixApi(_AsyncWrapper):
+    """Concurrent wrapper on :class:`nutanix_scripts.api.NutanixApi`"""
+    cluster = _async_call('cluster')
+    vms = _async_call('vms')
+    vm = _async_call('vm')
+    vms_create = _async_call('vms_create')
+    vms_clone = _async_call('vms_clone')
+    vms_update = _async_call('vms_update')
+    vms_delete = _async_call('vms_delete')
+    vms_set_power_state = _async_call('vms_set_power_state')
+    tasks = _async_call('tasks')
+    tasks_poll = _async_call('tasks_poll')
+    networks = _async_call('networks')
+    images = _async_call('images')
+    images_create = _async_call('images_create')
+    storage_containers = _async_call('storage_containers')
+
+
+class AsyncNutanix(_AsyncWrapper):
+    """Concurrent wrapper on :class:`nutanix_scripts.api.Nutanix`
+    Methods which fan out through this wrapper themselves (clone_vm and
+    set_vms_power) are not wrapped, so they never wait for the pool they run in.
+
+    """
+    get_vms = _async_call('get_vms')
+    get_vms_property = _async_call('get_vms_property')
+    get_vm = _async_call('get_vm')
+    create_vm = _async_call('create_vm')
+    get_or_create_vm = _async_call('get_or_create_vm')
+    delete_vm = _async_call('delete_vm')
+    set_vm_description = _async_call('set_vm_description')
+    get_network = _async_call('get_network')
+    wait_for_task = _async_call('wait_for_task')
+    wait_for_tasks = _async_call('wait_for_tasks')
+    get_image = _async_call('get_image')
+    create_image = _async_call('create_image')
+    get_or_create_os_image = _async_call('get_or_create_os_image')
+    set_vm_power = _async_call('set_vm_power')
+
@@ -0,0 +1,218 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Cache for rarely changing Nutanix entities (networks, images, containers)"""
+import json
+import os
+import threading
+import time
+
+from nutanix_scripts.entities import to_json, Image, Network, StorageContainer
+from nutanix_scripts.logger import logger
+
+NETWORKS = 'networks'
+IMAGES = 'images'
+STORAGE_CONTAINERS = 'storage_containers'
+
+# Entities of cached types, restored from their dictionary form in cache file.
+ENTITY_CLASSES = {
+    NETWORKS: Network,
+    IMAGES: Image,
+    STORAGE_CONTAINERS: StorageContainer
+}
+
+
+class MetadataCache(object):
+    """Name indexes of Nutanix entities kept for limited time.
+    Optionally indexes are stored in file so they survive between runs.
+    Index can be incomplete when only entities with looked up names were
+    fetched, listing of all entities fetches complete index.
+    Only found entities are cached: entity missing from the index may have
+    been created in Prism since, so every miss is looked up in Prism again.
+
+    """
+    DEFAULT_TTLS = {
+        NETWORKS: 3600,
+        IMAGES: 600,
+        STORAGE_CONTAINERS: 3600
+    }
+
+    def __init__(self, ttls=None, path=None):
+        """Prepare cache and load its content from file if given.
+
+        :param dict ttls: Number of seconds entries are valid per entity type.
+        :param str path: Path of file used as persistent store.
+
+        """
+        self.ttls = dict(self.DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            try:
+                with open(path) as cache_file:
+                    self.entries = json.load(cache_file)
+            except ValueError:
+                logger.warning('Ignoring corrupted metadata cache %s', path)
+            else:
+                self.__restore_entities()
+                logger.debug('Loaded metadata cache from %s', path)
+
+    def __restore_entities(self):
+        """Convert entities loaded from file to entity objects.
+
+        :return: None
+
+        """
+        for entity_type, entry in self.entries.items():
+            entity_class = ENTITY_CLASSES.get(entity_type)
+            if entity_class is None:
+                continue
+            entry['index'] = {
+                name: [entity_class.from_api(entity) for entity in entities]
+                for name, entities in entry['index'].items()
+            }
+
+    def get(self, entity_type, name, fetch, fetch_named=None):
+        """Get entities of given type with specified name.
+        Entities missing from valid index are fetched from Prism: all of them
+        (and indexed again) or, with fetch_named, only those with given name.
+        Names not found in Prism are not cached.
+
+        :param str entity_type: Type of entity e.g. 'networks'.
+        :param str name: Name of entity.
+        :param callable fetch: Function returning list of all entities of the type.
+        :param callable fetch_named: Function returning list of entities which
+            include all entities with name given as argument.
+        :return: List of entities with given name.
+        :rtype: list
+        :raises HTTPError: If fetching entities was not successful.
+
+        """
+        with self.lock:
+            entry = self.__valid_entry(entity_type)
+            if entry is not None and name in entry['index']:
+                return list(entry['index'][name])
+
+            if fetch_named is None:
+                return list(self.__fetch(entity_type, fetch)['index'].get(name, []))
+
+            logger.debug('Fetching %s %s to metadata cache', entity_type, name)
+            entities = [entity for entity in fetch_named(name) if entity['name'] == name]
+            if entities:
+                if entry is None:
+                    entry = {'fetched_at': time.time(), 'complete': False, 'index': {}}
+                    self.entries[entity_type] = entry
+                entry['index'][name] = entities
+                self.__save()
+            return list(entities)
+
+    def list(self, entity_type, fetch):
+        """Get all entities of given type.
+
+        :param str entity_type: Type of entity e.g. 'images'.
+        :param callable fetch: Function returning list of all entities of the type.
+        :return: List of entities.
+        :rtype: list
+        :raises HTTPError: If fetching entities was not successful.
+
+        """
+        with self.lock:
+            return [
+                entity for entities in self.__entry(entity_type, fetch)['index'].values()
+                for entity in entities
+            ]
+
+    def __entry(self, entity_type, fetch):
+        """Get complete index of given entity type, fetching it again if
+        expired or incomplete.
+        Needs to be called with lock held.
+
+        :param str entity_type: Type of entity e.g. 'networks'.
+        :param callable fetch: Function returning list of all entities of the type.
+        :return: Dictionary with 'fetched_at' time, 'complete' flag and name 'index'.
+        :rtype: dict
+        :raises HTTPError: If fetching entities was not successful.
+
+        """
+        entry = self.__valid_entry(entity_type)
+        if entry is None or not entry['complete']:
+            entry = self.__fetch(entity_type, fetch)
+        return entry
+
+    def __fetch(self, entity_type, fetch):
+        """Fetch all entities of given type and index them again.
+        Needs to be called with lock held.
+
+        :param str entity_type: Type of entity e.g. 'networks'.
+        :param callable fetch: Function returning list of all entities of the type.
+        :return: Dictionary with 'fetched_at' time, 'complete' flag and name 'index'.
+        :rtype: dict
+        :raises HTTPError: If fetching entities was not successful.
+
+        """
+        logger.debug('Fetching %s to metadata cache', entity_type)
+        index = {}
+        for entity in fetch():
+            index.setdefault(entity['name'], []).append(entity)
+        entry = {'fetched_at': time.time(), 'complete': True, 'index': index}
+        self.entries[entity_type] = entry
+        self.__save()
+        return entry
+
+    def __valid_entry(self, entity_type):
+        """Get index of given entity type if it did not expire.
+        Needs to be called with lock held.
+
+        :param str entity_type: Type of entity e.g. 'networks'.
+        :return: Dictionary with 'fetched_at' time, 'complete' flag and name
+            'index' or None.
+        :rtype: dict
+
+        """
+        entry = self.entries.get(entity_type)
+        if entry is None or \
+                time.time() - entry['fetched_at'] > self.ttls.get(entity_type, 0):
+            return None
+        return entry
+
+    def invalidate(self, entity_type):
+        """Drop index of given entity type, e.g. after entity creation.
+
+        :param str entity_type: Type of entity e.g. 'images'.
+        :return: None
+
+        """
+        with self.lock:
+            if self.entries.pop(entity_type, None) is not None:
+                self.__save()
+
+    def __save(self):
+        """Write cache content to the file atomically (if path was given).
+
+        :return: None
+
+        """
+        if not self.path:
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'w') as cache_file:
+            json.dump(self.entries, cache_file, default=to_json)
+        os.rename(tmp_path, self.path)
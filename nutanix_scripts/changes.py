@@ -0,0 +1,187 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Detection of changes in repeatedly polled Nutanix entities.
+
+Conditional responses remember validators (ETag, Last-Modified) and decoded
+body of last response for every polled url. Prism answering 304 Not Modified,
+or sending byte for byte the same body, costs no decoding: previously decoded
+object is returned again.
+
+Change detector compares polled entities with their previous version and
+notifies subscribers about changes, so polling loops don't diff dictionaries.
+
+"""
+import collections
+import hashlib
+import threading
+
+from nutanix_scripts.logger import logger
+
+
+class ConditionalResponse(object):
+    """Validators and decoded body of the last response of single url."""
+    __slots__ = ('etag', 'last_modified', 'digest', 'result')
+
+    def __init__(self):
+        """Create entry without response."""
+        self.etag = None
+        self.last_modified = None
+        self.digest = None
+        self.result = None
+
+    def request_headers(self):
+        """Get headers making request conditional on the last response.
+
+        :return: Dictionary of request headers, empty without validators.
+        :rtype: dict
+
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def update(self, response, decode):
+        """Remember response, decoding its body only if it changed.
+
+        :param requests.Response response: Downloaded response.
+        :param callable decode: Function decoding the response.
+        :return: Decoded body and whether it changed.
+        :rtype: tuple
+
+        """
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+        digest = hashlib.sha1(response.content).digest()
+        if digest == self.digest:
+            return self.result, False
+        self.result = decode(response)
+        self.digest = digest
+        return self.result, True
+
+
+class ConditionalResponses(object):
+    """Last responses of polled urls, least recently used are dropped."""
+    MAX_ENTRIES = 4096
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        """Create empty store.
+
+        :param int max_entries: Maximal number of remembered urls.
+
+        """
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def entry(self, url):
+        """Get entry of url, creating empty one for url polled first time.
+
+        :param str url: Polled url.
+        :return: Entry of the url.
+        :rtype: ConditionalResponse
+
+        """
+        with self.lock:
+            entry = self.entries.pop(url, None)
+            if entry is None:
+                entry = ConditionalResponse()
+                if len(self.entries) >= self.max_entries:
+                    self.entries.popitem(last=False)
+            self.entries[url] = entry
+            return entry
+
+
+class ChangeDetector(object):
+    """Tracker of entities versions notifying subscribers about changes.
+
+    Subscribers are called with (key, previous, current) where previous is
+    None for entity seen first time.
+
+    """
+
+    def __init__(self, fields=None):
+        """Create detector without known entities.
+
+        :param tuple fields: Fields compared between versions, whole entities
+            are compared if not given.
+
+        """
+        self.fields = tuple(fields) if fields else None
+        self.versions = {}
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """Call callback on every change.
+
+        :param callable callback: Function called with key, previous and current entity.
+        :return: None
+
+        """
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """Stop calling callback on changes.
+
+        :param callable callback: Subscribed function.
+        :return: None
+
+        """
+        self.subscribers.remove(callback)
+
+    def __fingerprint(self, entity):
+        """Get part of entity compared between versions.
+
+        :param entity: Dictionary or entity.
+        :return: Compared values.
+
+        """
+        if self.fields is None:
+            return entity
+        return tuple(entity.get(field) for field in self.fields)
+
+    def update(self, key, entity):
+        """Record current version of entity, notifying subscribers if it changed.
+
+        :param key: Identifier of entity e.g. vm name.
+        :param entity: Current version of entity.
+        :return: True if entity changed (or was seen first time).
+        :rtype: bool
+
+        """
+        with self.lock:
+            previous = self.versions.get(key)
+            # Unchanged conditional response is the very same object.
+            if previous is not None and (previous[1] is entity or
+                                         previous[0] == self.__fingerprint(entity)):
+                return False
+            self.versions[key] = (self.__fingerprint(entity), entity)
+
+        logger.debug('Entity %s changed', key)
+        for callback in list(self.subscribers):
+            callback(key, previous[1] if previous else None, entity)
+        return True
+
+    def forget(self, key):
+        """Stop tracking entity, e.g. after it reached awaited state.
+
+        :param key: Identifier of entity.
+        :return: None
+
+        """
+        with self.lock:
+            self.versions.pop(key, None)
@@ -0,0 +1,107 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Encoding of Nutanix API request and response bodies.
+
+JSON backend is chosen from installed modules: ujson and simplejson (with
+C speedups) are used when available, standard json module otherwise.
+Compressed responses are accepted by requests itself, which sends
+Accept-Encoding: gzip, deflate by default and transparently decompresses
+responses, also streamed listings. Codec only states it explicitly and lets
+compression be turned off (Accept-Encoding: identity), e.g. when Prism or
+a proxy spends more time compressing than the network saves.
+
+"""
+import importlib
+import json
+
+from nutanix_scripts.exceptions import ConfigurationError
+from nutanix_scripts.logger import logger
+
+AUTO = 'auto'
+# JSON modules in order of preference of automatic choice.
+BACKENDS = ('ujson', 'simplejson', 'json')
+
+
+def load_backend(name=AUTO):
+    """Import JSON module with dumps/loads functions.
+
+    :param str name: Name of module or 'auto' for the fastest installed one.
+    :return: Name of module and the module.
+    :rtype: tuple
+    :raises ConfigurationError: If requested module is unknown or not installed.
+
+    """
+    if name != AUTO and name not in BACKENDS:
+        raise ConfigurationError(ConfigurationError.UNKNOWN_JSON_BACKEND.format(
+            name, ', '.join((AUTO,) + BACKENDS)
+        ))
+
+    for candidate in BACKENDS if name == AUTO else (name,):
+        try:
+            return candidate, importlib.import_module(candidate)
+        except ImportError:
+            if name != AUTO:
+                raise ConfigurationError(ConfigurationError.UNKNOWN_JSON_BACKEND.format(
+                    name, ', '.join((AUTO,) + BACKENDS)
+                ))
+    return 'json', json
+
+
+class JsonCodec(object):
+    """Serializer of request bodies and deserializer of response bodies."""
+
+    def __init__(self, backend=AUTO, compression=True):
+        """Choose JSON backend and transport encoding.
+
+        :param str backend: Name of JSON module or 'auto'.
+        :param bool compression: Accept compressed responses (requests default),
+            False asks Prism for uncompressed ones.
+        :raises ConfigurationError: If requested backend is not available.
+
+        """
+        self.backend, module = load_backend(backend)
+        self.dumps = module.dumps
+        self.loads = module.loads
+        self.compression = compression
+        # Headers added to every request of the session.
+        self.headers = {
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate' if compression else 'identity'
+        }
+        logger.debug(
+            'Using %s JSON backend, compression %s',
+            self.backend, 'enabled' if compression else 'disabled'
+        )
+
+    def encode(self, data):
+        """Serialize request body.
+
+        :param dict data: Request data.
+        :return: JSON document.
+        :rtype: str
+
+        """
+        return self.dumps(data)
+
+    def decode(self, response):
+        """Deserialize body of downloaded response.
+        Raw bytes are decoded directly, without charset detection of
+        `response.text` and `response.json()`.
+
+        :param requests.Response response: Response with JSON body.
+        :return: Decoded document.
+        :raises ValueError: If body is not valid JSON.
+
+        """
+        return self.loads(response.content)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Ansible dynamic inventory of kubernetes cluster vms.
+
+Usage: ansible-playbook -i nutanix_scripts/dynamic_inventory.py ...
+with NUTANIX_CLUSTER and K8S_CLUSTER environment variables set.
+
+Inventory is answered from local snapshot of cluster vms, written by the
+installer and refreshed from Nutanix only when older than K8S_INVENTORY_TTL
+seconds. Refresh lists cluster vms once and asks for ips only vms which are
+new or had no ip, so vms known from snapshot don't cost any API call.
+Installer modules are imported only for refresh, so answering from snapshot
+takes milliseconds.
+
+Refresh never asks for credentials: it reuses stored Prism session or logs in
+with NUTANIX_USERNAME and NUTANIX_PASSWORD, otherwise snapshot is used as it is.
+Stdout carries only the inventory, diagnostics go to stderr and installer log
+is not touched.
+
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+# Ansible runs the script directly, so installer modules are found from its location.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# Directory with snapshots of clusters' vms.
+SNAPSHOT_FILE = os.path.join('.cache', 'inventory', '{}.json')
+DEFAULT_TTL = 600
+
+NUTANIX_CLUSTER_ENV = 'NUTANIX_CLUSTER'
+K8S_CLUSTER_ENV = 'K8S_CLUSTER'
+TTL_ENV = 'K8S_INVENTORY_TTL'
+
+ROLE_GROUPS = (
+    ('master', 'kube-master'),
+    ('worker', 'kube-node')
+)
+STATIC_GROUPS = {
+    'etcd': {'children': ['kube-master']},
+    'k8s-cluster': {
+        'children': ['kube-node', 'kube-master'],
+        'vars': {
+            'ansible_become': True,
+            'ansible_ssh_common_args': '-o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no'
+        }
+    }
+}
+
+
+def snapshot_path(k8s_cluster_name):
+    """Get path of cluster snapshot.
+
+    :param str k8s_cluster_name: Name (domain) of Kubernetes cluster.
+    :return: Absolute path of snapshot file.
+    :rtype: str
+
+    """
+    return os.path.abspath(SNAPSHOT_FILE.format(k8s_cluster_name))
+
+
+def load_snapshot(k8s_cluster_name):
+    """Load snapshot of cluster vms.
+
+    :param str k8s_cluster_name: Name (domain) of Kubernetes cluster.
+    :return: Snapshot with 'fetched_at' time and 'vms' dictionary or None
+        if there is no valid snapshot.
+    :rtype: dict
+
+    """
+    try:
+        with open(snapshot_path(k8s_cluster_name)) as snapshot_file:
+            return json.load(snapshot_file)
+    except (IOError, ValueError):
+        return None
+
+
+def write_snapshot(k8s_cluster_name, vms):
+    """Write snapshot of cluster vms atomically.
+
+    :param str k8s_cluster_name: Name (domain) of Kubernetes cluster.
+    :param dict vms: Dictionary with vm name as key and dictionary with
+        'uuid' and 'ips' as value.
+    :return: Written snapshot.
+    :rtype: dict
+
+    """
+    path = snapshot_path(k8s_cluster_name)
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    snapshot = {'fetched_at': time.time(), 'vms': vms}
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'w') as snapshot_file:
+        json.dump(snapshot, snapshot_file)
+    os.rename(tmp_path, path)
+    return snapshot
+
+
+def refresh_snapshot(nutanix, k8s_cluster_name, snapshot=None):
+    """Update snapshot with current state of cluster vms.
+    Vms known from snapshot keep their ips, only new vms and vms without
+    ip are asked for addresses.
+
+    :param Nutanix nutanix: Connected Nutanix wrapper.
+    :param str k8s_cluster_name: Name (domain) of Kubernetes cluster.
+    :param dict snapshot: Previous snapshot.
+    :return: Refreshed snapshot.
+    :rtype: dict
+    :raises HTTPError: If API call was not successful.
+
+    """
+    known = (snapshot or {}).get('vms', {})
+    vms = {}
+    queries = {}
+    for vm in nutanix.iter_vms(vm_domain=k8s_cluster_name, include_ips=False):
+        previous = known.get(vm.name)
+        if previous and previous['ips'] and previous.get('uuid') in (None, vm.uuid):
+            vms[vm.name] = {'uuid': vm.uuid, 'ips': previous['ips']}
+        else:
+            queries[vm.name] = (vm.uuid, nutanix.async_api.vm(vm.uuid))
+
+    for name, (vm_uuid, future) in queries.items():
+        vms[name] = {'uuid': vm_uuid, 'ips': future.result().get('ipAddresses') or []}
+
+    return write_snapshot(k8s_cluster_name, vms)
+
+
+def inventory(snapshot):
+    """Build Ansible inventory from snapshot.
+
+    :param dict snapshot: Snapshot of cluster vms.
+    :return: Inventory in Ansible dynamic inventory format.
+    :rtype: dict
+
+    """
+    result = dict((group, dict(content)) for group, content in STATIC_GROUPS.items())
+    hostvars = {}
+    for role, group in ROLE_GROUPS:
+        result[group] = {'hosts': sorted(
+            name for name, vm in snapshot['vms'].items()
+            if name.startswith(role) and vm['ips']
+        )}
+        for name in result[group]['hosts']:
+            hostvars[name] = {'ansible_ssh_host': snapshot['vms'][name]['ips'][0]}
+
+    result['_meta'] = {'hostvars': hostvars}
+    return result
+
+
+def get_snapshot(k8s_cluster_name, nutanix_cluster_name, ttl, force_refresh=False):
+    """Get snapshot of cluster vms, refreshing it if expired.
+    Expired snapshot is used when Nutanix can't be reached.
+
+    :param str k8s_cluster_name: Name (domain) of Kubernetes cluster.
+    :param str nutanix_cluster_name: Name of Nutanix cluster from config file.
+    :param int ttl: Number of seconds snapshot is valid.
+    :param bool force_refresh: Refresh snapshot regardless of its age.
+    :return: Snapshot of cluster vms.
+    :rtype: dict
+
+    """
+    snapshot = load_snapshot(k8s_cluster_name)
+    if snapshot and not force_refresh and time.time() - snapshot['fetched_at'] <= ttl:
+        return snapshot
+
+    # Root handler makes installer logger skip its basicConfig, which would
+    # truncate installer log. Its console handler writes warnings to stderr.
+    logging.getLogger().addHandler(logging.NullHandler())
+    logging.getLogger().setLevel(logging.WARNING)
+    try:
+        # Imported only for refresh, snapshot answers don't need API client.
+        from nutanix_scripts.api import Nutanix
+        from nutanix_scripts.prepare_kubernetes_env import create_nutanix
+
+        nutanix = create_nutanix(nutanix_cluster_name, credentials=Nutanix.env_credentials)
+        return refresh_snapshot(nutanix, k8s_cluster_name, snapshot)
+    except Exception as error:  # pylint: disable=broad-except
+        if snapshot is None:
+            raise
+        sys.stderr.write('Using expired inventory snapshot, refresh failed: {}\n'.format(error))
+        return snapshot
+
+
+def main():
+    """Print inventory (--list) or variables of single host (--host).
+
+    :return: None
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--list', action='store_true', help='Print whole inventory')
+    group.add_argument('--host', help='Print variables of given host')
+    parser.add_argument('--refresh', action='store_true', help='Refresh snapshot from Nutanix')
+    args = parser.parse_args()
+
+    snapshot = get_snapshot(
+        os.environ[K8S_CLUSTER_ENV],
+        os.environ.get(NUTANIX_CLUSTER_ENV),
+        int(os.environ.get(TTL_ENV, DEFAULT_TTL)),
+        args.refresh
+    )
+    result = inventory(snapshot)
+    if args.host is not None:
+        result = result['_meta']['hostvars'].get(args.host, {})
+
+    json.dump(result, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == "__main__":
+    main()
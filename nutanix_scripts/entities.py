@@ -0,0 +1,246 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compact representations of Nutanix entities.
+
+Prism responses describe every entity with many fields the installer never
+reads (nested disk and nic configs, timestamps). Entities in
+this module keep only fields used by provisioning in slots, so large listings
+take a fraction of memory of decoded JSON.
+
+Entities can be read like the dictionaries they were created from, by Prism
+field names, so the same code handles entities and their dictionary form
+restored from journal or cache. Full response is kept in `raw` only when
+requested with keep_raw.
+
+"""
+
+
+class Entity(object):
+    """Base of Nutanix entities.
+    FIELDS are (attribute, Prism field names) pairs. Attribute gets value of
+    the first field present in response and is serialized under the first name.
+
+    """
+    __slots__ = ('raw',)
+    FIELDS = ()
+
+    def __init__(self, raw=None, **values):
+        """Create entity from attribute values, missing attributes are None.
+
+        :param dict raw: Full Prism response the entity was created from.
+        :param values: Values of attributes.
+
+        """
+        self.raw = raw
+        for attribute, _ in self.FIELDS:
+            setattr(self, attribute, values.pop(attribute, None))
+        if values:
+            raise TypeError('Unexpected {} attributes: {}'.format(
+                type(self).__name__, ', '.join(sorted(values))
+            ))
+
+    @classmethod
+    def from_api(cls, data, keep_raw=False):
+        """Create entity from Prism response (or its dictionary form).
+
+        :param dict data: Decoded entity.
+        :param bool keep_raw: Keep full response in `raw` attribute.
+        :return: Entity.
+        :rtype: Entity
+
+        """
+        entity = cls.__new__(cls)
+        entity.raw = data if keep_raw else None
+        for attribute, keys in cls.FIELDS:
+            value = None
+            for key in keys:
+                if key in data:
+                    value = data[key]
+                    break
+            setattr(entity, attribute, value)
+        return entity
+
+    def to_dict(self):
+        """Get dictionary form of entity, e.g. to be stored as JSON.
+
+        :return: Dictionary with Prism field names as keys.
+        :rtype: dict
+
+        """
+        return {keys[0]: getattr(self, attribute) for attribute, keys in self.FIELDS}
+
+    @classmethod
+    def attribute_of(cls, key):
+        """Get attribute keeping Prism field.
+
+        :param str key: Prism field name e.g. 'ipAddresses'.
+        :return: Name of attribute or None if field is not kept by entity.
+        :rtype: str
+
+        """
+        for attribute, keys in cls.FIELDS:
+            if key in keys:
+                return attribute
+        return None
+
+    def __getitem__(self, key):
+        """Get value by Prism field name.
+        Fields not kept by entity are looked up in `raw` if it was kept.
+
+        :param str key: Prism field name e.g. 'power_state'.
+        :return: Value of the field.
+        :raises KeyError: If entity has no such field.
+
+        """
+        attribute = self.attribute_of(key)
+        if attribute is not None:
+            return getattr(self, attribute)
+        if self.raw is not None:
+            return self.raw[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        """Get value by Prism field name or default if it is missing.
+
+        :param str key: Prism field name.
+        :param default: Value returned for missing or empty field.
+        :return: Value of the field.
+
+        """
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(attribute, getattr(self, attribute))
+            for attribute, _ in self.FIELDS
+        ))
+
+
+class Vm(Entity):
+    """Virtual Machine from v1 or v2 API."""
+    __slots__ = ('uuid', 'name', 'power_state', 'ip_addresses', 'description')
+    FIELDS = (
+        ('uuid', ('uuid', 'vmId')),
+        ('name', ('name', 'vmName')),
+        ('power_state', ('power_state', 'powerState')),
+        ('ip_addresses', ('ipAddresses',)),
+        ('description', ('description',))
+    )
+
+    @classmethod
+    def from_api(cls, data, keep_raw=False):
+        """Create vm from Prism response.
+        V2 responses have ips in nic configs.
+
+        :param dict data: Decoded vm.
+        :param bool keep_raw: Keep full response in `raw` attribute.
+        :return: Vm.
+        :rtype: Vm
+
+        """
+        vm = super(Vm, cls).from_api(data, keep_raw)
+        if vm.ip_addresses is None and 'vm_nics' in data:
+            vm.ip_addresses = [
+                address for nic in data['vm_nics']
+                for address in nic.get('ip_addresses') or [nic.get('ip_address')]
+                if address
+            ]
+        return vm
+
+
+class Task(Entity):
+    """Prism task."""
+    __slots__ = (
+        'uuid', 'operation_type', 'progress_status', 'percentage_complete',
+        'create_time_usecs', 'complete_time_usecs', 'meta_response',
+        'subtask_uuids', 'entities'
+    )
+    FIELDS = (
+        ('uuid', ('uuid',)),
+        ('operation_type', ('operation_type',)),
+        ('progress_status', ('progress_status',)),
+        ('percentage_complete', ('percentage_complete',)),
+        ('create_time_usecs', ('create_time_usecs',)),
+        ('complete_time_usecs', ('complete_time_usecs',)),
+        ('meta_response', ('meta_response', 'message')),
+        ('subtask_uuids', ('subtask_uuid_list',)),
+        ('entities', ('entity_list',))
+    )
+
+    def entity_uuids(self, entity_type):
+        """Get uuids of entities of given type the task refers to.
+
+        :param str entity_type: Prism entity type e.g. 'VM'.
+        :return: List of uuids.
+        :rtype: list
+
+        """
+        return [
+            entity['entity_id'] for entity in self.entities or ()
+            if entity.get('entity_type', '').upper() == entity_type.upper()
+        ]
+
+
+class Image(Entity):
+    """Disk image."""
+    __slots__ = ('uuid', 'name', 'vm_disk_id', 'annotation')
+    FIELDS = (
+        ('uuid', ('uuid',)),
+        ('name', ('name',)),
+        ('vm_disk_id', ('vm_disk_id',)),
+        ('annotation', ('annotation',))
+    )
+
+
+class Network(Entity):
+    """Virtual network."""
+    __slots__ = ('uuid', 'name', 'vlan_id')
+    FIELDS = (
+        ('uuid', ('uuid',)),
+        ('name', ('name',)),
+        ('vlan_id', ('vlan_id',))
+    )
+
+
+class StorageContainer(Entity):
+    """Storage container."""
+    __slots__ = ('uuid', 'name')
+    FIELDS = (
+        ('uuid', ('storage_container_uuid', 'uuid')),
+        ('name', ('name',))
+    )
+
+
+def to_json(value):
+    """Serialize entities with json.dump(..., default=to_json).
+
+    :param value: Value which JSON encoder can't serialize.
+    :return: Dictionary form of entity.
+    :rtype: dict
+    :raises TypeError: If value is not an entity.
+
+    """
+    if isinstance(value, Entity):
+        return value.to_dict()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
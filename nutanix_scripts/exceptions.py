@@ -22,9 +22,16 @@ class ConfigurationError(ValueError):
     MISSING_CLUSTER = 'Missing {} cluster configuration'
     MISSING_FIELD = 'Configuration missing field {}'
     INVALID_CREDENTIALS = 'Invalid credentials'
+    MISSING_CREDENTIALS = 'No stored Nutanix API session and {} or {} is not set'
     CONNECTION_PROBLEM = """Problem with connection to Nutanix API.
         Check your Nutanix Prism address, port and Prism connectivity"""
     INVALID_DOMAIN = "Kubernetes cluster name(domain) need to match RFC 1035"
+    INVALID_SCALE_OUT = 'Number of added workers must be positive'
+    MISSING_INVENTORY = 'Inventory {} does not exist or is not writable'
+    UNWRITABLE_SNAPSHOT = 'Inventory snapshot {} is not writable'
+    UNKNOWN_JSON_BACKEND = 'JSON backend {} is not available, choose one of: {}'
+    BAKE_REPORT_PORT = 'Can not listen for golden image bake reports on port {}: {}'
+    SHARED_BASE_VM = 'Clusters {} and {} share base vm {} on {} but their ssh keys differ'
 
 
 class InvalidNumberOfItems(Exception):
@@ -42,6 +49,17 @@ class TaskFailed(Exception):
     MESSAGE = 'Task Failed. Detailed info: {}'
 
 
+class BakingFailed(Exception):
+    """Exception for golden image baking which failed inside the vm"""
+    MESSAGE = 'Baking golden image of vm {} failed with exit status {}, see {} and ' \
+        'cloud-init logs on its disk. The vm was deleted'
+
+
+class WaitTimeout(Exception):
+    """Exception for waiting which exceeded its deadline"""
+    MESSAGE = 'Timeout after {} seconds while waiting for {}'
+
+
 class MissingKeys(Exception):
     """Exception for missingi/wrongly named ssh keys in ssh keys directory"""
     MESSAGE = "There weren't any file matching {} format in ssh keys directory"
@@ -0,0 +1,215 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Run this script to prepare environments for many kubernetes clusters at once"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import yaml
+
+from nutanix_scripts.exceptions import ConfigurationError
+from nutanix_scripts.logger import logger
+from nutanix_scripts.metrics import REGISTRY
+from nutanix_scripts.prepare_kubernetes_env import (
+    create_nutanix, generate_cloud_config, provision_cluster, INVENTORY_FILE, K8S_CONFIG
+)
+
+FLEET_CONFIG = 'configs/fleet.yml'
+INVENTORIES_DIR = 'inventories'
+SUMMARY_FILE = 'fleet_summary.json'
+
+DEFAULT_MAX_PARALLEL_CLUSTERS = 4
+DEFAULT_MAX_API_CALLS = 32
+DEFAULT_SSH_DIR = 'ssh_keys/'
+
+
+def get_fleet_config(config_path):
+    """Read fleet configuration and assign Nutanix cluster to every spec.
+    Specs without 'nutanix_cluster' are spread evenly over 'nutanix_clusters'.
+    Clones inherit cloud config of base vm, so specs sharing base vm on
+    a Nutanix cluster have to use the same ssh keys.
+
+    :param str config_path: Path to fleet config file.
+    :return: Fleet settings and list of cluster specs.
+    :rtype: tuple
+    :raises IOError: when file doesn't exist, or path is incorrect.
+    :raises ParseError: when file is not valid yml file.
+    :raises ConfigurationError: when configuration file is incorrect.
+    :raises MissingKeys: when ssh keys directory of a spec has no keys.
+
+    """
+    logger.info('Reading fleet configuration from %s', config_path)
+    with open(config_path) as conf_file:
+        data = yaml.safe_load(conf_file)
+
+    try:
+        specs = data['clusters']
+    except KeyError:
+        raise ConfigurationError(ConfigurationError.MISSING_SECTION.format('clusters'))
+
+    settings = {
+        'max_parallel_clusters': int(
+            data.get('max_parallel_clusters', DEFAULT_MAX_PARALLEL_CLUSTERS)
+        ),
+        'max_api_calls': int(data.get('max_api_calls', DEFAULT_MAX_API_CALLS))
+    }
+    nutanix_clusters = data.get('nutanix_clusters') or []
+    load = {name: 0 for name in nutanix_clusters}
+
+    for spec in specs:
+        for field in ('name', 'base_vm_name'):
+            if field not in spec:
+                raise ConfigurationError(ConfigurationError.MISSING_FIELD.format(field))
+        spec.setdefault('k8s_config', K8S_CONFIG)
+        spec.setdefault('ssh_dir', DEFAULT_SSH_DIR)
+        if spec.get('nutanix_cluster') in load:
+            load[spec['nutanix_cluster']] += 1
+
+    for spec in specs:
+        if 'nutanix_cluster' not in spec:
+            if not load:
+                raise ConfigurationError(
+                    ConfigurationError.MISSING_FIELD.format('nutanix_cluster')
+                )
+            spec['nutanix_cluster'] = min(nutanix_clusters, key=lambda name: load[name])
+            load[spec['nutanix_cluster']] += 1
+
+    base_vms = {}
+    for spec in specs:
+        key = (spec['nutanix_cluster'], spec['base_vm_name'])
+        cloud_config = generate_cloud_config(spec['ssh_dir'])
+        first_spec, first_cloud_config = base_vms.setdefault(key, (spec, cloud_config))
+        if cloud_config != first_cloud_config:
+            raise ConfigurationError(ConfigurationError.SHARED_BASE_VM.format(
+                first_spec['name'], spec['name'], spec['base_vm_name'], spec['nutanix_cluster']
+            ))
+
+    return settings, specs
+
+
+def provision_fleet(settings, specs, inventories_dir=INVENTORIES_DIR):
+    """Provision all clusters concurrently, sharing one client per Nutanix cluster.
+
+    :param dict settings: Fleet settings.
+    :param list specs: List of cluster specs.
+    :param str inventories_dir: Directory for per cluster inventories.
+    :return: List of per cluster results.
+    :rtype: list
+
+    """
+    api_budget = threading.BoundedSemaphore(settings['max_api_calls'])
+    clients = {}
+    # Clients are created (and credentials asked) before work starts in threads.
+    for spec in specs:
+        if spec['nutanix_cluster'] not in clients:
+            nutanix = create_nutanix(spec['nutanix_cluster'], api_budget)
+            # Validates stored session, so relogin doesn't prompt from a thread.
+            nutanix.api.cluster()
+            clients[spec['nutanix_cluster']] = nutanix
+
+    def provision(spec):
+        start = time.time()
+        result = {
+            'name': spec['name'],
+            'nutanix_cluster': spec['nutanix_cluster'],
+            'inventory': os.path.join(inventories_dir, spec['name'], INVENTORY_FILE)
+        }
+        try:
+            vms = provision_cluster(
+                clients[spec['nutanix_cluster']],
+                spec['name'],
+                spec['base_vm_name'],
+                spec['ssh_dir'],
+                k8s_config_path=spec['k8s_config'],
+                inventory_file=result['inventory']
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            logger.exception('Provisioning of %s failed', spec['name'])
+            result.update(status='failed', error=str(error), nodes=0)
+        else:
+            result.update(status='succeeded', nodes=len(vms))
+        result['duration'] = round(time.time() - start, 1)
+        return result
+
+    results = []
+    with ThreadPoolExecutor(max_workers=settings['max_parallel_clusters']) as executor:
+        for future in as_completed([executor.submit(provision, spec) for spec in specs]):
+            result = future.result()
+            logger.info(
+                'Cluster %s on %s %s after %s seconds',
+                result['name'], result['nutanix_cluster'], result['status'], result['duration']
+            )
+            results.append(result)
+
+    return sorted(results, key=lambda result: result['name'])
+
+
+def write_summary(results, inventories_dir=INVENTORIES_DIR):
+    """Write fleet summary report and log it as a table.
+
+    :param list results: List of per cluster results.
+    :param str inventories_dir: Directory for per cluster inventories.
+    :return: Path of summary file.
+    :rtype: str
+
+    """
+    if not os.path.isdir(inventories_dir):
+        os.makedirs(inventories_dir)
+
+    summary_path = os.path.join(inventories_dir, SUMMARY_FILE)
+    with open(summary_path, 'w') as summary_file:
+        json.dump(results, summary_file, indent=2)
+
+    lines = ['{:<30} {:<20} {:<10} {:>6} {:>10}'.format(
+        'CLUSTER', 'NUTANIX CLUSTER', 'STATUS', 'NODES', 'SECONDS'
+    )]
+    lines.extend(
+        '{name:<30} {nutanix_cluster:<20} {status:<10} {nodes:>6} {duration:>10}'.format(**result)
+        for result in results
+    )
+    logger.info('Fleet summary (%s):\n%s', summary_path, '\n'.join(lines))
+    return summary_path
+
+
+def main():
+    """Provision fleet of Kubernetes clusters described in fleet config.
+
+    :return: Exit code - number of failed clusters.
+    :rtype: int
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('config', nargs='?', default=FLEET_CONFIG, help='Fleet config file')
+    parser.add_argument(
+        '--inventories-dir', default=INVENTORIES_DIR, help='Directory for generated inventories'
+    )
+    parser.add_argument(
+        '--metrics', metavar='PROM_FILE', help='Write metrics of the run in Prometheus text format'
+    )
+    args = parser.parse_args()
+
+    settings, specs = get_fleet_config(os.path.abspath(args.config))
+    results = provision_fleet(settings, specs, args.inventories_dir)
+    write_summary(results, args.inventories_dir)
+    if args.metrics:
+        REGISTRY.write(args.metrics)
+    return len([result for result in results if result['status'] != 'succeeded'])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
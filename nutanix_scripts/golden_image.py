@@ -0,0 +1,398 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Golden base vm with container images pre-pulled.
+
+Base vm is booted once with cloud config which installs docker, pulls (or loads
+from tarball) images used by Kubespray and powers the vm off. Clones start with
+warm image cache, so Kubespray doesn't pull the images on every node.
+
+The vm powers itself off whether baking succeeded or not. Exit status of baking
+is written to STATUS_FILE and posted to the installer, which listens for it
+during baking, deletes vm which failed to bake and stops.
+
+State of baking is kept in vm description, existing base vm which is neither
+baked nor being baked (e.g. created without golden config) is created again.
+
+"""
+import atexit
+import BaseHTTPServer
+import json
+import socket
+import threading
+import urllib
+import urlparse
+
+import yaml
+
+from nutanix_scripts.exceptions import BakingFailed, ConfigurationError
+from nutanix_scripts.logger import logger
+from nutanix_scripts.watchers import PowerStateWatcher
+
+DEFAULT_TIMEOUT = 1800
+REPORT_PORT = 8740
+
+# Marker of baked vm, clones don't repeat baking.
+BAKED_MARKER = '/var/lib/k8s-golden-image-baked'
+# Exit status of baking.
+STATUS_FILE = '/var/lib/k8s-golden-image-status'
+# Exists only until reboot, so only baking boot powers the vm off.
+POWEROFF_MARKER = '/run/k8s-golden-image-poweroff'
+
+# Descriptions of base vm being baked and baked one.
+BAKING_DESCRIPTION = 'Golden base vm, baking'
+BAKED_DESCRIPTION = 'Golden base vm, baked'
+
+# Remove identity of baked vm: cloud-init state, machine-id and ssh host keys.
+# Older cloud-init (e.g. of CentOS 7 images) has no clean subcommand, its state is removed directly.
+GENERALIZE_COMMANDS = (
+    'cloud-init clean --logs || rm -rf /var/lib/cloud/* /var/log/cloud-init*.log',
+    'truncate -s 0 /etc/machine-id',
+    'rm -f /etc/ssh/ssh_host_*',
+)
+
+DOCKER_REPO = "\n".join((
+    "[dockerrepo]",
+    "name=Docker Repository",
+    "baseurl={repo_url}",
+    "enabled=1",
+    "gpgcheck=1",
+    "gpgkey={gpg_key_url}"
+))
+
+
+def get_golden_image_config(config_path):
+    """Read golden image configuration.
+
+    :param str config_path: Path to golden image config.
+    :return: Golden image configuration or None if baking is disabled.
+    :rtype: dict
+    :raises IOError: when file doesn't exist, or path is incorrect.
+    :raises ParseError: when file is not valid yml file.
+    :raises ConfigurationError: when configuration file is incorrect.
+
+    """
+    logger.info('Reading golden image configuration from %s', config_path)
+    with open(config_path) as conf_file:
+        data = yaml.safe_load(conf_file) or {}
+
+    if not data.get('enabled'):
+        return None
+
+    for field in ('docker_package', 'docker_repo_url', 'docker_gpg_key_url'):
+        if field not in data:
+            raise ConfigurationError(ConfigurationError.MISSING_FIELD.format(field))
+
+    if not data.get('images') and not data.get('tarball_url'):
+        raise ConfigurationError(ConfigurationError.MISSING_FIELD.format('images'))
+
+    try:
+        data['timeout'] = int(data.get('timeout', DEFAULT_TIMEOUT))
+    except ValueError as error:
+        raise ConfigurationError(ConfigurationError.INVALID_TYPE.format(error))
+
+    return data
+
+
+def _local_address(prism_address):
+    """Get address of this host in the network used to reach Prism, vms
+    are expected to reach the installer at it.
+
+    :param str prism_address: Address of Nutanix Prism e.g. 'https://prism:9440'.
+    :return: IP address.
+    :rtype: str
+
+    """
+    url = urlparse.urlparse(prism_address)
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # Connecting UDP socket sends nothing, it only chooses the route.
+        probe.connect((url.hostname, url.port or 9440))
+        return probe.getsockname()[0]
+    finally:
+        probe.close()
+
+
+class _ReportHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Handler of bake reports: POST /<vm name> with exit status as body."""
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Log reports to installer log instead of stderr."""
+        logger.debug('Bake report: ' + format, *args)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Record exit status of baking."""
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        try:
+            status = int(body.strip())
+        except ValueError:
+            self.send_response(400)
+        else:
+            self.server.statuses[urllib.unquote(self.path.strip('/'))] = status
+            self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class BakeReports(object):
+    """Listener of exit statuses posted by baking vms.
+
+    Single listener is shared by all clusters provisioned by the process,
+    see :meth:`shared`, so concurrent clusters don't compete for the port and
+    base vm baked for one cluster is seen by others waiting for it.
+    Port is bound only once some vm is baked, see :meth:`listen`.
+
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, prism_address, report_address=None):
+        """Get listener of the process, creating it on first use.
+        It is closed at process exit.
+
+        :param str prism_address: Address of Nutanix Prism, used to find address
+            of this host reachable by vms.
+        :param str report_address: Address (host:port) vms post reports to,
+            detected with default port if not given.
+        :return: Listener of bake reports.
+        :rtype: BakeReports
+
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(prism_address, report_address)
+                atexit.register(cls._shared.close)
+            return cls._shared
+
+    def __init__(self, prism_address, report_address=None):
+        """Prepare listener, without listening yet.
+
+        :param str prism_address: Address of Nutanix Prism, used to find address
+            of this host reachable by vms.
+        :param str report_address: Address (host:port) vms post reports to,
+            detected with default port if not given.
+
+        """
+        host, _, port = (report_address or '').partition(':')
+        self.port = int(port or REPORT_PORT)
+        self.host = host or _local_address(prism_address)
+        self.server = None
+        self.lock = threading.Lock()
+
+    def listen(self):
+        """Start listening in background thread unless already listening.
+        Only the address reported to vms is listened on.
+
+        :return: None
+        :raises ConfigurationError: If port can't be listened on.
+
+        """
+        with self.lock:
+            if self.server is not None:
+                return
+            try:
+                server = BaseHTTPServer.HTTPServer((self.host, self.port), _ReportHandler)
+            except socket.error as error:
+                raise ConfigurationError(
+                    ConfigurationError.BAKE_REPORT_PORT.format(self.port, error)
+                )
+            server.statuses = {}
+            thread = threading.Thread(target=server.serve_forever, name='bake-reports')
+            thread.daemon = True
+            thread.start()
+            self.server = server
+
+    def url(self, vm_name):
+        """Get url the vm posts its report to.
+
+        :param str vm_name: Name of baking vm.
+        :return: Report url.
+        :rtype: str
+
+        """
+        return 'http://{}:{}/{}'.format(self.host, self.port, urllib.quote(vm_name, safe=''))
+
+    def status(self, vm_name):
+        """Get exit status of baking reported by vm.
+
+        :param str vm_name: Name of baking vm.
+        :return: Exit status or None if vm did not report.
+        :rtype: int
+
+        """
+        if self.server is None:
+            return None
+        return self.server.statuses.get(vm_name)
+
+    def close(self):
+        """Stop listening if listener was started.
+
+        :return: None
+
+        """
+        with self.lock:
+            if self.server is None:
+                return
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def generate_golden_cloud_config(cloud_config, golden_config, report_url=None):
+    """Extend base vm cloud config with baking of container images.
+
+    :param str cloud_config: Cloud config of base vm.
+    :param dict golden_config: Golden image configuration.
+    :param str report_url: Url exit status of baking is posted to.
+    :return: Cloud config which pre-pulls images and powers vm off.
+    :rtype: str
+
+    """
+    commands = [
+        'yum install -y {}'.format(golden_config['docker_package']),
+    ]
+    if golden_config.get('registry_mirror'):
+        commands.append('mkdir -p /etc/docker && echo {} > /etc/docker/daemon.json'.format(
+            _quote(json.dumps({'registry-mirrors': [golden_config['registry_mirror']]}))
+        ))
+    commands.append('systemctl start docker')
+    if golden_config.get('tarball_url'):
+        commands.append('curl -sSfL {} | docker load'.format(_quote(golden_config['tarball_url'])))
+    commands.extend(
+        'docker pull {}'.format(_quote(image)) for image in golden_config.get('images') or []
+    )
+    commands.append('systemctl stop docker')
+    # Clones generate their own identity on first boot.
+    commands.extend(GENERALIZE_COMMANDS)
+    commands.append('touch {}'.format(BAKED_MARKER))
+    # Vm is powered off also when baking failed, failure is reported by exit status.
+    finish = ['echo $status > {}'.format(STATUS_FILE)]
+    if report_url:
+        finish.append('curl -sS -m 10 --retry 5 -d $status {} || true'.format(_quote(report_url)))
+    finish.append('touch {}'.format(POWEROFF_MARKER))
+    # Status is not tested by || as that would disable set -e inside the subshell.
+    script = 'if [ ! -f {} ]; then (set -e; {}); status=$?; {}; fi'.format(
+        BAKED_MARKER, '; '.join(commands), '; '.join(finish)
+    )
+
+    golden_part = yaml.safe_dump({
+        'write_files': [{
+            'path': '/etc/yum.repos.d/docker.repo',
+            'content': DOCKER_REPO.format(
+                repo_url=golden_config['docker_repo_url'],
+                gpg_key_url=golden_config['docker_gpg_key_url']
+            )
+        }],
+        'runcmd': [['bash', '-c', script]],
+        'power_state': {
+            'mode': 'poweroff',
+            'message': 'Baking of golden image finished',
+            'condition': 'test -f {}'.format(POWEROFF_MARKER)
+        }
+    }, default_flow_style=False)
+    return '\n'.join((cloud_config, golden_part))
+
+
+def is_baked(vm):
+    """Check whether vm is baked golden image.
+
+    :param Vm vm: Base vm.
+    :return: True if vm was baked successfully.
+    :rtype: bool
+
+    """
+    return vm.get('description') == BAKED_DESCRIPTION
+
+
+def is_reusable(vm):
+    """Check whether existing vm can be used as golden base vm: it is baked
+    or baking started by previous run is still running.
+
+    :param Vm vm: Base vm.
+    :return: True if vm can be used.
+    :rtype: bool
+
+    """
+    return is_baked(vm) or \
+        (vm.get('description') == BAKING_DESCRIPTION and vm['power_state'] != 'off')
+
+
+def bake_vm(nutanix, vm, timeout=DEFAULT_TIMEOUT, reports=None):
+    """Boot vm created with golden cloud config and wait until it powers
+    itself off after images are pulled.
+
+    :param Nutanix nutanix: Connected Nutanix wrapper.
+    :param dict vm: Detailed information about vm.
+    :param int timeout: Number of seconds baking may take.
+    :param BakeReports reports: Listener of bake reports.
+    :return: None
+    :raises ConfigurationError: If bake reports can't be listened for.
+    :raises TaskFailed: If turning on vm or marking it baked failed.
+    :raises WaitTimeout: If vm didn't power off in time.
+    :raises BakingFailed: If vm reported failure of baking.
+    :raises HTTPError: If API call was not successful.
+
+    """
+    logger.info('Baking golden image of vm %s', vm['name'])
+    if reports:
+        reports.listen()
+    nutanix.wait_for_task(nutanix.set_vm_power(vm['uuid'], 'on'))
+    wait_for_baking(nutanix, vm, timeout, reports)
+
+
+def wait_for_baking(nutanix, vm, timeout=DEFAULT_TIMEOUT, reports=None):
+    """Wait until vm powers itself off after baking and check its result.
+    Vm which failed to bake is deleted, so rerun creates it again, baked one
+    is marked by its description.
+
+    :param Nutanix nutanix: Connected Nutanix wrapper.
+    :param dict vm: Detailed information about vm.
+    :param int timeout: Number of seconds baking may take.
+    :param BakeReports reports: Listener of bake reports.
+    :return: None
+    :raises ConfigurationError: If bake reports can't be listened for.
+    :raises WaitTimeout: If vm didn't power off in time.
+    :raises BakingFailed: If vm reported failure of baking.
+    :raises TaskFailed: If marking vm baked failed.
+    :raises HTTPError: If API call was not successful.
+
+    """
+    if reports:
+        reports.listen()
+    for _ in PowerStateWatcher(nutanix, {vm['name']: vm['uuid']}, 'off', timeout):
+        pass
+
+    status = reports.status(vm['name']) if reports else None
+    if status is None:
+        logger.warning(
+            'Vm %s powered off without reporting result of baking, assuming it succeeded. '
+            'Result is recorded in %s on its disk', vm['name'], STATUS_FILE
+        )
+    elif status != 0:
+        logger.error('Baking golden image of vm %s failed, deleting the vm', vm['name'])
+        nutanix.delete_vm(vm['uuid'])
+        raise BakingFailed(BakingFailed.MESSAGE.format(vm['name'], status, STATUS_FILE))
+    nutanix.set_vm_description(vm['uuid'], BAKED_DESCRIPTION)
+    logger.info('Golden image of vm %s baked', vm['name'])
+
+
+def _quote(value):
+    """Quote value for shell.
+
+    :param str value: Value to be quoted.
+    :return: Single quoted value.
+    :rtype: str
+
+    """
+    return "'{}'".format(value.replace("'", "'\"'\"'"))
@@ -0,0 +1,252 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Content digests of OS images.
+
+Images imported by installer are annotated with sha256 digest of their content,
+so the same image is reused regardless of its name.
+Digest of image url is taken from local manifest or from checksum file published
+next to the image (e.g. sha256sum.txt of CentOS cloud images). Computing it by
+downloading the whole image has to be enabled explicitly.
+
+"""
+import fcntl
+import hashlib
+import json
+import os
+import posixpath
+import tempfile
+import threading
+
+import requests
+from requests.exceptions import RequestException
+
+from nutanix_scripts.logger import logger
+
+DIGEST_PREFIX = 'sha256:'
+CHECKSUM_FILES = ('sha256sum.txt', 'SHA256SUMS')
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Connect and read timeouts (seconds) of requests to image server.
+REQUEST_TIMEOUT = (10, 30)
+
+
+def image_annotation(digest):
+    """Get image annotation recording its content digest.
+
+    :param str digest: Hex sha256 digest of image content.
+    :return: Annotation of the image.
+    :rtype: str
+
+    """
+    return '{}{}'.format(DIGEST_PREFIX, digest)
+
+
+def annotated_digest(image):
+    """Get content digest recorded in image annotation.
+
+    :param Image image: Image.
+    :return: Hex sha256 digest or None if image is not annotated.
+    :rtype: str
+
+    """
+    annotation = image.annotation or ''
+    if annotation.startswith(DIGEST_PREFIX):
+        return annotation[len(DIGEST_PREFIX):].split()[0]
+    return None
+
+
+class DigestManifest(object):
+    """Local manifest of image urls' content digests.
+
+    Clusters provisioned by one process share manifest instance, see
+    :meth:`shared`. Writers from other processes are merged on save
+    under lock of the manifest file.
+
+    """
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, path):
+        """Get manifest of path shared by the whole process.
+
+        :param str path: Path of manifest file.
+        :return: Manifest.
+        :rtype: DigestManifest
+
+        """
+        with cls._shared_lock:
+            if path not in cls._shared:
+                cls._shared[path] = cls(path)
+            return cls._shared[path]
+
+    def __init__(self, path):
+        """Load manifest from file.
+
+        :param str path: Path of manifest file.
+
+        """
+        self.path = path
+        # Guards entries, network work is done under per url locks only.
+        self.lock = threading.Lock()
+        self.url_locks = {}
+        self.entries = self.__load()
+
+    def __load(self):
+        """Read entries from the file.
+
+        :return: Entries by url, empty if file is missing or corrupted.
+        :rtype: dict
+
+        """
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as manifest_file:
+                return json.load(manifest_file)
+        except ValueError:
+            logger.warning('Ignoring corrupted image manifest %s', self.path)
+            return {}
+
+    def recorded(self, url):
+        """Get digest recorded for url, without contacting the image server.
+
+        :param str url: Url of image.
+        :return: Hex sha256 digest or None if not recorded.
+        :rtype: str
+
+        """
+        with self.lock:
+            entry = self.entries.get(url)
+        return entry['digest'] if entry else None
+
+    def url_lock(self, url):
+        """Get lock guarding determination of url digest, so concurrent
+        callers don't download the same image.
+
+        :param str url: Url of image.
+        :return: Lock shared by all callers asking for the url.
+        :rtype: threading.Lock
+
+        """
+        with self.lock:
+            return self.url_locks.setdefault(url, threading.Lock())
+
+    def digest(self, url, compute=False):
+        """Get sha256 digest of content available under url.
+        Remote validators (ETag, Last-Modified) decide whether recorded
+        digest is still valid.
+
+        :param str url: Url of image.
+        :param bool compute: Compute digest by downloading image when no
+            checksum is published.
+        :return: Hex sha256 digest or None if it could not be determined.
+        :rtype: str
+
+        """
+        try:
+            response = requests.head(url, allow_redirects=True, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+        except RequestException as error:
+            logger.warning('Cannot check image %s: %s', url, error)
+            return self.recorded(url)
+
+        validators = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'size': response.headers.get('Content-Length')
+        }
+        with self.url_lock(url):
+            with self.lock:
+                entry = self.entries.get(url)
+            if entry and any(validators.values()) and entry['validators'] == validators:
+                return entry['digest']
+
+            digest = self.__published_digest(url)
+            if digest is None and compute:
+                digest = self.__computed_digest(url)
+            elif digest is None:
+                logger.info('No published sha256 of %s, image is matched by name only', url)
+            if digest:
+                with self.lock:
+                    self.entries[url] = {'digest': digest, 'validators': validators}
+                    self.__save()
+            return digest
+
+    @staticmethod
+    def __published_digest(url):
+        """Find digest of url in checksum file published in the same directory.
+
+        :param str url: Url of image.
+        :return: Hex sha256 digest or None if not published.
+        :rtype: str
+
+        """
+        directory, file_name = posixpath.split(url)
+        for checksum_file in CHECKSUM_FILES:
+            try:
+                response = requests.get(
+                    posixpath.join(directory, checksum_file), timeout=REQUEST_TIMEOUT
+                )
+            except RequestException:
+                continue
+            if response.status_code != 200:
+                continue
+            for line in response.text.splitlines():
+                parts = line.split()
+                if len(parts) == 2 and parts[1].lstrip('*') == file_name:
+                    logger.info('Found published sha256 of %s', file_name)
+                    return parts[0].lower()
+        return None
+
+    @staticmethod
+    def __computed_digest(url):
+        """Compute digest by downloading the content.
+
+        :param str url: Url of image.
+        :return: Hex sha256 digest or None if download failed.
+        :rtype: str
+
+        """
+        logger.info('Computing sha256 of %s, it may take a while', url)
+        sha256 = hashlib.sha256()
+        try:
+            response = requests.get(url, stream=True, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                sha256.update(chunk)
+        except RequestException as error:
+            logger.warning('Cannot download image %s: %s', url, error)
+            return None
+        return sha256.hexdigest()
+
+    def __save(self):
+        """Write manifest to the file atomically, merged with entries
+        written by other processes meanwhile.
+
+        :return: None
+
+        """
+        directory = os.path.dirname(self.path) or '.'
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        with open('{}.lock'.format(self.path), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            entries = self.__load()
+            entries.update(self.entries)
+            self.entries = entries
+            descriptor, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(descriptor, 'w') as manifest_file:
+                json.dump(self.entries, manifest_file, indent=2)
+            os.rename(tmp_path, self.path)
@@ -0,0 +1,125 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Checkpoint journal of cluster provisioning.
+
+Journal records results of completed phases and progress inside long phases
+(e.g. uuids of already cloned vms), so rerun of failed provisioning continues
+from the first incomplete step. Recorded values have to be JSON serializable
+or entities, which are recorded (and restored) in their dictionary form.
+
+"""
+import json
+import os
+import threading
+
+from nutanix_scripts.entities import to_json
+from nutanix_scripts.logger import logger
+
+
+class Journal(object):
+    """Per cluster record of completed phases, stored in file."""
+
+    def __init__(self, path):
+        """Load journal from file if it exists.
+
+        :param str path: Path of journal file.
+
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {'phases': {}, 'progress': {}}
+        if os.path.exists(path):
+            try:
+                with open(path) as journal_file:
+                    self.entries = json.load(journal_file)
+            except ValueError:
+                logger.warning('Ignoring corrupted journal %s', path)
+            else:
+                logger.info(
+                    'Resuming from journal %s, completed phases: %s',
+                    path, ', '.join(sorted(self.entries['phases'])) or 'none'
+                )
+
+    def is_completed(self, phase):
+        """Check whether phase was completed by previous run.
+
+        :param str phase: Name of phase.
+        :return: True if phase result is recorded.
+        :rtype: bool
+
+        """
+        with self.lock:
+            return phase in self.entries['phases']
+
+    def result(self, phase):
+        """Get recorded result of completed phase.
+
+        :param str phase: Name of phase.
+        :return: Result of phase.
+        :raises KeyError: If phase was not completed.
+
+        """
+        with self.lock:
+            return self.entries['phases'][phase]
+
+    def complete(self, phase, result):
+        """Record phase as completed.
+
+        :param str phase: Name of phase.
+        :param result: JSON serializable result of phase.
+        :return: None
+
+        """
+        with self.lock:
+            self.entries['phases'][phase] = result
+            self.__save()
+
+    def get(self, key, default=None):
+        """Get recorded progress of running phase.
+
+        :param str key: Name of progress entry.
+        :param default: Value returned if entry is not recorded.
+        :return: Recorded value.
+
+        """
+        with self.lock:
+            return self.entries['progress'].get(key, default)
+
+    def set(self, key, value):
+        """Record progress of running phase.
+
+        :param str key: Name of progress entry.
+        :param value: JSON serializable value.
+        :return: None
+
+        """
+        with self.lock:
+            self.entries['progress'][key] = value
+            self.__save()
+
+    def __save(self):
+        """Write journal to the file atomically.
+        Needs to be called with lock held.
+
+        :return: None
+
+        """
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'w') as journal_file:
+            json.dump(self.entries, journal_file, indent=2, default=to_json)
+        os.rename(tmp_path, self.path)
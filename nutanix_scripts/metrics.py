@@ -0,0 +1,302 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Metrics of installer runs in Prometheus text exposition format.
+
+Metrics are collected in memory during the run and written at its end to
+a file which can be picked up by node-exporter textfile collector, so Prism
+performance can be tracked across deployments.
+
+"""
+import os
+import threading
+
+from nutanix_scripts.logger import logger
+
+API_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TASK_DURATION_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+BOOT_TO_IP_BUCKETS = (5, 10, 20, 30, 60, 120, 300, 600, 900)
+
+
+def format_value(value):
+    """Format number as Prometheus sample value.
+
+    :param float value: Number.
+    :return: Formatted value.
+    :rtype: str
+
+    """
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(names, values):
+    """Format labels of sample.
+
+    :param tuple names: Names of labels.
+    :param tuple values: Values of labels.
+    :return: Labels in curly braces or empty string without labels.
+    :rtype: str
+
+    """
+    if not names:
+        return ''
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(
+            name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+        )
+        for name, value in zip(names, values)
+    ))
+
+
+class Metric(object):
+    """Base of metrics with values per labels combination."""
+    TYPE = None
+
+    def __init__(self, name, description, label_names=()):
+        """Prepare metric without samples.
+
+        :param str name: Name of metric.
+        :param str description: Help text of metric.
+        :param tuple label_names: Names of labels.
+
+        """
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def label_values(self, labels):
+        """Get values of labels in order of label names.
+
+        :param dict labels: Values of labels by name.
+        :return: Tuple of label values.
+        :rtype: tuple
+
+        """
+        return tuple(labels[name] for name in self.label_names)
+
+    def samples(self):
+        """Get samples of metric.
+
+        :return: List of (sample name suffix, label names, label values, value) tuples.
+        :rtype: list
+
+        """
+        with self.lock:
+            return [
+                ('', self.label_names, labels, value)
+                for labels, value in sorted(self.values.items())
+            ]
+
+    def render(self):
+        """Format metric in text exposition format.
+
+        :return: Lines of metric.
+        :rtype: list
+
+        """
+        lines = [
+            '# HELP {} {}'.format(self.name, self.description),
+            '# TYPE {} {}'.format(self.name, self.TYPE)
+        ]
+        lines.extend(
+            '{}{}{} {}'.format(self.name, suffix, format_labels(names, values), format_value(value))
+            for suffix, names, values, value in self.samples()
+        )
+        return lines
+
+
+class Counter(Metric):
+    """Monotonically growing count of events."""
+    TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Increase counter.
+
+        :param int amount: Number of events.
+        :param labels: Values of labels.
+        :return: None
+
+        """
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Value which can go up and down."""
+    TYPE = 'gauge'
+
+    def set(self, value, **labels):
+        """Set current value.
+
+        :param float value: Value.
+        :param labels: Values of labels.
+        :return: None
+
+        """
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets."""
+    TYPE = 'histogram'
+
+    def __init__(self, name, description, label_names=(), buckets=API_LATENCY_BUCKETS):
+        """Prepare histogram without observations.
+
+        :param str name: Name of metric.
+        :param str description: Help text of metric.
+        :param tuple label_names: Names of labels.
+        :param tuple buckets: Upper bounds of buckets in increasing order.
+
+        """
+        super(Histogram, self).__init__(name, description, label_names)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        """Record observed value.
+
+        :param float value: Observed value e.g. duration in seconds.
+        :param labels: Values of labels.
+        :return: None
+
+        """
+        key = self.label_values(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self.values[key] = (counts, total + value)
+
+    def samples(self):
+        """Get bucket, sum and count samples of histogram.
+
+        :return: List of (sample name suffix, label names, label values, value) tuples.
+        :rtype: list
+
+        """
+        names = self.label_names + ('le',)
+        result = []
+        with self.lock:
+            for labels, (counts, total) in sorted(self.values.items()):
+                result.extend(
+                    ('_bucket', names, labels + (format_value(bound),), count)
+                    for bound, count in zip(self.buckets, counts)
+                )
+                result.append(('_sum', self.label_names, labels, total))
+                result.append(('_count', self.label_names, labels, counts[-1]))
+        return result
+
+
+class Registry(object):
+    """Set of metrics written together."""
+
+    def __init__(self):
+        """Create empty registry."""
+        self.metrics = []
+
+    def register(self, metric):
+        """Add metric to registry.
+
+        :param Metric metric: Metric.
+        :return: Registered metric.
+        :rtype: Metric
+
+        """
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Format all metrics with samples in text exposition format.
+
+        :return: Content of metrics file.
+        :rtype: str
+
+        """
+        lines = []
+        for metric in self.metrics:
+            if metric.values:
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Write metrics file atomically, so collector never reads partial file.
+
+        :param str path: Path of metrics file, textfile collector reads *.prom files.
+        :return: None
+
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as metrics_file:
+            metrics_file.write(self.render())
+        os.rename(tmp_path, path)
+        logger.info('Metrics written to %s', path)
+
+
+REGISTRY = Registry()
+
+API_LATENCY = REGISTRY.register(Histogram(
+    'k8s_installer_api_request_duration_seconds',
+    'Latency of Prism API requests including throttling retries.',
+    ('method', 'endpoint', 'status'), API_LATENCY_BUCKETS
+))
+API_RETRIES = REGISTRY.register(Counter(
+    'k8s_installer_api_retries_total',
+    'Prism API requests sent again after throttling or expired session.',
+    ('reason',)
+))
+POLLS = REGISTRY.register(Counter(
+    'k8s_installer_polls_total',
+    'Prism API requests checking state of tasks and vms.',
+    ('target',)
+))
+UNCHANGED_RESPONSES = REGISTRY.register(Counter(
+    'k8s_installer_api_unchanged_responses_total',
+    'Conditional Prism API requests answered with unchanged entity, not decoded again.',
+    ('endpoint', 'validation')
+))
+TASK_DURATION = REGISTRY.register(Histogram(
+    'k8s_installer_task_duration_seconds',
+    'Duration of Prism tasks from creation to completion reported by Prism.',
+    ('operation_type', 'status'), TASK_DURATION_BUCKETS
+))
+BOOT_TO_IP = REGISTRY.register(Histogram(
+    'k8s_installer_vm_boot_to_ip_seconds',
+    'Time from requesting vm power on to vm reporting ip address.',
+    (), BOOT_TO_IP_BUCKETS
+))
+RUN_DURATION = REGISTRY.register(Gauge(
+    'k8s_installer_run_duration_seconds',
+    'Duration of last vms preparation of Kubernetes cluster.',
+    ('cluster',)
+))
+RUN_SUCCESS = REGISTRY.register(Gauge(
+    'k8s_installer_run_success',
+    'Whether last vms preparation of Kubernetes cluster succeeded.',
+    ('cluster',)
+))
+RUN_TIMESTAMP = REGISTRY.register(Gauge(
+    'k8s_installer_run_timestamp_seconds',
+    'Time of last vms preparation of Kubernetes cluster finish.',
+    ('cluster',)
+))
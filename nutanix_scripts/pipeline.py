@@ -0,0 +1,208 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Executor of phases forming dependency graph.
+
+Every phase is a function called with results of its dependencies as keyword
+arguments. Phases whose dependencies finished are run in parallel, so the
+whole pipeline takes as long as its critical path.
+With journal given, results of completed phases are recorded and phases
+completed by previous run are not run again.
+
+"""
+import time
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from nutanix_scripts.logger import logger
+from nutanix_scripts.profiling import cprofiler, tracer
+
+
+class Phase(object):
+    """Single step of pipeline."""
+
+    def __init__(self, name, function, depends, checkpoint=True):
+        """Describe phase.
+
+        :param str name: Name of phase, used as keyword argument of dependants.
+        :param callable function: Function called with dependencies results.
+        :param tuple depends: Names of phases which have to finish before.
+        :param bool checkpoint: Record result of phase in journal.
+
+        """
+        self.name = name
+        self.function = function
+        self.depends = tuple(depends)
+        self.checkpoint = checkpoint
+        self.started = None
+        self.finished = None
+
+    @property
+    def duration(self):
+        """Number of seconds phase was running or None if it didn't finish.
+
+        :rtype: float
+
+        """
+        if self.finished is None:
+            return None
+        return self.finished - self.started
+
+
+class Pipeline(object):
+    """Dependency graph of phases executed with maximal parallelism."""
+
+    def __init__(self, name, max_workers=4, journal=None):
+        """Create empty pipeline.
+
+        :param str name: Name of pipeline used in logs.
+        :param int max_workers: Maximal number of phases running at once.
+        :param Journal journal: Journal of completed phases.
+
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.journal = journal
+        self.phases = {}
+        self.order = []
+        self.results = {}
+
+    def add(self, name, function, depends=(), checkpoint=True):
+        """Add phase to the pipeline. Dependencies need to be added earlier,
+        which also guarantees there are no cycles.
+
+        :param str name: Name of phase.
+        :param callable function: Function called with dependencies results
+            as keyword arguments.
+        :param tuple depends: Names of phases which have to finish before.
+        :param bool checkpoint: Record result of phase in journal, phases which
+            are cheap or have to be repeated (e.g. writing files) can opt out.
+        :return: None
+        :raises ValueError: If phase already exists or dependency is unknown.
+
+        """
+        if name in self.phases:
+            raise ValueError('Phase {} already exists'.format(name))
+        unknown = [dependency for dependency in depends if dependency not in self.phases]
+        if unknown:
+            raise ValueError('Phase {} depends on unknown {}'.format(name, unknown))
+
+        self.phases[name] = Phase(name, function, depends, checkpoint)
+        self.order.append(name)
+
+    def run(self):
+        """Run all phases, each as soon as its dependencies finished.
+        On first failure no new phases are started and the error is raised
+        after running ones finish.
+
+        :return: Dictionary with phase name as key and its result as value.
+        :rtype: dict
+        :raises Exception: First exception raised by any phase.
+
+        """
+        pending = list(self.order)
+        running = {}
+        start = time.time()
+
+        if self.journal is not None:
+            for name in self.order:
+                if self.phases[name].checkpoint and self.journal.is_completed(name):
+                    logger.info('Phase %s of %s completed by previous run', name, self.name)
+                    self.results[name] = self.journal.result(name)
+                    pending.remove(name)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name in list(pending):
+                    phase = self.phases[name]
+                    if all(dependency in self.results for dependency in phase.depends):
+                        pending.remove(name)
+                        running[executor.submit(self.__run_phase, phase)] = phase
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    phase = running.pop(future)
+                    if future.exception() is not None:
+                        logger.error('Phase %s of %s failed', phase.name, self.name)
+                        wait(running)
+                    # Re-raises exception of failed phase with its traceback.
+                    self.results[phase.name] = future.result()
+
+        self.log_timings(time.time() - start)
+        return self.results
+
+    def __run_phase(self, phase):
+        """Call phase function with results of its dependencies.
+
+        :param Phase phase: Phase to be run.
+        :return: Result of phase function.
+
+        """
+        logger.info('Phase %s of %s started', phase.name, self.name)
+        phase.started = time.time()
+        with tracer.span(phase.name, 'phase', pipeline=self.name), cprofiler.profiled():
+            result = phase.function(**{
+                dependency: self.results[dependency] for dependency in phase.depends
+            })
+        phase.finished = time.time()
+        if self.journal is not None and phase.checkpoint:
+            self.journal.complete(phase.name, result)
+        logger.info(
+            'Phase %s of %s finished in %.1f seconds', phase.name, self.name, phase.duration
+        )
+        return result
+
+    def critical_path(self):
+        """Get chain of finished phases which determined pipeline duration.
+
+        :return: Names of phases from first to last.
+        :rtype: list
+
+        """
+        finished = [name for name in self.order if self.phases[name].finished is not None]
+        if not finished:
+            return []
+
+        path = [max(finished, key=lambda name: self.phases[name].finished)]
+        while True:
+            depends = [
+                name for name in self.phases[path[-1]].depends
+                if self.phases[name].finished is not None
+            ]
+            if not depends:
+                break
+            path.append(max(depends, key=lambda name: self.phases[name].finished))
+        return list(reversed(path))
+
+    def log_timings(self, total):
+        """Log duration of every phase and critical path of pipeline.
+
+        :param float total: Duration of whole pipeline.
+        :return: None
+
+        """
+        lines = [
+            '{:<25} {:>8.1f} {:>8.1f}'.format(
+                name,
+                self.phases[name].started - min(
+                    phase.started for phase in self.phases.values() if phase.started
+                ),
+                self.phases[name].duration
+            )
+            for name in self.order if self.phases[name].finished is not None
+        ]
+        logger.info(
+            'Pipeline %s finished in %.1f seconds\n%-25s %8s %8s\n%s\nCritical path: %s',
+            self.name, total, 'PHASE', 'START', 'SECONDS', '\n'.join(lines),
+            ' -> '.join(self.critical_path())
+        )
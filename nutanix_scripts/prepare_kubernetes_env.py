@@ -13,15 +13,35 @@
 # limitations under the License.
 """Run this script to prepare environment for kubernetes"""
 
+import argparse
 import re
 import os
+import sys
 import time
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.exceptions import HTTPError
 import yaml
 
 from nutanix_scripts.api import Nutanix
-from nutanix_scripts.exceptions import ConfigurationError, MissingKeys
+from nutanix_scripts.dynamic_inventory import write_snapshot
+from nutanix_scripts.exceptions import (
+    ConfigurationError, InvalidNumberOfItems, MissingKeys, TaskFailed
+)
+from nutanix_scripts.golden_image import (
+    BAKING_DESCRIPTION, BakeReports, bake_vm, generate_golden_cloud_config,
+    get_golden_image_config, is_baked, is_reusable, wait_for_baking
+)
+from nutanix_scripts.images import DigestManifest
+from nutanix_scripts.journal import Journal
 from nutanix_scripts.logger import logger
+from nutanix_scripts.metrics import (
+    BOOT_TO_IP, REGISTRY, RUN_DURATION, RUN_SUCCESS, RUN_TIMESTAMP
+)
+from nutanix_scripts.pipeline import Pipeline
+from nutanix_scripts.profiling import cprofiler, tracer
+from nutanix_scripts.session_store import SessionStore
+from nutanix_scripts.watchers import IpWatcher
 
 # URL for CentOS Image used for VM creation process.
 OS_IMAGE_URL = 'http://cloud.centos.org/centos/7/images/CentOS-7-x86_64-GenericCloud-1702.qcow2c'
@@ -45,9 +65,48 @@ INVENTORY_CONST = [
     'ansible_ssh_common_args="-o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no"'
 ]
 
+# Ansible settings generated next to inventory, forks are scaled to number of nodes.
+ANSIBLE_CONFIG_FILE = 'ansible.cfg'
+ANSIBLE_FACTS_DIR = 'facts'
+MIN_ANSIBLE_FORKS = 5
+MAX_ANSIBLE_FORKS = 100
+ANSIBLE_CONFIG_TEMPLATE = "\n".join((
+    "[defaults]",
+    "forks = {forks}",
+    "host_key_checking = False",
+    "gathering = smart",
+    "fact_caching = jsonfile",
+    "fact_caching_connection = {facts_dir}",
+    "# Cached facts never expire: scale.yml runs with --limit @scale_out_hosts and",
+    "# needs facts of hosts outside the limit, gathered by cluster.yml (--flush-cache).",
+    "fact_caching_timeout = 0",
+    "internal_poll_interval = 0.05",
+    "deprecation_warnings = False",
+    "",
+    "[ssh_connection]",
+    "pipelining = True",
+    "ssh_args = -o ControlMaster=auto -o ControlPersist=30m -o ConnectionAttempts=100 "
+    "-o UserKnownHostsFile=/dev/null",
+    "control_path = %(directory)s/%%h-%%r",
+    ""
+))
+
 # Names of config files for clusters and virtual environments for installer.
 K8S_CONFIG = 'configs/k8s_cluster.yml'
 NUTANIX_CONFIG = 'configs/nutanix_cluster.yml'
+# Container images pre-pulled on base vm, pinned to KUBESPRAY_COMMIT of install.sh.
+GOLDEN_IMAGE_CONFIG = 'configs/golden_image.yml'
+# Directory for data reused between installer runs.
+CACHE_DIR = '.cache'
+# Local manifest of OS images content digests.
+IMAGE_MANIFEST = os.path.join(CACHE_DIR, 'image_digests.json')
+# Per cluster checkpoint journals, removed by install.sh after successful installation.
+JOURNAL_FILE = os.path.join(CACHE_DIR, 'journals', '{}.json')
+# Journal entries with progress of cloning and booting vms.
+CLONED_VMS = 'cloned_vms'
+BOOTED_VMS = 'booted_vms'
+# Directory with stored Prism sessions, readable only by its owner.
+SESSION_DIR = '~/.k8s_installer/sessions'
 
 NUTANIX_CLUSTER_ENV = 'NUTANIX_CLUSTER'
 K8S_CLUSTER_ENV = 'K8S_CLUSTER'
@@ -90,7 +149,7 @@ def generate_cloud_config(ssh_keys_directory):
 
     """
     cloud_config_parts = []
-    for file_name in os.listdir(ssh_keys_directory):
+    for file_name in sorted(os.listdir(ssh_keys_directory)):
         pattern_match = SSH_KEY_FILE_PATTERN.match(file_name)
         if not pattern_match:
             continue
@@ -173,13 +232,37 @@ def get_kubernetes_config(config_path):
         return common_config, master_config, worker_config
 
 
+def create_nutanix(nutanix_cluster_name, api_budget=None, credentials=None):
+    """Connect to Nutanix cluster using installer configuration.
+
+    :param str nutanix_cluster_name: Name of Nutanix cluster from config file.
+    :param threading.Semaphore api_budget: Limit of API calls in flight shared
+        with other clients.
+    :param callable credentials: Function returning credentials, user is
+        asked for them by default.
+    :return: Connected Nutanix wrapper.
+    :rtype: Nutanix
+    :raises ConfigurationError: when cluster configuration was incorrect
+        or credentials were invalid.
+
+    """
+    return Nutanix(
+        os.path.abspath(NUTANIX_CONFIG),
+        nutanix_cluster_name,
+        cache_dir=os.path.abspath(CACHE_DIR),
+        session_store=SessionStore(os.path.expanduser(SESSION_DIR)),
+        api_budget=api_budget,
+        credentials=credentials
+    )
+
+
 def prepare_env():
     """This function implements main logic of preparation Virtual machines
     for Kubernetes installation:
 
     * Read configs from files.
     * Validates Nutanix environment.
-    * Prepare base Virtual Machine.
+    * Prepare base Virtual Machine (with container images baked in).
     * Clone base Virtual Machine.
     * Turn on Virtual Machines.
     * Read Virtual Machines IP's
@@ -187,93 +270,332 @@ def prepare_env():
 
     """
     logger.info('Reading environment variables')
-    k8s_cluster_name = os.environ[K8S_CLUSTER_ENV]
+    nutanix = create_nutanix(os.environ[NUTANIX_CLUSTER_ENV])
+    # Validates stored session, so relogin doesn't prompt from pipeline threads.
+    nutanix.api.cluster()
+    provision_cluster(
+        nutanix,
+        os.environ[K8S_CLUSTER_ENV],
+        os.environ[BASE_VM_ENV],
+        os.environ[SSH_DIR_ENV]
+    )
+
+
+def boot_vms(nutanix, vms_uuids, running=()):
+    """Turn on Virtual Machines and wait until all of them get ip address.
+
+    :param Nutanix nutanix: Connected Nutanix wrapper.
+    :param dict vms_uuids: Dictionary with vm name as key and vm uuid as value.
+    :param iterable running: Names of vms which are already turned on.
+    :return: Dictionary with vm name as key and list of its ips as value.
+    :rtype: dict
+    :raises TaskFailed: If turning on any of vms failed.
+    :raises WaitTimeout: If not all vms got address in time.
+    :raises HTTPError: If API call was not successful.
+
+    """
+    powered_off = [name for name in vms_uuids if name not in running]
+    start = time.time()
+    if powered_off:
+        logger.info('Turn on vms %s', ', '.join(sorted(powered_off)))
+        power_tasks = nutanix.set_vms_power([vms_uuids[name] for name in powered_off], 'on')
+        failed_tasks = [
+            task_info for task_info in power_tasks.values()
+            if not nutanix.is_task_succeeded(task_info)
+        ]
+        if failed_tasks:
+            raise TaskFailed(TaskFailed.MESSAGE.format(failed_tasks))
+
+    # Waiting for Virtual Machines to be fully running.
+    logger.info('Get vms ips')
+    vms_ips = {}
+    for vm_name, ips in IpWatcher(nutanix, vms_uuids):
+        if vm_name in powered_off:
+            BOOT_TO_IP.observe(time.time() - start)
+        vms_ips[vm_name] = ips
+    return vms_ips
+
+
+def provision_cluster(nutanix, k8s_cluster_name, base_vm_name, ssh_keys_directory,
+                      k8s_config_path=K8S_CONFIG, inventory_file=INVENTORY_FILE):
+    """Prepare Virtual Machines of single Kubernetes cluster and its inventory.
+    Progress is recorded in cluster journal, so rerun after failure continues
+    from the first incomplete phase.
+
+    :param Nutanix nutanix: Connected Nutanix wrapper.
+    :param str k8s_cluster_name: Name (domain) of Kubernetes cluster.
+    :param str base_vm_name: Name of base vm used for cloning.
+    :param str ssh_keys_directory: Directory with ssh keys of vms users.
+    :param str k8s_config_path: Path to Kubernetes cluster config.
+    :param str inventory_file: Path of generated ansible inventory.
+    :return: Dictionary with vm name as key and list of its ips as value.
+    :rtype: dict
+    :raises ConfigurationError: when configuration is incorrect.
+    :raises TaskFailed: If any of Nutanix tasks failed.
+    :raises HTTPError: If API call was not successful.
+
+    """
     if not DOMAIN_NAME.match(k8s_cluster_name):
         raise ConfigurationError(ConfigurationError.INVALID_DOMAIN)
 
-    nutanix_cluster_name = os.environ[NUTANIX_CLUSTER_ENV]
-
     (
         k8s_common_config,
         k8s_master_config,
-        k8s_worker_config) = get_kubernetes_config(os.path.abspath(K8S_CONFIG))
-
-    nutanix = Nutanix(
-        os.path.abspath(NUTANIX_CONFIG), nutanix_cluster_name
-    )
-
-    logger.info('Check if there are any %s cluster vms', k8s_cluster_name)
-    nutanix.get_vms(k8s_cluster_name, expected_count=0)
-    logger.info('There is no vm with %s in name. Proceeding', k8s_cluster_name)
+        k8s_worker_config) = get_kubernetes_config(os.path.abspath(k8s_config_path))
 
-    logger.info('Get network configuration')
     try:
         network_name = k8s_common_config['network_name']
     except KeyError:
         raise ConfigurationError(ConfigurationError.MISSING_FIELD.format('network_name'))
-    else:
-        network = nutanix.get_network(network_name)
 
-    logger.info('Get or create Centos cloud image')
     try:
         os_image_name = k8s_common_config['os_image_name']
         storage_container_name = k8s_common_config['storage_container_name']
     except KeyError:
         raise ConfigurationError(ConfigurationError.MISSING_FIELD.format('storage_container_name'))
-    else:
-        os_image = nutanix.get_or_create_os_image(
-            os_image_name, storage_container_name, OS_IMAGE_URL
+
+    try:
+        clone_chunk_size = int(k8s_common_config.get('clone_chunk_size') or 0) or None
+    except ValueError as error:
+        raise ConfigurationError(ConfigurationError.INVALID_TYPE.format(error))
+
+    os_image_url = k8s_common_config.get('os_image_url') or OS_IMAGE_URL
+    os_image_compute_digest = bool(k8s_common_config.get('os_image_compute_digest'))
+    os_image_manifest = DigestManifest.shared(os.path.abspath(IMAGE_MANIFEST))
+
+    golden_config = None
+    if os.path.exists(os.path.abspath(GOLDEN_IMAGE_CONFIG)):
+        golden_config = get_golden_image_config(os.path.abspath(GOLDEN_IMAGE_CONFIG))
+
+    # Baking vms report their result to listener shared by the whole process,
+    # it starts listening only when base vm is baked.
+    reports = None
+    if golden_config:
+        reports = BakeReports.shared(nutanix.api.api_address, golden_config.get('report_address'))
+
+    journal = Journal(os.path.abspath(JOURNAL_FILE.format(k8s_cluster_name)))
+
+    def check_existing_vms():
+        logger.info('Check if there are any %s cluster vms', k8s_cluster_name)
+        nutanix.get_vms(vm_domain=k8s_cluster_name, expected_count=0, include_ips=False)
+        logger.info('There is no vm of %s cluster. Proceeding', k8s_cluster_name)
+
+    def find_network():
+        logger.info('Get network configuration')
+        return nutanix.get_network(network_name)
+
+    def get_os_image():
+        logger.info('Get or create Centos cloud image')
+        # Existing image is found without contacting the image server.
+        image = nutanix.find_os_image(os_image_name, os_image_manifest.recorded(os_image_url))
+        if image:
+            return image
+        return nutanix.get_or_create_os_image(
+            os_image_name,
+            storage_container_name,
+            os_image_url,
+            os_image_manifest.digest(os_image_url, os_image_compute_digest)
         )
 
-    logger.info('Get or create base vm')
-    base_vm = nutanix.get_or_create_vm(
-        BASE_VM_CPU,
-        BASE_VM_RAM,
-        BASE_VM_DISK,
-        os.environ[BASE_VM_ENV],
-        network['uuid'],
-        os_image['vm_disk_id'],
-        generate_cloud_config(os.environ[SSH_DIR_ENV])
-    )
-    # TODO: prepopulate docker images
+    def render_cloud_config():
+        cloud_config = generate_cloud_config(ssh_keys_directory)
+        if golden_config:
+            cloud_config = generate_golden_cloud_config(
+                cloud_config, golden_config, reports.url(base_vm_name)
+            )
+        return cloud_config
+
+    def get_base_vm(network, os_image, cloud_config, check_existing_vms):  # pylint: disable=unused-argument
+        logger.info('Get or create base vm')
+        try:
+            return get_or_create_base_vm(network, os_image, cloud_config)
+        except (HTTPError, TaskFailed):
+            # Saved before other calls, which would replace it in Python 2.
+            exc_info = sys.exc_info()
+            # Network or image from metadata cache may no longer exist in Prism.
+            nutanix.invalidate_cache()
+            fresh_network, fresh_image = find_network(), get_os_image()
+            if fresh_network['uuid'] == network['uuid'] and \
+                    fresh_image['vm_disk_id'] == os_image['vm_disk_id']:
+                raise exc_info[0], exc_info[1], exc_info[2]
+        logger.warning('Cached network or image was rejected by Prism. Retrying with current ones')
+        return get_or_create_base_vm(fresh_network, fresh_image, cloud_config)
+
+    def get_or_create_base_vm(network, os_image, cloud_config):
+        if not golden_config:
+            return nutanix.get_or_create_vm(
+                BASE_VM_CPU,
+                BASE_VM_RAM,
+                BASE_VM_DISK,
+                base_vm_name,
+                network['uuid'],
+                os_image['vm_disk_id'],
+                cloud_config
+            )
 
-    logger.info('Clone vms')
-    nutanix.clone_vm(
-        vm_uuid=base_vm['uuid'],
-        configs=(k8s_master_config, k8s_worker_config),
-        vm_domain=k8s_cluster_name
-    )
+        base_vm = nutanix.get_or_create_vm(
+            BASE_VM_CPU,
+            BASE_VM_RAM,
+            BASE_VM_DISK,
+            base_vm_name,
+            network['uuid'],
+            os_image['vm_disk_id'],
+            cloud_config,
+            description=BAKING_DESCRIPTION,
+            on_create=lambda vm: bake_vm(nutanix, vm, golden_config['timeout'], reports),
+            reusable=is_reusable
+        )
+        if not is_baked(base_vm):
+            # Baking started by previous run, vm powers itself off when done.
+            wait_for_baking(nutanix, base_vm, golden_config['timeout'], reports)
+        return base_vm
+
+    def create_vms(base_vm):
+        logger.info('Clone vms')
+        return clone_and_boot_vms(
+            nutanix, base_vm, k8s_cluster_name,
+            (k8s_master_config, k8s_worker_config), clone_chunk_size, journal
+        )
 
-    expected_count = k8s_master_config['number_of_nodes'] + k8s_worker_config['number_of_nodes']
-    logger.info(
-        'Check if there all(%s) vms for %s cluster were created.',
-        expected_count,
-        k8s_cluster_name
+    def create_inventory(vms):
+        write_inventory(vms, inventory_file)
+        write_ansible_config(len(vms), inventory_file)
+        cloned_vms = journal.get(CLONED_VMS, {})
+        write_snapshot(k8s_cluster_name, {
+            name: {'uuid': cloned_vms.get(name), 'ips': ips} for name, ips in vms.items()
+        })
+
+    pipeline = Pipeline(k8s_cluster_name, journal=journal)
+    pipeline.add('check_existing_vms', check_existing_vms)
+    pipeline.add('network', find_network)
+    pipeline.add('os_image', get_os_image)
+    pipeline.add('cloud_config', render_cloud_config, checkpoint=False)
+    pipeline.add(
+        'base_vm', get_base_vm, ('network', 'os_image', 'cloud_config', 'check_existing_vms')
     )
-    nutanix.get_vms(k8s_cluster_name, expected_count=expected_count)
+    pipeline.add('vms', create_vms, ('base_vm',))
+    pipeline.add('inventory', create_inventory, ('vms',), checkpoint=False)
 
-    logger.info('Turn on vms')
-    for vm_uuid in nutanix.get_vms_property(k8s_cluster_name, 'uuid').values():
-        nutanix.set_vm_power(vm_uuid, 'on')
+    start = time.time()
+    succeeded = False
+    try:
+        vms = pipeline.run()['vms']
+        succeeded = True
+        return vms
+    finally:
+        RUN_DURATION.set(time.time() - start, cluster=k8s_cluster_name)
+        RUN_SUCCESS.set(int(succeeded), cluster=k8s_cluster_name)
+        RUN_TIMESTAMP.set(time.time(), cluster=k8s_cluster_name)
+
+
+def clone_and_boot_vms(nutanix, base_vm, k8s_cluster_name, configs, clone_chunk_size,
+                       journal=None, first_number=0):
+    """Clone base vm in chunks, turn on every chunk and wait for its ips.
+    With journal given, cloned and booted vms are recorded, so interrupted run
+    is continued with vms which are still missing or have no ip.
+
+    :param Nutanix nutanix: Connected Nutanix wrapper.
+    :param dict base_vm: Detailed information about base vm.
+    :param str k8s_cluster_name: Name (domain) of Kubernetes cluster.
+    :param tuple configs: Master and worker nodes configurations.
+    :param int clone_chunk_size: Number of vms cloned by single task.
+    :param Journal journal: Journal of cluster provisioning.
+    :param int first_number: Number of the first vm of every role.
+    :return: Dictionary with vm name as key and list of its ips as value.
+    :rtype: dict
+    :raises InvalidNumberOfItems: If not all vms were created.
+    :raises TaskFailed: If any of Nutanix tasks failed.
+    :raises HTTPError: If API call was not successful.
+
+    """
+    expected_count = sum(config['number_of_nodes'] for config in configs)
+    vms_uuids = {}
+    vms_with_ips = {}
+    chunks_ips = []
+    existing = {}
+    if journal is not None and journal.get(CLONED_VMS) is not None:
+        vms_with_ips.update(journal.get(BOOTED_VMS, {}))
+        expected_names = set(
+            Nutanix.vm_name(number, config['role'], k8s_cluster_name)
+            for config in configs
+            for number in range(first_number, first_number + config['number_of_nodes'])
+        )
+        # Vms cloned by interrupted run (also not recorded yet) are taken from Nutanix.
+        existing = {
+            vm['name']: vm for vm in nutanix.get_vms(
+                vm_domain=k8s_cluster_name, include_ips=False
+            )
+            if vm['name'] in expected_names
+        }
+        vms_uuids.update({name: vm['uuid'] for name, vm in existing.items()})
+        logger.info(
+            'Resuming %s cluster: %s vms already cloned, %s of them have ip',
+            k8s_cluster_name, len(existing), len(vms_with_ips)
+        )
+
+    # Every cloned batch is powered on and watched for ips while others are cloned.
+    # Batches of clone subtasks can be as small as single vm, so workers are bounded
+    # by calls allowed in flight rather than by number of vms.
+    workers = max(1, min(expected_count, nutanix.async_api.max_in_flight))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        not_booted = {
+            name: vm['uuid'] for name, vm in existing.items() if name not in vms_with_ips
+        }
+        if not_booted:
+            chunks_ips.append(executor.submit(
+                cprofiler.call, boot_vms, nutanix, not_booted,
+                [name for name in not_booted if existing[name]['power_state'] == 'on']
+            ))
+
+        if journal is not None:
+            # Recorded before clone tasks are submitted, so rerun looks for their vms.
+            journal.set(CLONED_VMS, vms_uuids)
+
+        # Vms are booted in batches of clone subtasks finished together.
+        for cloned_uuids in nutanix.iter_clone_vm(
+                vm_uuid=base_vm['uuid'],
+                configs=configs,
+                vm_domain=k8s_cluster_name,
+                chunk_size=clone_chunk_size,
+                existing_names=existing,
+                first_number=first_number
+        ):
+            vms_uuids.update(cloned_uuids)
+            if journal is not None:
+                journal.set(CLONED_VMS, vms_uuids)
+            chunks_ips.append(executor.submit(cprofiler.call, boot_vms, nutanix, cloned_uuids))
 
-    # Waiting for Virtual Machines to be fully running.
-    logger.info('Get vms ips')
-    vms_with_ips = nutanix.get_vms_property(k8s_cluster_name, 'ipAddresses')
-    while not all(vms_with_ips.values()):
         logger.info(
-            'Not all ips assigned. Waiting %s seconds before another check',
-            Nutanix.SLEEP_TIME
+            'Check if there all(%s) vms for %s cluster were created.',
+            expected_count,
+            k8s_cluster_name
         )
-        time.sleep(Nutanix.SLEEP_TIME)
-        vms_with_ips = nutanix.get_vms_property(k8s_cluster_name, 'ipAddresses')
+        if len(vms_uuids) != expected_count:
+            raise InvalidNumberOfItems(InvalidNumberOfItems.INVALID_COUNT.format(
+                len(vms_uuids), 'vms', k8s_cluster_name, expected_count
+            ))
+
+        for future in as_completed(chunks_ips):
+            vms_with_ips.update(future.result())
+            if journal is not None:
+                journal.set(BOOTED_VMS, vms_with_ips)
+
+    return vms_with_ips
+
+
+def write_inventory(vms_with_ips, inventory_file):
+    """Generate Kubespray inventory file.
 
+    :param dict vms_with_ips: Dictionary with vm name as key and list of its ips as value.
+    :param str inventory_file: Path of generated ansible inventory.
+    :return: None
+
+    """
     logger.info('Generate ansible inventory')
     inventory_lines = [
-        '{}    ansible_ssh_host={}'.format(
-            name, node_ips[0]
-        ) for name, node_ips in vms_with_ips.iteritems()
-        ]
-
+        '{}    ansible_ssh_host={}'.format(name, node_ips[0])
+        for name, node_ips in sorted(vms_with_ips.items())
+    ]
     inventory_lines.append('\n[kube-master]')
     inventory_lines.extend(
         [name for name in vms_with_ips if name.startswith('master')]
@@ -286,14 +608,116 @@ def prepare_env():
 
     inventory_lines.extend(INVENTORY_CONST)
 
-    with open(INVENTORY_FILE, 'w') as inventory:
+    inventory_directory = os.path.dirname(inventory_file)
+    if inventory_directory and not os.path.isdir(inventory_directory):
+        os.makedirs(inventory_directory)
+
+    with open(inventory_file, 'w') as inventory:
         inventory.write('\n'.join(inventory_lines))
 
-    with open(INVENTORY_FILE, 'r') as inventory:
+    with open(inventory_file, 'r') as inventory:
         logger.debug('Created inventory file:\n%s', inventory.read())
 
     logger.info('Inventory successfully generated. Moving to Kargo part.')
 
 
+def write_ansible_config(number_of_nodes, inventory_file):
+    """Generate Ansible configuration tuned for cluster size next to inventory.
+    Forks are scaled to number of nodes, ssh connections are multiplexed and
+    pipelined, facts are cached in the inventory directory.
+
+    :param int number_of_nodes: Number of cluster nodes.
+    :param str inventory_file: Path of ansible inventory.
+    :return: Path of generated configuration.
+    :rtype: str
+
+    """
+    inventory_directory = os.path.dirname(os.path.abspath(inventory_file))
+    config_path = os.path.join(inventory_directory, ANSIBLE_CONFIG_FILE)
+    forks = max(MIN_ANSIBLE_FORKS, min(number_of_nodes, MAX_ANSIBLE_FORKS))
+
+    with open(config_path, 'w') as config_file:
+        config_file.write(ANSIBLE_CONFIG_TEMPLATE.format(
+            forks=forks,
+            facts_dir=os.path.join(inventory_directory, ANSIBLE_FACTS_DIR)
+        ))
+
+    logger.info('Ansible configuration for %s nodes (%s forks) written to %s',
+                number_of_nodes, forks, config_path)
+    return config_path
+
+
+def append_to_inventory(vms_with_ips, inventory_file, group='kube-node'):
+    """Add new hosts to existing Kubespray inventory file.
+
+    :param dict vms_with_ips: Dictionary with vm name as key and list of its ips as value.
+    :param str inventory_file: Path of existing ansible inventory.
+    :param str group: Inventory group of new hosts.
+    :return: None
+    :raises ConfigurationError: If inventory has no such group.
+
+    """
+    logger.info('Add %s to ansible inventory %s', ', '.join(sorted(vms_with_ips)), inventory_file)
+    with open(inventory_file) as inventory:
+        inventory_lines = inventory.read().split('\n')
+
+    group_header = '[{}]'.format(group)
+    if group_header not in inventory_lines:
+        raise ConfigurationError(ConfigurationError.MISSING_SECTION.format(group))
+
+    # Group members end with blank line or next group header.
+    group_end = inventory_lines.index(group_header) + 1
+    while group_end < len(inventory_lines) and inventory_lines[group_end].strip() and \
+            not inventory_lines[group_end].startswith('['):
+        group_end += 1
+    inventory_lines[group_end:group_end] = sorted(vms_with_ips)
+
+    # Host lines are at the beginning, followed by blank line before first group.
+    hosts_end = 0
+    while inventory_lines[hosts_end].strip() and not inventory_lines[hosts_end].startswith('['):
+        hosts_end += 1
+    inventory_lines[hosts_end:hosts_end] = [
+        '{}    ansible_ssh_host={}'.format(name, node_ips[0])
+        for name, node_ips in sorted(vms_with_ips.items())
+    ]
+
+    with open(inventory_file, 'w') as inventory:
+        inventory.write('\n'.join(inventory_lines))
+
+    logger.debug('Updated inventory file:\n%s', '\n'.join(inventory_lines))
+
+
+def main():
+    """Prepare environment, optionally recording timeline of the run.
+
+    :return: None
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--profile', metavar='TRACE_FILE',
+                        help='Write timeline of phases, API calls and waits in Chrome trace format')
+    parser.add_argument('--cprofile', metavar='PSTATS_FILE',
+                        help='Write cProfile statistics of the run, merged from all threads '
+                             'running phases, vm boots and API calls')
+    parser.add_argument('--metrics', metavar='PROM_FILE',
+                        help='Write metrics of the run in Prometheus text format')
+    args = parser.parse_args()
+
+    if args.profile:
+        tracer.enable()
+    if args.cprofile:
+        cprofiler.enable()
+    try:
+        with cprofiler.profiled():
+            prepare_env()
+    finally:
+        if args.cprofile:
+            cprofiler.export(args.cprofile)
+        if args.profile:
+            tracer.export(args.profile)
+        if args.metrics:
+            REGISTRY.write(args.metrics)
+
+
 if __name__ == "__main__":
-    prepare_env()
+    main()
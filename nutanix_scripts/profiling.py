@@ -0,0 +1,257 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Timeline of installer run in Chrome trace format.
+
+Spans of pipeline phases, API calls, sleeps and Prism tasks are recorded by the module
+level `tracer` once it is enabled, and exported as JSON which can be opened
+in chrome://tracing or https://ui.perfetto.dev. Disabled tracer costs only
+a flag check.
+To use it just `from nutanix_scripts.profiling import tracer`.
+
+cProfile statistics of client CPU time are collected by the module level
+`cprofiler` in every thread running installer work and merged on export.
+
+"""
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import re
+import threading
+import time
+
+from nutanix_scripts.logger import logger
+
+# Process ids of timeline rows.
+CLIENT_PID = 1
+TASKS_PID = 2
+
+UUID_PATTERN = re.compile(
+    r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', re.IGNORECASE
+)
+
+
+def url_template(url):
+    """Get url without query string and with uuids replaced by placeholders,
+    so all calls of an endpoint share it.
+
+    :param str url: Called url.
+    :return: Url template e.g. 'v2.0/vms/{uuid}/clone'.
+    :rtype: str
+
+    """
+    return UUID_PATTERN.sub('{uuid}', url.partition('?')[0])
+
+
+class Tracer(object):
+    """Collector of timeline spans."""
+
+    def __init__(self):
+        """Create disabled tracer."""
+        self.enabled = False
+        self.events = []
+        self.threads = {}
+        self.lock = threading.Lock()
+
+    def enable(self):
+        """Start recording spans.
+
+        :return: None
+
+        """
+        self.enabled = True
+
+    def add(self, name, category, start, duration, **args):
+        """Record finished span of current thread.
+
+        :param str name: Name of span.
+        :param str category: Category of span e.g. 'phase', 'api', 'sleep'.
+        :param float start: Start time in seconds since epoch.
+        :param float duration: Duration in seconds.
+        :param args: Details of the span.
+        :return: None
+
+        """
+        if not self.enabled:
+            return
+        thread = threading.current_thread()
+        with self.lock:
+            self.threads[thread.ident] = thread.name
+            self.events.append({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': int(start * 10 ** 6),
+                'dur': int(duration * 10 ** 6),
+                'pid': CLIENT_PID,
+                'tid': thread.ident,
+                'args': args
+            })
+
+    def add_async(self, name, category, start, duration, span_id, **args):
+        """Record span not bound to client thread, e.g. Prism task.
+        Async spans may overlap each other on the same timeline row.
+
+        :param str name: Name of span.
+        :param str category: Category of span e.g. 'task'.
+        :param float start: Start time in seconds since epoch.
+        :param float duration: Duration in seconds.
+        :param str span_id: Unique id of the span.
+        :param args: Details of the span.
+        :return: None
+
+        """
+        if not self.enabled:
+            return
+        event = {'name': name, 'cat': category, 'pid': TASKS_PID, 'tid': 0, 'id': span_id}
+        with self.lock:
+            self.events.append(dict(event, ph='b', ts=int(start * 10 ** 6), args=args))
+            self.events.append(dict(event, ph='e', ts=int((start + duration) * 10 ** 6)))
+
+    @contextlib.contextmanager
+    def span(self, name, category, **args):
+        """Record span of the code executed in context.
+        Yielded dictionary may be updated with details known at the end.
+
+        :param str name: Name of span.
+        :param str category: Category of span.
+        :param args: Details of the span.
+        :return: Context manager yielding span details.
+
+        """
+        start = time.time()
+        try:
+            yield args
+        finally:
+            self.add(name, category, start, time.time() - start, **args)
+
+    def sleep(self, seconds, reason):
+        """Sleep, recording it as a span.
+
+        :param float seconds: Number of seconds.
+        :param str reason: What is waited for.
+        :return: None
+
+        """
+        with self.span('sleep', 'sleep', reason=reason, seconds=seconds):
+            time.sleep(seconds)
+
+    def export(self, path):
+        """Write recorded spans as Chrome trace.
+
+        :param str path: Path of trace file.
+        :return: None
+
+        """
+        with self.lock:
+            metadata = [
+                {'name': 'process_name', 'ph': 'M', 'pid': CLIENT_PID,
+                 'args': {'name': 'k8s installer'}},
+                {'name': 'process_name', 'ph': 'M', 'pid': TASKS_PID,
+                 'args': {'name': 'Prism tasks'}}
+            ]
+            metadata.extend(
+                {'name': 'thread_name', 'ph': 'M', 'pid': CLIENT_PID, 'tid': ident,
+                 'args': {'name': name}}
+                for ident, name in self.threads.items()
+            )
+            trace = {'traceEvents': metadata + self.events, 'displayTimeUnit': 'ms'}
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as trace_file:
+            json.dump(trace, trace_file)
+        logger.info('Timeline with %s events written to %s', len(self.events), path)
+
+
+class ThreadProfiler(object):
+    """Collector of cProfile statistics of many threads.
+    cProfile records only the thread it is enabled in, so work run by worker
+    threads (pipeline phases, executor tasks) is profiled by :meth:`profiled`,
+    accumulating in one profile per thread.
+
+    """
+
+    def __init__(self):
+        """Create disabled profiler."""
+        self.enabled = False
+        self.profiles = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def enable(self):
+        """Start profiling code run in :meth:`profiled` context.
+
+        :return: None
+
+        """
+        self.enabled = True
+
+    @contextlib.contextmanager
+    def profiled(self):
+        """Profile code executed in context by current thread.
+        Nested contexts of the thread are already profiled by the outer one.
+
+        :return: Context manager.
+
+        """
+        if not self.enabled or getattr(self.local, 'active', False):
+            yield
+            return
+
+        profile = getattr(self.local, 'profile', None)
+        if profile is None:
+            profile = self.local.profile = cProfile.Profile()
+            with self.lock:
+                self.profiles.append(profile)
+        self.local.active = True
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.local.active = False
+
+    def call(self, function, *args, **kwargs):
+        """Call function profiled, e.g. as task submitted to executor.
+
+        :param callable function: Function to be called.
+        :return: Result of the function.
+
+        """
+        with self.profiled():
+            return function(*args, **kwargs)
+
+    def export(self, path):
+        """Write statistics of all threads merged together.
+
+        :param str path: Path of pstats file.
+        :return: None
+
+        """
+        with self.lock:
+            profiles = list(self.profiles)
+        if not profiles:
+            return
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
+        logger.info('cProfile statistics of %s threads written to %s', len(profiles), path)
+
+
+tracer = Tracer()  # pylint: disable=invalid-name
+cprofiler = ThreadProfiler()  # pylint: disable=invalid-name
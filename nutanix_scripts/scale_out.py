@@ -0,0 +1,146 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Run this script to add worker vms to existing kubernetes cluster"""
+import argparse
+import os
+import re
+
+from nutanix_scripts.dynamic_inventory import load_snapshot, snapshot_path, write_snapshot
+from nutanix_scripts.exceptions import ConfigurationError
+from nutanix_scripts.logger import logger
+from nutanix_scripts.prepare_kubernetes_env import (
+    append_to_inventory, clone_and_boot_vms, create_nutanix, get_kubernetes_config,
+    write_ansible_config, INVENTORY_FILE, K8S_CONFIG
+)
+
+# File with names of added hosts, used as `ansible-playbook --limit @<file>`.
+LIMIT_FILE = 'scale_out_hosts'
+
+
+def next_vm_number(vm_names, role, vm_domain):
+    """Get number following the highest number of existing vms with given role.
+
+    :param iterable vm_names: Names of existing vms.
+    :param str role: Role of vms e.g. 'worker'.
+    :param str vm_domain: Name of vm domain.
+    :return: Number of the next vm.
+    :rtype: int
+
+    """
+    name_pattern = re.compile(r'^{}-(?P<number>\d+)-{}$'.format(
+        re.escape(role), re.escape(vm_domain)
+    ))
+    numbers = [
+        int(match.group('number'))
+        for match in (name_pattern.match(name) for name in vm_names) if match
+    ]
+    return max(numbers) + 1 if numbers else 0
+
+
+def scale_out(nutanix, k8s_cluster_name, base_vm_name, count,
+              k8s_config_path=K8S_CONFIG, inventory_file=INVENTORY_FILE):
+    """Clone new worker vms, turn them on and add them to the inventory.
+    Names of added hosts are written to LIMIT_FILE next to the inventory.
+    Inventory and snapshot are checked before any vm is cloned.
+
+    :param Nutanix nutanix: Connected Nutanix wrapper.
+    :param str k8s_cluster_name: Name (domain) of Kubernetes cluster.
+    :param str base_vm_name: Name of base vm used for cloning.
+    :param int count: Number of added worker vms.
+    :param str k8s_config_path: Path to Kubernetes cluster config.
+    :param str inventory_file: Path of existing ansible inventory.
+    :return: Dictionary with added vm name as key and list of its ips as value.
+    :rtype: dict
+    :raises ConfigurationError: when configuration is incorrect.
+    :raises TaskFailed: If any of Nutanix tasks failed.
+    :raises HTTPError: If API call was not successful.
+
+    """
+    if count < 1:
+        raise ConfigurationError(ConfigurationError.INVALID_SCALE_OUT)
+    if not os.path.isfile(inventory_file) or not os.access(inventory_file, os.W_OK):
+        raise ConfigurationError(ConfigurationError.MISSING_INVENTORY.format(inventory_file))
+    snapshot = load_snapshot(k8s_cluster_name)
+    if snapshot is not None and not os.access(snapshot_path(k8s_cluster_name), os.W_OK):
+        raise ConfigurationError(
+            ConfigurationError.UNWRITABLE_SNAPSHOT.format(snapshot_path(k8s_cluster_name))
+        )
+
+    k8s_common_config, _, k8s_worker_config = get_kubernetes_config(
+        os.path.abspath(k8s_config_path)
+    )
+    try:
+        clone_chunk_size = int(k8s_common_config.get('clone_chunk_size') or 0) or None
+    except ValueError as error:
+        raise ConfigurationError(ConfigurationError.INVALID_TYPE.format(error))
+
+    existing_names = nutanix.get_vms_property(None, 'uuid', vm_domain=k8s_cluster_name)
+    first_number = next_vm_number(existing_names, 'worker', k8s_cluster_name)
+    logger.info(
+        'Adding %s workers to %s cluster, starting with number %s',
+        count, k8s_cluster_name, first_number
+    )
+    base_vm = nutanix.get_vms(name=base_vm_name, expected_count=1, include_ips=False)[0]
+    worker_config = dict(k8s_worker_config, number_of_nodes=count)
+
+    vms_with_ips = clone_and_boot_vms(
+        nutanix, base_vm, k8s_cluster_name, (worker_config,), clone_chunk_size,
+        first_number=first_number
+    )
+    append_to_inventory(vms_with_ips, inventory_file)
+    write_ansible_config(len(existing_names) + len(vms_with_ips), inventory_file)
+    if snapshot is not None:
+        uuids = nutanix.get_vms_property(None, 'uuid', vm_domain=k8s_cluster_name)
+        snapshot['vms'].update(
+            (name, {'uuid': uuids.get(name), 'ips': ips}) for name, ips in vms_with_ips.items()
+        )
+        write_snapshot(k8s_cluster_name, snapshot['vms'])
+
+    limit_file = os.path.join(os.path.dirname(inventory_file), LIMIT_FILE)
+    with open(limit_file, 'w') as limit:
+        limit.write('\n'.join(sorted(vms_with_ips)))
+    logger.info('Names of added hosts written to %s', limit_file)
+    return vms_with_ips
+
+
+def main():
+    """Add worker vms to Kubernetes cluster created by the installer.
+
+    :return: None
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('count', type=int, help='Number of added worker vms')
+    parser.add_argument('--nutanix-cluster', required=True, help='Nutanix cluster name')
+    parser.add_argument('--kubernetes-cluster', required=True, help='Kubernetes cluster domain')
+    parser.add_argument('--base-vm-name', required=True, help='Name of base vm')
+    parser.add_argument('--k8s-config', default=K8S_CONFIG, help='Kubernetes cluster config')
+    parser.add_argument('--inventory', default=INVENTORY_FILE, help='Existing ansible inventory')
+    args = parser.parse_args()
+
+    nutanix = create_nutanix(args.nutanix_cluster)
+    # Validates stored session, so relogin doesn't prompt from boot threads.
+    nutanix.api.cluster()
+    scale_out(
+        nutanix,
+        args.kubernetes_cluster,
+        args.base_vm_name,
+        args.count,
+        k8s_config_path=args.k8s_config,
+        inventory_file=args.inventory
+    )
+
+
+if __name__ == "__main__":
+    main()
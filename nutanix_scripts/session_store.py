@@ -0,0 +1,99 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Persistent store of Prism session cookies"""
+import hashlib
+import json
+import os
+
+from nutanix_scripts.logger import logger
+
+
+class SessionStore(object):
+    """Store session cookies of Prism clusters in files readable only by owner.
+    Stored session lets following installer runs skip logging in.
+
+    """
+    DIRECTORY_MODE = 0o700
+    FILE_MODE = 0o600
+
+    def __init__(self, directory):
+        """Prepare store.
+
+        :param str directory: Directory where sessions are stored.
+
+        """
+        self.directory = directory
+
+    def __path(self, api_address):
+        """Get path of file with session for given Prism.
+
+        :param str api_address: Address of Nutanix Prism.
+        :return: Path of session file.
+        :rtype: str
+
+        """
+        name = hashlib.sha1(api_address.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, '{}.json'.format(name))
+
+    def load(self, api_address):
+        """Load session cookies for given Prism.
+
+        :param str api_address: Address of Nutanix Prism.
+        :return: Dictionary with cookies or None if there is no stored session.
+        :rtype: dict
+
+        """
+        path = self.__path(api_address)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path) as session_file:
+                return json.load(session_file)
+        except (IOError, ValueError) as error:
+            logger.warning('Ignoring stored session %s: %s', path, error)
+            return None
+
+    def save(self, api_address, cookies):
+        """Save session cookies for given Prism.
+
+        :param str api_address: Address of Nutanix Prism.
+        :param dict cookies: Session cookies.
+        :return: None
+
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, self.DIRECTORY_MODE)
+
+        path = self.__path(api_address)
+        tmp_path = '{}.tmp'.format(path)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        descriptor = os.open(
+            tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, self.FILE_MODE
+        )
+        with os.fdopen(descriptor, 'w') as session_file:
+            json.dump(cookies, session_file)
+        os.rename(tmp_path, path)
+
+    def clear(self, api_address):
+        """Remove stored session of given Prism.
+
+        :param str api_address: Address of Nutanix Prism.
+        :return: None
+
+        """
+        path = self.__path(api_address)
+        if os.path.exists(path):
+            os.remove(path)
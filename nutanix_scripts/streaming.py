@@ -0,0 +1,147 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Incremental parsing of JSON responses.
+
+Nutanix API returns listings as object with 'entities' array. Reader in this
+module yields array items one by one while response body is still downloaded,
+so only single entity (and not yet parsed chunk) is kept in memory.
+
+"""
+import codecs
+import json
+
+WHITESPACE = u' \t\n\r'
+
+
+class JsonStreamReader(object):
+    """Incremental reader of JSON document delivered in chunks."""
+
+    def __init__(self, chunks):
+        """Prepare reader.
+
+        :param iterable chunks: Iterable of bytes forming JSON document.
+
+        """
+        self.chunks = iter(chunks)
+        self.text = codecs.getincrementaldecoder('utf-8')()
+        self.decoder = json.JSONDecoder()
+        self.buffer = u''
+        self.position = 0
+
+    def iter_array(self, key):
+        """Yield items of array stored under key of top level object.
+        Values of other keys are parsed and dropped.
+
+        :param str key: Key of top level object with array value.
+        :return: Generator of array items.
+        :rtype: generator
+        :raises ValueError: If document is not valid JSON object.
+
+        """
+        self.__expect(u'{')
+        if self.__peek() == u'}':
+            return
+
+        while True:
+            name = self.__value()
+            self.__expect(u':')
+            if name == key:
+                self.__expect(u'[')
+                if self.__peek() == u']':
+                    self.position += 1
+                else:
+                    while True:
+                        yield self.__value()
+                        if self.__expect(u',]') == u']':
+                            break
+            else:
+                self.__value()
+
+            if self.__expect(u',}') == u'}':
+                return
+
+    def __fill(self):
+        """Read next chunk into buffer, dropping already parsed part.
+
+        :return: False if there is no more data.
+        :rtype: bool
+
+        """
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            return False
+        self.buffer = self.buffer[self.position:] + self.text.decode(chunk)
+        self.position = 0
+        return True
+
+    def __peek(self):
+        """Skip whitespaces and return next character.
+
+        :return: Next non whitespace character.
+        :rtype: unicode
+        :raises ValueError: If document ended.
+
+        """
+        while True:
+            while self.position < len(self.buffer) and \
+                    self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.__fill():
+                raise ValueError('Unexpected end of JSON document')
+
+    def __expect(self, characters):
+        """Consume next character which has to be one of specified.
+
+        :param unicode characters: Allowed characters.
+        :return: Consumed character.
+        :rtype: unicode
+        :raises ValueError: If other character was found.
+
+        """
+        character = self.__peek()
+        if character not in characters:
+            raise ValueError('Expected one of "{}" but found "{}"'.format(
+                characters, character
+            ))
+        self.position += 1
+        return character
+
+    def __value(self):
+        """Decode next JSON value, reading more chunks when it is incomplete.
+        Value is accepted only when followed by another character, so numbers
+        split between chunks are not cut.
+
+        :return: Decoded value.
+        :raises ValueError: If value is invalid or document ended.
+
+        """
+        self.__peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except ValueError:
+                value, end = None, None
+
+            if end is not None and end < len(self.buffer):
+                self.position = end
+                return value
+
+            if not self.__fill():
+                if end is None:
+                    raise ValueError('Unexpected end of JSON document')
+                self.position = end
+                return value
@@ -0,0 +1,217 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Client side rate limiting and concurrency control of Nutanix API calls"""
+from email.utils import mktime_tz, parsedate_tz
+import httplib
+import threading
+import time
+
+from nutanix_scripts.logger import logger
+from nutanix_scripts.metrics import API_RETRIES
+from nutanix_scripts.profiling import tracer
+
+
+class TokenBucket(object):
+    """Token bucket limiting average rate of requests while allowing bursts."""
+
+    def __init__(self, rate, burst):
+        """Prepare full bucket.
+
+        :param float rate: Number of tokens added per second.
+        :param int burst: Maximal number of tokens in bucket.
+
+        """
+        self.rate = float(rate)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take single token, waiting until it is available.
+
+        :return: None
+
+        """
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            tracer.sleep(wait_time, 'rate limit')
+
+
+class AimdLimiter(object):
+    """Limit of concurrent requests with additive increase and multiplicative
+    decrease. Limit grows by `increase` per window of successful requests and
+    is multiplied by `decrease` when request is throttled.
+
+    """
+
+    def __init__(self, initial, minimum, maximum, increase=1.0, decrease=0.5):
+        """Prepare limiter.
+
+        :param int initial: Initial number of concurrent requests.
+        :param int minimum: Lowest allowed limit.
+        :param int maximum: Highest allowed limit.
+        :param float increase: Growth of limit per window of successful requests.
+        :param float decrease: Multiplier of limit applied on throttling.
+
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """Wait for free slot below current limit and take it.
+
+        :return: None
+
+        """
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        """Return slot and adjust limit.
+
+        :param bool throttled: Whether request was rejected due to throttling.
+        :return: None
+
+        """
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                logger.debug('Concurrency limit decreased to %s', int(self.limit))
+            else:
+                self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            self.condition.notify_all()
+
+
+class Throttle(object):
+    """Rate and concurrency control for sending requests.
+    Requests rejected with 429 or 503 are retried after time from
+    Retry-After header or exponential backoff.
+
+    """
+    # httplib of python 2.7 has no constant for 429 Too Many Requests
+    TOO_MANY_REQUESTS = 429
+    THROTTLING_STATUSES = (TOO_MANY_REQUESTS, httplib.SERVICE_UNAVAILABLE)
+
+    def __init__(self, requests_per_second=None, burst=None, initial_concurrency=4,
+                 min_concurrency=1, max_concurrency=16, max_retries=5,
+                 backoff=1.0, max_backoff=60, budget=None):
+        """Prepare rate and concurrency limiters.
+
+        :param float requests_per_second: Average rate of requests,
+            not limited if not given.
+        :param int burst: Number of requests which can be sent at once,
+            by default equal to rate.
+        :param int initial_concurrency: Initial number of concurrent requests.
+        :param int min_concurrency: Lowest limit of concurrent requests.
+        :param int max_concurrency: Highest limit of concurrent requests.
+        :param int max_retries: Number of retries of throttled request.
+        :param float backoff: Initial delay (seconds) between retries.
+        :param float max_backoff: Maximal delay (seconds) between retries.
+        :param threading.Semaphore budget: Limit of requests in flight shared
+            with other clients (e.g. of different Nutanix clusters).
+
+        """
+        self.bucket = None
+        if requests_per_second:
+            self.bucket = TokenBucket(
+                requests_per_second, burst or max(1, int(requests_per_second))
+            )
+        self.limiter = AimdLimiter(initial_concurrency, min_concurrency, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = budget
+
+    def call(self, send, long_poll=False):
+        """Send request respecting limits, retrying it when throttled.
+        Long polls mostly idle on Prism side, so they are rate limited but
+        don't take concurrency slots or budget from other requests.
+
+        :param callable send: Function sending request and returning response.
+        :param bool long_poll: Whether request is held by Prism until timeout.
+        :return: Response of last attempt.
+        :rtype: requests.Response
+
+        """
+        limited = not long_poll
+        for attempt in range(self.max_retries + 1):
+            if self.bucket:
+                self.bucket.acquire()
+            if limited:
+                self.limiter.acquire()
+                if self.budget:
+                    self.budget.acquire()
+            try:
+                response = send()
+            except Exception:
+                if limited:
+                    self.limiter.release()
+                raise
+            finally:
+                if limited and self.budget:
+                    self.budget.release()
+
+            throttled = response.status_code in self.THROTTLING_STATUSES
+            if limited:
+                self.limiter.release(throttled)
+            if not throttled or attempt == self.max_retries:
+                return response
+
+            delay = self.retry_after(response)
+            if delay is None:
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+            logger.warning(
+                'Nutanix API throttled request with %s. Retrying in %s seconds',
+                response.status_code, delay
+            )
+            response.close()
+            API_RETRIES.inc(reason=str(response.status_code))
+            tracer.sleep(delay, 'throttled retry')
+
+    @staticmethod
+    def retry_after(response):
+        """Get delay requested by server in Retry-After header.
+
+        :param requests.Response response: Throttled response.
+        :return: Number of seconds or None if header is missing or invalid.
+        :rtype: float
+
+        """
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            date = parsedate_tz(value)
+            if date is None:
+                return None
+            return max(0.0, mktime_tz(date) - time.time())
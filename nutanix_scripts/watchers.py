@@ -0,0 +1,177 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Module containing watchers of Virtual Machines state"""
+import time
+
+from concurrent.futures import as_completed
+
+from nutanix_scripts.changes import ChangeDetector
+from nutanix_scripts.exceptions import WaitTimeout
+from nutanix_scripts.logger import logger
+from nutanix_scripts.metrics import POLLS
+from nutanix_scripts.profiling import tracer
+
+
+class IpWatcher(object):
+    """Wait for Virtual Machines to get IP addresses.
+
+    Only vms which still have no address are queried again, with growing
+    intervals between checks. Iterating over watcher yields (vm name, ips)
+    pairs as soon as addresses appear. Vms are queried conditionally and
+    only changed ones are checked, changes can be followed by subscribing
+    to `changes` detector.
+
+    """
+    TIMEOUT = 900
+    MIN_INTERVAL = 1
+    MAX_INTERVAL = 10
+    BACKOFF = 1.5
+
+    def __init__(self, nutanix, vms, timeout=TIMEOUT):
+        """Prepare watcher state.
+
+        :param Nutanix nutanix: Connected Nutanix wrapper.
+        :param dict vms: Dictionary with vm name as key and vm uuid as value.
+        :param int timeout: Number of seconds after which waiting is stopped.
+
+        """
+        self.nutanix = nutanix
+        self.pending = dict(vms)
+        self.timeout = timeout
+        self.addresses = {}
+        self.changes = ChangeDetector(('ipAddresses',))
+
+    def __iter__(self):
+        """Query vms still missing addresses until all of them have one.
+
+        :return: Generator of (vm name, list of ips) tuples.
+        :rtype: generator
+        :raises WaitTimeout: If not all vms got address before timeout.
+        :raises HTTPError: If API call was not successful.
+
+        """
+        deadline = time.time() + self.timeout
+        interval = self.MIN_INTERVAL
+
+        while self.pending:
+            queries = {
+                self.nutanix.async_api.vm(vm_uuid, conditional=True): vm_name
+                for vm_name, vm_uuid in self.pending.items()
+            }
+            POLLS.inc(len(queries), target='ips')
+            found = False
+            for future in as_completed(queries):
+                vm_name = queries[future]
+                vm = future.result()
+                if not self.changes.update(vm_name, vm):
+                    continue
+                ips = vm.get('ipAddresses')
+                if not ips:
+                    continue
+                found = True
+                del self.pending[vm_name]
+                self.addresses[vm_name] = ips
+                logger.info('Vm %s got ip address %s', vm_name, ips[0])
+                yield vm_name, ips
+
+            if not self.pending:
+                break
+
+            interval = self.MIN_INTERVAL if found else min(
+                interval * self.BACKOFF, self.MAX_INTERVAL
+            )
+            if time.time() + interval > deadline:
+                raise WaitTimeout(WaitTimeout.MESSAGE.format(
+                    self.timeout, 'ips of vms {}'.format(sorted(self.pending))
+                ))
+
+            logger.info(
+                '%s vms without ip assigned. Waiting %s seconds before another check',
+                len(self.pending), interval
+            )
+            tracer.sleep(interval, 'ips')
+
+
+class PowerStateWatcher(object):
+    """Wait for Virtual Machines to reach given power state, e.g. to be
+    turned off by guest OS.
+
+    Iterating over watcher yields names of vms as soon as they reach the state.
+    Vms are queried conditionally and only changed ones are checked, changes
+    can be followed by subscribing to `changes` detector.
+
+    """
+    TIMEOUT = 1800
+    MIN_INTERVAL = 5
+    MAX_INTERVAL = 30
+    BACKOFF = 1.5
+
+    def __init__(self, nutanix, vms, state, timeout=TIMEOUT):
+        """Prepare watcher state.
+
+        :param Nutanix nutanix: Connected Nutanix wrapper.
+        :param dict vms: Dictionary with vm name as key and vm uuid as value.
+        :param str state: Expected power state e.g. 'off'.
+        :param int timeout: Number of seconds after which waiting is stopped.
+
+        """
+        self.nutanix = nutanix
+        self.pending = dict(vms)
+        self.state = state
+        self.timeout = timeout
+        self.changes = ChangeDetector(('powerState',))
+
+    def __iter__(self):
+        """Query vms not yet in expected state until all of them reach it.
+
+        :return: Generator of vm names.
+        :rtype: generator
+        :raises WaitTimeout: If not all vms reached the state before timeout.
+        :raises HTTPError: If API call was not successful.
+
+        """
+        deadline = time.time() + self.timeout
+        interval = self.MIN_INTERVAL
+
+        while self.pending:
+            queries = {
+                self.nutanix.async_api.vm(vm_uuid, conditional=True): vm_name
+                for vm_name, vm_uuid in self.pending.items()
+            }
+            POLLS.inc(len(queries), target='power_state')
+            for future in as_completed(queries):
+                vm_name = queries[future]
+                vm = future.result()
+                if not self.changes.update(vm_name, vm) or vm.get('powerState') != self.state:
+                    continue
+                del self.pending[vm_name]
+                logger.info('Vm %s is %s', vm_name, self.state)
+                yield vm_name
+
+            if not self.pending:
+                break
+
+            interval = min(interval * self.BACKOFF, self.MAX_INTERVAL)
+            if time.time() + interval > deadline:
+                raise WaitTimeout(WaitTimeout.MESSAGE.format(
+                    self.timeout, 'power state {} of vms {}'.format(
+                        self.state, sorted(self.pending)
+                    )
+                ))
+
+            logger.info(
+                '%s vms not %s yet. Waiting %s seconds before another check',
+                len(self.pending), self.state, interval
+            )
+            tracer.sleep(interval, 'power state {}'.format(self.state))